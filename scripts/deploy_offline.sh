@@ -363,6 +363,7 @@ Type=simple
 User=proxy-relay
 Group=proxy-relay
 ExecStart=/usr/local/bin/sing-box run -c /etc/sing-box/config.json
+ExecReload=/bin/kill -HUP \$MAINPID
 Restart=on-failure
 RestartSec=5s
 NoNewPrivileges=true
@@ -389,6 +390,7 @@ setup_sudo_permissions() {
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl start sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl stop sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl restart sing-box
+proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl reload sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl status sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl is-active sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl is-enabled sing-box
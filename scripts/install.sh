@@ -526,6 +526,7 @@ setup_sudo_permissions() {
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl start sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl stop sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl restart sing-box
+proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl reload sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl status sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl is-active sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl is-enabled sing-box
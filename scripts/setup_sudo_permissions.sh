@@ -15,6 +15,7 @@ cat > "$SUDOERS_FILE" << 'EOF'
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl start sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl stop sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl restart sing-box
+proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl reload sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl status sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl is-active sing-box
 proxy-relay ALL=(ALL) NOPASSWD: /bin/systemctl is-enabled sing-box
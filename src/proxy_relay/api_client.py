@@ -32,8 +32,16 @@ class APIClient:
             raise TypeError("provider_config must be an APIProviderConfig instance")
         
         self.provider_config = provider_config
+        # 复用同一个会话的连接（HTTP keep-alive），重复请求时不再重新建立 TCP/TLS 连接
+        self._session = requests.Session()
         logger.info(f"Initialized API client for provider: {provider_config.name}")
     
+    def close(self) -> None:
+        """
+        关闭客户端持有的 HTTP 连接
+        """
+        self._session.close()
+    
     def get_new_proxy(self) -> UpstreamProxy:
         """
         从API获取新的代理
@@ -130,14 +138,14 @@ class APIClient:
                 
                 # 发送请求
                 if self.provider_config.method == "GET":
-                    response = requests.get(
+                    response = self._session.get(
                         self.provider_config.endpoint,
                         params=self.provider_config.params,
                         headers=self.provider_config.headers,
                         timeout=self.provider_config.timeout
                     )
                 elif self.provider_config.method == "POST":
-                    response = requests.post(
+                    response = self._session.post(
                         self.provider_config.endpoint,
                         json=self.provider_config.body,
                         headers=self.provider_config.headers,
@@ -257,7 +265,7 @@ class APIClient:
             if not uuid:
                 raise APIError("UUID is required for VLESS protocol")
             
-            return UpstreamProxy(
+            return UpstreamProxy.intern(
                 server=server,
                 port=int(port),
                 protocol="vless",
@@ -273,7 +281,7 @@ class APIClient:
                 grpc_service_name=proxy_data.get("grpc_service_name")
             )
         else:
-            return UpstreamProxy(
+            return UpstreamProxy.intern(
                 server=server,
                 port=int(port),
                 username=username,
@@ -331,7 +339,7 @@ class APIClient:
             if not uuid:
                 raise APIError("UUID is required for VLESS protocol")
             
-            return UpstreamProxy(
+            return UpstreamProxy.intern(
                 server=server,
                 port=int(port),
                 protocol="vless",
@@ -347,7 +355,7 @@ class APIClient:
                 grpc_service_name=data.get("grpc_service_name")
             )
         else:
-            return UpstreamProxy(
+            return UpstreamProxy.intern(
                 server=server,
                 port=int(port),
                 username=username,
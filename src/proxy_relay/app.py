@@ -19,7 +19,7 @@ from .proxy_manager import ProxyManager
 from .health_monitor import HealthMonitor
 from .database import Database
 from .web_api import WebAPI
-from .logging_config import setup_logging, get_logger
+from .logging_config import setup_logging, get_logger, flush_logging
 
 
 logger = get_logger(__name__)
@@ -66,7 +66,10 @@ class ProxyRelayApp:
             
             # 初始化数据库
             logger.info("Initializing database...")
-            self.database = Database(config.system.database)
+            self.database = Database(
+                config.system.database,
+                keep_raw_usage=config.system.keep_raw_usage
+            )
             
             # 初始化代理管理器
             logger.info("Initializing proxy manager...")
@@ -157,6 +160,7 @@ class ProxyRelayApp:
                             logger.info(f"Stopped monitoring for port {port}")
                         except Exception as e:
                             logger.error(f"Error stopping monitoring for port {port}: {e}")
+                self.health_monitor.close()
             
             # 2. 保存当前状态
             if self.config_manager and self.config_manager._current_config:
@@ -226,6 +230,8 @@ class ProxyRelayApp:
         finally:
             # 执行清理
             asyncio.run(self.shutdown())
+            # 确保后台线程写完队列中的日志
+            flush_logging()
 
 
 def main():
@@ -4,9 +4,10 @@
 提供Web API的认证功能，包括密码哈希和HTTP Basic Auth验证。
 """
 
+import hashlib
 import logging
 import secrets
-from typing import Optional
+from typing import Optional, Tuple
 import bcrypt
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
@@ -67,8 +68,29 @@ class AuthMiddleware:
             auth_config: Web认证配置
         """
         self.auth_config = auth_config
+        # 浏览器每个请求都会带上相同的 Basic 凭据，记住最近一次验证通过的凭据摘要，
+        # 避免每个请求都执行一次 bcrypt；用户名或密码哈希变化后自动失效
+        self._digest_salt = secrets.token_bytes(16)
+        self._verified: Optional[Tuple[bytes, str, Optional[str]]] = None
         logger.info(f"Auth middleware initialized (enabled={auth_config.enabled})")
     
+    def _credentials_digest(self, credentials: HTTPBasicCredentials) -> bytes:
+        """
+        计算凭据的加盐摘要（不在内存中保存明文密码）
+        
+        Args:
+            credentials: HTTP Basic Auth凭据
+            
+        Returns:
+            bytes: SHA-256 摘要
+        """
+        return hashlib.sha256(
+            self._digest_salt
+            + credentials.username.encode('utf-8')
+            + b"\0"
+            + credentials.password.encode('utf-8')
+        ).digest()
+    
     def verify_credentials(
         self,
         credentials: Optional[HTTPBasicCredentials] = Security(security)
@@ -98,6 +120,17 @@ class AuthMiddleware:
                 headers={"WWW-Authenticate": "Basic"},
             )
         
+        # 与最近一次验证通过的凭据相同时跳过 bcrypt
+        digest = self._credentials_digest(credentials)
+        verified = self._verified
+        if (
+            verified is not None
+            and verified[1] == self.auth_config.username
+            and verified[2] == self.auth_config.password_hash
+            and secrets.compare_digest(verified[0], digest)
+        ):
+            return credentials.username
+        
         # 验证用户名
         correct_username = secrets.compare_digest(
             credentials.username.encode('utf-8'),
@@ -121,6 +154,7 @@ class AuthMiddleware:
                 headers={"WWW-Authenticate": "Basic"},
             )
         
+        self._verified = (digest, self.auth_config.username, self.auth_config.password_hash)
         logger.debug(f"Authentication successful for user: {credentials.username}")
         return credentials.username
 
@@ -425,7 +425,7 @@ def monitor_start(ctx, port):
         
         # 初始化数据库
         from .database import Database
-        database = Database(config.system.database)
+        database = Database(config.system.database, keep_raw_usage=config.system.keep_raw_usage)
         
         # 初始化代理管理器
         proxy_manager = ProxyManager(config_manager, database=database)
@@ -482,7 +482,7 @@ def monitor_stop(ctx, port):
         
         # 初始化数据库
         from .database import Database
-        database = Database(config.system.database)
+        database = Database(config.system.database, keep_raw_usage=config.system.keep_raw_usage)
         
         # 初始化代理管理器
         proxy_manager = ProxyManager(config_manager, database=database)
@@ -523,7 +523,7 @@ def monitor_status(ctx):
         
         # 初始化数据库
         from .database import Database
-        database = Database(config.system.database)
+        database = Database(config.system.database, keep_raw_usage=config.system.keep_raw_usage)
         
         # 查询所有监控状态
         monitoring_states = database.get_all_monitoring_states()
@@ -637,7 +637,7 @@ def switch(ctx, port, api_provider):
         
         # 初始化数据库
         from .database import Database
-        database = Database(config.system.database)
+        database = Database(config.system.database, keep_raw_usage=config.system.keep_raw_usage)
         
         # 初始化代理管理器
         proxy_manager = ProxyManager(config_manager, database=database)
@@ -5,10 +5,13 @@
 """
 
 import os
+import copy
 import yaml
+import hashlib
 import logging
+import functools
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Tuple
 from .models import (
     Config,
     SystemConfig,
@@ -18,10 +21,78 @@ from .models import (
     UpstreamProxy,
     WebAuthConfig,
     ResponseFormat,
+    LogLevel,
 )
 
 logger = logging.getLogger(__name__)
 
+# PyYAML 编译了 libyaml 时使用 C 实现的安全加载器，整个文档在 C 中完成解析
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_yaml(text: str) -> Any:
+    """
+    解析 YAML 文本，相同内容直接返回上次的解析结果
+    
+    配置文件在热重载、CLI 命令和 Web API 中会被反复读取，而内容通常没有变化。
+    返回值被缓存共享，调用方不能修改
+    
+    Args:
+        text: YAML 文本
+        
+    Returns:
+        Any: 解析结果
+    """
+    return yaml.load(text, Loader=_YAML_LOADER)
+
+
+# 配置文件读取缓存: {绝对路径: ((st_mtime_ns, st_size, st_ino), 文本, sha256 摘要)}
+_FILE_CACHE: Dict[str, Tuple[Tuple[int, int, int], str, bytes]] = {}
+
+
+def _stat_key(st: os.stat_result) -> Tuple[int, int, int]:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _read_config_file(path: str) -> Tuple[str, bytes]:
+    """
+    读取配置文件内容及其 sha256 摘要
+    
+    文件的修改时间、大小和 inode 与上次读取时相同时只需一次 stat，直接返回缓存的内容；
+    编辑器原地修改或替换文件都会改变其中之一，缓存随之失效
+    
+    Args:
+        path: 配置文件路径
+        
+    Returns:
+        Tuple[str, bytes]: (文件文本, sha256 摘要)
+        
+    Raises:
+        OSError: 文件无法读取
+    """
+    path = os.path.abspath(path)
+    key = _stat_key(os.stat(path))
+    cached = _FILE_CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1], cached[2]
+    
+    with open(path, 'rb') as f:
+        raw = f.read()
+        key = _stat_key(os.fstat(f.fileno()))
+    text = raw.decode('utf-8')
+    digest = hashlib.sha256(raw).digest()
+    _FILE_CACHE[path] = (key, text, digest)
+    return text, digest
+
+
+def clear_config_cache() -> None:
+    """
+    清空配置文件读取缓存和 YAML 解析缓存
+    """
+    _FILE_CACHE.clear()
+    _parse_yaml.cache_clear()
+
 
 class ConfigManager:
     """配置管理器类"""
@@ -37,6 +108,41 @@ class ConfigManager:
         """
         self.config_path = config_path or self.DEFAULT_CONFIG_PATH
         self._current_config: Optional[Config] = None
+        
+        # 最近一次加载或保存的配置文件内容摘要（sha256），用于 reload_config 跳过未变化的文件
+        self._config_digest: Optional[bytes] = None
+        
+        # 配置变更回调列表，加载或保存配置后依次调用
+        self._change_callbacks: List[Callable[[Config], None]] = []
+        
+        # 端口 -> 代理配置、提供商 ID -> API 提供商配置的索引，首次查询时建立，加载或保存配置后失效
+        self._proxy_by_port: Optional[Dict[int, ProxyConfig]] = None
+        self._provider_by_id: Optional[Dict[str, APIProviderConfig]] = None
+    
+    def on_change(self, callback: Callable[[Config], None]) -> None:
+        """
+        注册配置变更回调
+        
+        每次加载或保存配置后以新的配置对象调用回调；注册时如果配置已加载，立即调用一次
+        
+        Args:
+            callback: 回调函数，参数为当前配置对象
+        """
+        self._change_callbacks.append(callback)
+        if self._current_config:
+            callback(self._current_config)
+    
+    def _notify_change(self) -> None:
+        """
+        通知所有配置变更回调（回调异常只记录日志）
+        """
+        self._proxy_by_port = None
+        self._provider_by_id = None
+        for callback in self._change_callbacks:
+            try:
+                callback(self._current_config)
+            except Exception as e:
+                logger.error(f"Configuration change callback failed: {e}")
     
     def load_config(self) -> Config:
         """
@@ -51,13 +157,18 @@ class ConfigManager:
         """
         logger.info(f"Loading configuration from: {self.config_path}")
         
-        if not os.path.exists(self.config_path):
+        try:
+            text, digest = _read_config_file(self.config_path)
+        except FileNotFoundError:
             logger.error(f"Configuration file not found: {self.config_path}")
             raise FileNotFoundError(f"Configuration file not found: {self.config_path}")
+        except Exception as e:
+            logger.error(f"Failed to load configuration: {e}")
+            raise ValueError(f"Failed to load configuration: {e}")
         
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
+            # 复制缓存的解析结果，配置对象可能引用其中的列表和字典
+            data = copy.deepcopy(_parse_yaml(text))
             
             if not data:
                 logger.error("Configuration file is empty")
@@ -65,6 +176,8 @@ class ConfigManager:
             
             config = self._parse_config(data)
             self._current_config = config
+            self._config_digest = digest
+            self._notify_change()
             
             logger.info(f"Configuration loaded successfully: {len(config.proxies)} proxies, {len(config.api_providers)} API providers")
             return config
@@ -89,6 +202,10 @@ class ConfigManager:
         """
         logger.info(f"Saving configuration to: {self.config_path}")
         
+        # 调用方可能已经修改了当前配置的代理/提供商列表，即使保存失败索引也需要重建
+        self._proxy_by_port = None
+        self._provider_by_id = None
+        
         # 验证配置
         errors = self.validate_config(config)
         if errors:
@@ -105,11 +222,19 @@ class ConfigManager:
         
         # 写入文件
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                yaml.safe_dump(data, f, default_flow_style=False, allow_unicode=True, sort_keys=False)
+            text = yaml.safe_dump(data, default_flow_style=False, allow_unicode=True, sort_keys=False)
+            raw = text.encode('utf-8')
+            with open(self.config_path, 'wb') as f:
+                f.write(raw)
+                f.flush()
+                key = _stat_key(os.fstat(f.fileno()))
             
             self._current_config = config
+            self._config_digest = hashlib.sha256(raw).digest()
+            # 刚写入的内容无需再从磁盘读取
+            _FILE_CACHE[os.path.abspath(self.config_path)] = (key, text, self._config_digest)
             logger.info("Configuration saved successfully")
+            self._notify_change()
             
         except Exception as e:
             logger.error(f"Failed to save configuration: {e}")
@@ -119,9 +244,20 @@ class ConfigManager:
         """
         重新加载配置文件
         
+        文件内容与最近一次加载或保存时完全相同时（例如文件监听在同步时重复触发），
+        直接返回当前配置对象，不再解析、验证和通知回调；文件元数据未变化时只需一次 stat
+        
         Returns:
-            Config: 新的配置对象
+            Config: 新的配置对象（内容未变化时为当前配置对象）
         """
+        if self._current_config is not None and self._config_digest is not None:
+            try:
+                _, digest = _read_config_file(self.config_path)
+            except (OSError, UnicodeDecodeError):
+                digest = None
+            if digest == self._config_digest:
+                logger.debug(f"Configuration file unchanged, skipping reload: {self.config_path}")
+                return self._current_config
         return self.load_config()
     
     def validate_config(self, config: Config) -> List[str]:
@@ -151,7 +287,9 @@ class ConfigManager:
                     errors.append(f"system.web_port must be between 1024 and 65535, got {config.system.web_port}")
                 
                 # 验证日志级别
-                if config.system.log_level not in ["DEBUG", "INFO", "WARN", "ERROR"]:
+                try:
+                    LogLevel(config.system.log_level)
+                except ValueError:
                     errors.append(f"system.log_level must be DEBUG, INFO, WARN, or ERROR, got {config.system.log_level}")
             
             # 验证监控配置
@@ -164,12 +302,16 @@ class ConfigManager:
                     errors.append(f"monitoring.failure_threshold must be positive, got {config.monitoring.failure_threshold}")
                 if config.monitoring.check_timeout <= 0:
                     errors.append(f"monitoring.check_timeout must be positive, got {config.monitoring.check_timeout}")
+                if config.monitoring.check_mode not in ["tcp", "socks_handshake", "http"]:
+                    errors.append(f"monitoring.check_mode must be tcp, socks_handshake, or http, got {config.monitoring.check_mode}")
+                if config.monitoring.check_method not in ["GET", "HEAD"]:
+                    errors.append(f"monitoring.check_method must be GET or HEAD, got {config.monitoring.check_method}")
             
-            # 验证API提供商配置
+            # 验证API提供商配置（provider_ids 同时用于下面的代理引用检查）
+            provider_ids = set()
             if not isinstance(config.api_providers, list):
                 errors.append("api_providers must be a list")
             else:
-                provider_ids = set()
                 for i, provider in enumerate(config.api_providers):
                     if not isinstance(provider, APIProviderConfig):
                         errors.append(f"api_providers[{i}] must be an APIProviderConfig instance")
@@ -211,9 +353,8 @@ class ConfigManager:
                             errors.append(f"proxies[{i}].upstream.port must be between 1 and 65535")
                     
                     # 验证API提供商引用（仅当指定了 API 提供商时）
-                    if hasattr(config, 'api_providers') and proxy.api_provider_id is not None:
-                        provider_ids_list = [p.id for p in config.api_providers]
-                        if proxy.api_provider_id not in provider_ids_list:
+                    if proxy.api_provider_id is not None:
+                        if proxy.api_provider_id not in provider_ids:
                             errors.append(f"proxies[{i}].api_provider_id '{proxy.api_provider_id}' not found in api_providers")
         
         except Exception as e:
@@ -234,11 +375,28 @@ class ConfigManager:
         if not self._current_config:
             raise RuntimeError("No configuration loaded. Call load_config() first.")
         
-        for proxy in self._current_config.proxies:
-            if proxy.local_port == port:
-                return proxy
+        by_port = self._proxy_by_port
+        if by_port is None:
+            by_port = self._proxy_by_port = {proxy.local_port: proxy for proxy in self._current_config.proxies}
+        return by_port.get(port)
+    
+    def get_api_provider_config(self, provider_id: str) -> Optional[APIProviderConfig]:
+        """
+        获取指定 ID 的 API 提供商配置
+        
+        Args:
+            provider_id: API 提供商 ID
+            
+        Returns:
+            APIProviderConfig: API 提供商配置，如果不存在返回 None
+        """
+        if not self._current_config:
+            raise RuntimeError("No configuration loaded. Call load_config() first.")
         
-        return None
+        by_id = self._provider_by_id
+        if by_id is None:
+            by_id = self._provider_by_id = {provider.id: provider for provider in self._current_config.api_providers}
+        return by_id.get(provider_id)
     
     def update_proxy_config(self, port: int, new_config: ProxyConfig) -> None:
         """
@@ -292,7 +450,9 @@ class ConfigManager:
             web_auth=web_auth,
             log_level=system_data.get('log_level', 'INFO'),
             log_file=system_data.get('log_file', '/var/log/proxy-relay/app.log'),
-            database=system_data.get('database', '/var/lib/proxy-relay/data.db')
+            database=system_data.get('database', '/var/lib/proxy-relay/data.db'),
+            keep_raw_usage=system_data.get('keep_raw_usage', False),
+            singbox_config_path=system_data.get('singbox_config_path', '/etc/sing-box/config.json')
         )
         
         # 解析监控配置
@@ -301,7 +461,9 @@ class ConfigManager:
             check_interval=monitoring_data.get('check_interval', 30),
             failure_threshold=monitoring_data.get('failure_threshold', 3),
             check_timeout=monitoring_data.get('check_timeout', 10),
-            check_url=monitoring_data.get('check_url', 'http://www.google.com')
+            check_url=monitoring_data.get('check_url', 'http://www.google.com'),
+            check_mode=monitoring_data.get('check_mode', 'http'),
+            check_method=str(monitoring_data.get('check_method', 'GET')).upper()
         )
         
         # 解析API提供商配置
@@ -448,15 +610,19 @@ class ConfigManager:
                     'username': config.system.web_auth.username,
                     'password_hash': config.system.web_auth.password_hash
                 },
-                'log_level': config.system.log_level,
+                'log_level': str(config.system.log_level),
                 'log_file': config.system.log_file,
-                'database': config.system.database
+                'database': config.system.database,
+                'keep_raw_usage': config.system.keep_raw_usage,
+                'singbox_config_path': config.system.singbox_config_path
             },
             'monitoring': {
                 'check_interval': config.monitoring.check_interval,
                 'failure_threshold': config.monitoring.failure_threshold,
                 'check_timeout': config.monitoring.check_timeout,
-                'check_url': config.monitoring.check_url
+                'check_url': config.monitoring.check_url,
+                'check_mode': config.monitoring.check_mode,
+                'check_method': config.monitoring.check_method
             },
             'api_providers': [
                 {
@@ -465,8 +631,8 @@ class ConfigManager:
                     'enabled': provider.enabled,
                     'endpoint': provider.endpoint,
                     'method': provider.method,
-                    'params': provider.params,
-                    'headers': provider.headers,
+                    'params': dict(provider.params) or None,
+                    'headers': dict(provider.headers) or None,
                     'body': provider.body,
                     'timeout': provider.timeout,
                     'retry_attempts': provider.retry_attempts,
@@ -491,7 +657,7 @@ class ConfigManager:
                     'name': upstream.name,
                     'enabled': upstream.enabled,
                     'description': upstream.description,
-                    'tags': upstream.tags,
+                    'tags': list(upstream.tags) or None,
                     'proxy': self._upstream_proxy_to_dict(upstream.proxy)
                 }
                 for upstream in config.upstream_proxies
@@ -6,28 +6,104 @@
 
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+import time
+import functools
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, NamedTuple
 from contextlib import contextmanager
 
-from .models import UpstreamProxy, SwitchHistoryEntry
+from .models import UpstreamProxy, SwitchHistoryEntry, SwitchHistoryBatch
 
 logger = logging.getLogger(__name__)
 
+# 写操作遇到 "database is locked" 时的重试次数和退避间隔（秒）
+LOCKED_RETRY_ATTEMPTS = 3
+LOCKED_RETRY_DELAY = 0.1
+
+# 无旧上游代理时切换历史中对应的 5 个空列
+_EMPTY_UPSTREAM_COLUMNS = (None,) * 5
+
+# Unix 纪元（UTC），用于时间字符串与纪元纳秒之间的精确换算
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# 以 datetime.isoformat() 写入本地时间的旧版本表及时间列（v3 迁移时统一转换为 UTC）
+_LEGACY_TIMESTAMP_COLUMNS = (
+    ("proxy_switch_history", "timestamp"),
+    ("health_check_log", "timestamp"),
+)
+
+
+def _to_db_timestamp(value: datetime) -> str:
+    """
+    将 datetime 转换为数据库中统一的 UTC 时间格式
+    
+    格式与 CURRENT_TIMESTAMP 一致（YYYY-MM-DD HH:MM:SS），有微秒时追加小数部分，
+    保证按文本排序即按时间排序。不带时区的时间按本地时间处理。
+    
+    Args:
+        value: 时间
+        
+    Returns:
+        str: UTC 时间字符串
+    """
+    return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat(sep=' ')
+
+
+def _retry_on_locked(func):
+    """写操作装饰器：busy_timeout 之后仍然遇到数据库锁定时，退避重试"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, LOCKED_RETRY_ATTEMPTS + 1):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if "database is locked" not in str(e) or attempt == LOCKED_RETRY_ATTEMPTS:
+                    raise
+                logger.warning(f"Database is locked, retrying {func.__name__} ({attempt}/{LOCKED_RETRY_ATTEMPTS})")
+                time.sleep(LOCKED_RETRY_DELAY * attempt)
+    return wrapper
+
+
+class PortTrafficTuple(NamedTuple):
+    """端口流量汇总行"""
+    total_bytes_sent: int
+    total_bytes_recv: int
+    total_connections: int
+    last_updated: Optional[str]
+
 
 class Database:
     """数据库管理类"""
     
-    def __init__(self, db_path: str):
+    # 数据库结构版本，记录在 PRAGMA user_version 中；修改表结构或存储格式时递增
+    SCHEMA_VERSION = 3
+    
+    # 等待其他连接释放写锁的最长时间（毫秒）
+    BUSY_TIMEOUT_MS = 5000
+    
+    # iter_health_check_logs 每次持锁读取的记录数
+    ITER_PAGE_SIZE = 500
+    
+    def __init__(self, db_path: str, keep_raw_usage: bool = False):
         """
         初始化数据库管理器
         
         Args:
             db_path: 数据库文件路径
+            keep_raw_usage: 是否在 upstream_usage 表中保留每次使用的原始记录
+                （默认只更新 upstream_usage_summary 汇总计数）
         """
         self.db_path = db_path
+        self.keep_raw_usage = keep_raw_usage
         self._ensure_db_directory()
+        
+        # 整个实例共享一个连接；锁保证同一时刻只有一个线程在使用它，
+        # 使各线程的事务不会交错
+        self._conn = self._connect()
+        self._lock = threading.RLock()
+        
         self._init_database()
     
     def _ensure_db_directory(self):
@@ -41,187 +117,251 @@ class Database:
         logger.info(f"Initializing database: {self.db_path}")
         
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 创建 upstream_proxies 表（v1.2.0 新增，v1.2.1 添加 Reality 支持）
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS upstream_proxies (
-                    id TEXT PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    enabled BOOLEAN NOT NULL DEFAULT 1,
-                    description TEXT,
-                    tags TEXT,
-                    server TEXT NOT NULL,
-                    port INTEGER NOT NULL,
-                    protocol TEXT NOT NULL,
-                    username TEXT,
-                    password TEXT,
-                    uuid TEXT,
-                    flow TEXT,
-                    encryption TEXT,
-                    network TEXT,
-                    tls BOOLEAN,
-                    sni TEXT,
-                    alpn TEXT,
-                    reality BOOLEAN DEFAULT 0,
-                    reality_public_key TEXT,
-                    reality_short_id TEXT,
-                    reality_server_name TEXT,
-                    reality_fingerprint TEXT,
-                    ws_path TEXT,
-                    ws_host TEXT,
-                    grpc_service_name TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 创建 upstream_usage 表 - 记录出口代理使用情况
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS upstream_usage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    upstream_id TEXT NOT NULL,
-                    local_port INTEGER NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (upstream_id) REFERENCES upstream_proxies(id)
-                )
-            """)
-            
-            # 创建 proxy_switch_history 表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS proxy_switch_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    local_port INTEGER NOT NULL,
-                    old_upstream_server TEXT,
-                    old_upstream_port INTEGER,
-                    old_upstream_username TEXT,
-                    old_upstream_password TEXT,
-                    old_upstream_protocol TEXT,
-                    new_upstream_server TEXT NOT NULL,
-                    new_upstream_port INTEGER NOT NULL,
-                    new_upstream_username TEXT,
-                    new_upstream_password TEXT,
-                    new_upstream_protocol TEXT NOT NULL,
-                    reason TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    success BOOLEAN NOT NULL,
-                    CHECK (reason IN ('health_check_failed', 'manual', 'api_error'))
-                )
-            """)
-            
-            # 创建 health_check_log 表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS health_check_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    local_port INTEGER NOT NULL,
-                    upstream_server TEXT NOT NULL,
-                    upstream_port INTEGER NOT NULL,
-                    check_result BOOLEAN NOT NULL,
-                    response_time_ms INTEGER,
-                    error_message TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 创建 monitoring_state 表
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS monitoring_state (
-                    local_port INTEGER PRIMARY KEY,
-                    enabled BOOLEAN NOT NULL,
-                    failure_count INTEGER DEFAULT 0,
-                    last_check_time DATETIME,
-                    last_success_time DATETIME
-                )
-            """)
-            
-            # 创建 port_traffic 表 - 端口流量统计
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS port_traffic (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    local_port INTEGER NOT NULL,
-                    bytes_sent INTEGER DEFAULT 0,
-                    bytes_recv INTEGER DEFAULT 0,
-                    connections INTEGER DEFAULT 0,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 创建 port_traffic_summary 表 - 端口流量汇总
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS port_traffic_summary (
-                    local_port INTEGER PRIMARY KEY,
-                    total_bytes_sent INTEGER DEFAULT 0,
-                    total_bytes_recv INTEGER DEFAULT 0,
-                    total_connections INTEGER DEFAULT 0,
-                    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 创建索引以提高查询性能
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_upstream_usage_upstream_id 
-                ON upstream_usage(upstream_id)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_upstream_usage_timestamp 
-                ON upstream_usage(timestamp)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_switch_history_port 
-                ON proxy_switch_history(local_port)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_switch_history_timestamp 
-                ON proxy_switch_history(timestamp)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_health_check_port 
-                ON health_check_log(local_port)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_health_check_timestamp 
-                ON health_check_log(timestamp)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_port_traffic_port 
-                ON port_traffic(local_port)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_port_traffic_timestamp 
-                ON port_traffic(timestamp)
-            """)
-            
-            conn.commit()
-            logger.info("Database initialized successfully")
+            with conn:
+                cursor = conn.cursor()
+                
+                # 结构已是最新版本时跳过 DDL
+                cursor.execute("PRAGMA user_version")
+                version = cursor.fetchone()[0]
+                if version >= self.SCHEMA_VERSION:
+                    logger.debug("Database schema is up to date, skipping initialization")
+                    return
+                
+                # 创建 upstream_proxies 表（v1.2.0 新增，v1.2.1 添加 Reality 支持）
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS upstream_proxies (
+                        id TEXT PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        enabled BOOLEAN NOT NULL DEFAULT 1,
+                        description TEXT,
+                        tags TEXT,
+                        server TEXT NOT NULL,
+                        port INTEGER NOT NULL,
+                        protocol TEXT NOT NULL,
+                        username TEXT,
+                        password TEXT,
+                        uuid TEXT,
+                        flow TEXT,
+                        encryption TEXT,
+                        network TEXT,
+                        tls BOOLEAN,
+                        sni TEXT,
+                        alpn TEXT,
+                        reality BOOLEAN DEFAULT 0,
+                        reality_public_key TEXT,
+                        reality_short_id TEXT,
+                        reality_server_name TEXT,
+                        reality_fingerprint TEXT,
+                        ws_path TEXT,
+                        ws_host TEXT,
+                        grpc_service_name TEXT,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # 创建 upstream_usage 表 - 记录出口代理使用情况
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS upstream_usage (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        upstream_id TEXT NOT NULL,
+                        local_port INTEGER NOT NULL,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (upstream_id) REFERENCES upstream_proxies(id)
+                    )
+                """)
+                
+                # 创建 upstream_usage_summary 表 - 出口代理使用次数汇总
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS upstream_usage_summary (
+                        upstream_id TEXT PRIMARY KEY,
+                        usage_count INTEGER NOT NULL DEFAULT 0,
+                        last_used DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # 从原始使用记录回填汇总表（v1 -> v2 迁移，已存在的行保持不变）
+                cursor.execute("""
+                    INSERT OR IGNORE INTO upstream_usage_summary (upstream_id, usage_count, last_used)
+                    SELECT upstream_id, COUNT(*), MAX(timestamp)
+                    FROM upstream_usage
+                    GROUP BY upstream_id
+                """)
+                
+                # 创建 proxy_switch_history 表
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS proxy_switch_history (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        local_port INTEGER NOT NULL,
+                        old_upstream_server TEXT,
+                        old_upstream_port INTEGER,
+                        old_upstream_username TEXT,
+                        old_upstream_password TEXT,
+                        old_upstream_protocol TEXT,
+                        new_upstream_server TEXT NOT NULL,
+                        new_upstream_port INTEGER NOT NULL,
+                        new_upstream_username TEXT,
+                        new_upstream_password TEXT,
+                        new_upstream_protocol TEXT NOT NULL,
+                        reason TEXT NOT NULL,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        success BOOLEAN NOT NULL,
+                        CHECK (reason IN ('health_check_failed', 'manual', 'api_error'))
+                    )
+                """)
+                
+                # 创建 health_check_log 表
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS health_check_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        local_port INTEGER NOT NULL,
+                        upstream_server TEXT NOT NULL,
+                        upstream_port INTEGER NOT NULL,
+                        check_result BOOLEAN NOT NULL,
+                        response_time_ms INTEGER,
+                        error_message TEXT,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # 创建 monitoring_state 表
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS monitoring_state (
+                        local_port INTEGER PRIMARY KEY,
+                        enabled BOOLEAN NOT NULL,
+                        failure_count INTEGER DEFAULT 0,
+                        last_check_time DATETIME,
+                        last_success_time DATETIME
+                    )
+                """)
+                
+                # 创建 port_traffic 表 - 端口流量统计
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS port_traffic (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        local_port INTEGER NOT NULL,
+                        bytes_sent INTEGER DEFAULT 0,
+                        bytes_recv INTEGER DEFAULT 0,
+                        connections INTEGER DEFAULT 0,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # 创建 port_traffic_summary 表 - 端口流量汇总
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS port_traffic_summary (
+                        local_port INTEGER PRIMARY KEY,
+                        total_bytes_sent INTEGER DEFAULT 0,
+                        total_bytes_recv INTEGER DEFAULT 0,
+                        total_connections INTEGER DEFAULT 0,
+                        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # 创建索引以提高查询性能
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_upstream_usage_upstream_id 
+                    ON upstream_usage(upstream_id)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_upstream_usage_timestamp 
+                    ON upstream_usage(timestamp)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_switch_history_port 
+                    ON proxy_switch_history(local_port)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_switch_history_timestamp 
+                    ON proxy_switch_history(timestamp)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_health_check_port 
+                    ON health_check_log(local_port)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_health_check_timestamp 
+                    ON health_check_log(timestamp)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_port_traffic_port 
+                    ON port_traffic(local_port)
+                """)
+                
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_port_traffic_timestamp 
+                    ON port_traffic(timestamp)
+                """)
+                
+                # 旧版本以本地时间 isoformat 写入的时间统一转换为 UTC（v2 -> v3 迁移）
+                if version < 3:
+                    self._migrate_legacy_timestamps(cursor)
+                
+                cursor.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+                logger.info("Database initialized successfully")
+    
+    @staticmethod
+    def _migrate_legacy_timestamps(cursor: sqlite3.Cursor) -> None:
+        """
+        将旧版本写入的 ISO 格式时间（含 'T' 分隔符）改写为统一的 UTC 格式
+        
+        旧版本写入 datetime.now().isoformat()，即不带时区的本地时间，与
+        CURRENT_TIMESTAMP 的 UTC 格式混在一起时无法按文本正确排序。
+        
+        Args:
+            cursor: 迁移事务中的游标
+        """
+        for table, column in _LEGACY_TIMESTAMP_COLUMNS:
+            cursor.execute(f"SELECT id, {column} FROM {table} WHERE {column} LIKE '%T%'")
+            rows = [
+                (_to_db_timestamp(datetime.fromisoformat(value)), row_id)
+                for row_id, value in cursor.fetchall()
+            ]
+            if rows:
+                cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", rows)
+                logger.info(f"Migrated {len(rows)} legacy timestamps in {table} to UTC")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """创建共享的数据库连接"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # 使用 Row 对象以便按列名访问
+        conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        return conn
     
     @contextmanager
     def _get_connection(self):
         """
         获取数据库连接的上下文管理器
         
+        返回共享连接并在使用期间持有实例锁。发生异常时只回滚当前事务，
+        连接保持打开以供后续调用复用；连接仅由 close() 关闭。
+        
         Yields:
             sqlite3.Connection: 数据库连接
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # 使用 Row 对象以便按列名访问
-        try:
-            yield conn
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Database operation failed: {e}")
-            raise
-        finally:
-            conn.close()
+        with self._lock:
+            try:
+                yield self._conn
+            except Exception as e:
+                self._conn.rollback()
+                logger.error(f"Database operation failed: {e}")
+                raise
+    
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+        logger.info(f"Database connection closed: {self.db_path}")
     
     # ==================== 代理切换历史操作 ====================
     
+    @_retry_on_locked
     def insert_switch_history(
         self,
         local_port: int,
@@ -240,7 +380,7 @@ class Database:
             new_upstream: 新的上游代理
             reason: 切换原因 ('health_check_failed', 'manual', 'api_error')
             success: 是否成功
-            timestamp: 时间戳（可选，默认为当前时间）
+            timestamp: 时间戳（可选，默认由数据库填充当前 UTC 时间；不带时区时按本地时间处理）
             
         Returns:
             int: 插入记录的ID
@@ -249,41 +389,109 @@ class Database:
             raise ValueError(f"Invalid reason: {reason}")
         
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            if timestamp is None:
-                timestamp = datetime.now()
-            
-            cursor.execute("""
-                INSERT INTO proxy_switch_history (
+            with conn:
+                cursor = conn.cursor()
+                
+                columns = """
                     local_port,
                     old_upstream_server, old_upstream_port, old_upstream_username,
                     old_upstream_password, old_upstream_protocol,
                     new_upstream_server, new_upstream_port, new_upstream_username,
                     new_upstream_password, new_upstream_protocol,
-                    reason, timestamp, success
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                local_port,
-                old_upstream.server if old_upstream else None,
-                old_upstream.port if old_upstream else None,
-                old_upstream.username if old_upstream else None,
-                old_upstream.password if old_upstream else None,
-                old_upstream.protocol if old_upstream else None,
-                new_upstream.server,
-                new_upstream.port,
-                new_upstream.username,
-                new_upstream.password,
-                new_upstream.protocol,
-                reason,
-                timestamp.isoformat(),
-                success
-            ))
+                    reason, success"""
+                params = (
+                    local_port,
+                    *self._upstream_columns(old_upstream),
+                    *self._upstream_columns(new_upstream),
+                    reason,
+                    success
+                )
+                
+                # 未指定时间戳时省略该列，由 DEFAULT CURRENT_TIMESTAMP 填充
+                if timestamp is not None:
+                    columns += ", timestamp"
+                    params += (_to_db_timestamp(timestamp),)
+                
+                cursor.execute(
+                    f"INSERT INTO proxy_switch_history ({columns}) "
+                    f"VALUES ({', '.join('?' * len(params))})",
+                    params
+                )
+                record_id = cursor.lastrowid
+                logger.info(f"Switch history recorded: port={local_port}, reason={reason}, success={success}")
+                return record_id
+    
+    @_retry_on_locked
+    def insert_switch_history_many(self, rows: List[tuple]) -> None:
+        """
+        批量插入代理切换历史记录（单个事务），时间戳由数据库填充当前 UTC 时间
+        
+        Args:
+            rows: 记录行列表，每行为 (local_port, old_upstream, new_upstream, reason, success)，
+                old_upstream 可为None
+                
+        Raises:
+            ValueError: 切换原因无效（不写入任何记录）
+        """
+        for row in rows:
+            if row[3] not in ['health_check_failed', 'manual', 'api_error']:
+                raise ValueError(f"Invalid reason: {row[3]}")
+        
+        with self._get_connection() as conn:
+            with conn:
+                conn.executemany("""
+                    INSERT INTO proxy_switch_history (
+                        local_port,
+                        old_upstream_server, old_upstream_port, old_upstream_username,
+                        old_upstream_password, old_upstream_protocol,
+                        new_upstream_server, new_upstream_port, new_upstream_username,
+                        new_upstream_password, new_upstream_protocol,
+                        reason, success
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (
+                        local_port,
+                        *self._upstream_columns(old_upstream),
+                        *self._upstream_columns(new_upstream),
+                        reason,
+                        success
+                    )
+                    for local_port, old_upstream, new_upstream, reason, success in rows
+                ])
+                logger.info(f"Switch history batch recorded: {len(rows)} rows")
+    
+    @staticmethod
+    def _timestamp_to_ns(value: str) -> int:
+        """
+        将数据库中的时间字符串转换为 Unix 纪元纳秒
+        
+        库中不带时区的时间均为 UTC：CURRENT_TIMESTAMP 与 _to_db_timestamp 写入 UTC，
+        旧版本的本地时间已在 v3 迁移中转换。
+        
+        Args:
+            value: 数据库时间字符串
             
-            conn.commit()
-            record_id = cursor.lastrowid
-            logger.info(f"Switch history recorded: port={local_port}, reason={reason}, success={success}")
-            return record_id
+        Returns:
+            int: Unix 纪元纳秒
+        """
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return (dt - _EPOCH) // timedelta(microseconds=1) * 1000
+    
+    @staticmethod
+    def _ns_to_isoformat(ns: Optional[int]) -> Optional[str]:
+        """将 Unix 纪元纳秒转换为 ISO 格式的 UTC 时间字符串"""
+        if ns is None:
+            return None
+        return datetime.fromtimestamp(ns / 1_000_000_000, tz=timezone.utc).isoformat()
+    
+    @staticmethod
+    def _upstream_columns(upstream: Optional[UpstreamProxy]) -> tuple:
+        """返回切换历史表中上游代理对应的 (server, port, username, password, protocol) 列值"""
+        if upstream is None:
+            return _EMPTY_UPSTREAM_COLUMNS
+        return (upstream.server, upstream.port, upstream.username, upstream.password, upstream.protocol)
     
     def get_switch_history(
         self,
@@ -302,6 +510,39 @@ class Database:
         Returns:
             List[SwitchHistoryEntry]: 切换历史记录列表
         """
+        rows = self._query_switch_history(local_port, limit, offset)
+        return [SwitchHistoryEntry(*self._switch_history_fields(row)) for row in rows]
+    
+    def get_switch_history_batch(
+        self,
+        local_port: Optional[int] = None,
+        limit: int = 100,
+        offset: int = 0
+    ) -> SwitchHistoryBatch:
+        """
+        以列式存储查询代理切换历史（适合大批量结果的序列化）
+        
+        Args:
+            local_port: 本地端口（可选，None表示查询所有端口）
+            limit: 返回记录数限制
+            offset: 偏移量
+            
+        Returns:
+            SwitchHistoryBatch: 切换历史记录批次
+        """
+        batch = SwitchHistoryBatch()
+        append = batch.append
+        for row in self._query_switch_history(local_port, limit, offset):
+            append(*self._switch_history_fields(row))
+        return batch
+    
+    def _query_switch_history(
+        self,
+        local_port: Optional[int],
+        limit: int,
+        offset: int
+    ) -> List[sqlite3.Row]:
+        """按时间倒序查询切换历史的原始行"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
@@ -319,14 +560,18 @@ class Database:
                     LIMIT ? OFFSET ?
                 """, (limit, offset))
             
-            rows = cursor.fetchall()
-            return [self._row_to_switch_history(row) for row in rows]
+            return cursor.fetchall()
     
-    def _row_to_switch_history(self, row: sqlite3.Row) -> SwitchHistoryEntry:
-        """将数据库行转换为 SwitchHistoryEntry 对象"""
+    def _switch_history_fields(self, row: sqlite3.Row) -> tuple:
+        """
+        将数据库行转换为切换历史字段元组
+        
+        顺序与 SwitchHistoryEntry 字段一致：(id, local_port, old_upstream, new_upstream,
+        reason, timestamp_ns, success)
+        """
         old_upstream = None
         if row['old_upstream_server']:
-            old_upstream = UpstreamProxy(
+            old_upstream = UpstreamProxy.intern(
                 server=row['old_upstream_server'],
                 port=row['old_upstream_port'],
                 username=row['old_upstream_username'],
@@ -334,7 +579,7 @@ class Database:
                 protocol=row['old_upstream_protocol'] or 'socks5'
             )
         
-        new_upstream = UpstreamProxy(
+        new_upstream = UpstreamProxy.intern(
             server=row['new_upstream_server'],
             port=row['new_upstream_port'],
             username=row['new_upstream_username'],
@@ -342,18 +587,19 @@ class Database:
             protocol=row['new_upstream_protocol']
         )
         
-        return SwitchHistoryEntry(
-            id=row['id'],
-            local_port=row['local_port'],
-            old_upstream=old_upstream,
-            new_upstream=new_upstream,
-            reason=row['reason'],
-            timestamp=datetime.fromisoformat(row['timestamp']),
-            success=bool(row['success'])
+        return (
+            row['id'],
+            row['local_port'],
+            old_upstream,
+            new_upstream,
+            row['reason'],
+            self._timestamp_to_ns(row['timestamp']),
+            bool(row['success'])
         )
     
     # ==================== 健康检查日志操作 ====================
     
+    @_retry_on_locked
     def insert_health_check_log(
         self,
         local_port: int,
@@ -374,36 +620,60 @@ class Database:
             check_result: 检查结果（True=成功，False=失败）
             response_time_ms: 响应时间（毫秒）
             error_message: 错误信息
-            timestamp: 时间戳（可选，默认为当前时间）
+            timestamp: 时间戳（可选，默认由数据库填充当前 UTC 时间；不带时区时按本地时间处理）
             
         Returns:
             int: 插入记录的ID
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            if timestamp is None:
-                timestamp = datetime.now()
-            
-            cursor.execute("""
-                INSERT INTO health_check_log (
+            with conn:
+                cursor = conn.cursor()
+                
+                columns = """
                     local_port, upstream_server, upstream_port,
-                    check_result, response_time_ms, error_message, timestamp
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                local_port,
-                upstream_server,
-                upstream_port,
-                check_result,
-                response_time_ms,
-                error_message,
-                timestamp.isoformat()
-            ))
-            
-            conn.commit()
-            record_id = cursor.lastrowid
-            logger.debug(f"Health check logged: port={local_port}, result={check_result}")
-            return record_id
+                    check_result, response_time_ms, error_message"""
+                params = (
+                    local_port,
+                    upstream_server,
+                    upstream_port,
+                    check_result,
+                    response_time_ms,
+                    error_message
+                )
+                
+                # 未指定时间戳时省略该列，由 DEFAULT CURRENT_TIMESTAMP 填充
+                if timestamp is not None:
+                    columns += ", timestamp"
+                    params += (_to_db_timestamp(timestamp),)
+                
+                cursor.execute(
+                    f"INSERT INTO health_check_log ({columns}) "
+                    f"VALUES ({', '.join('?' * len(params))})",
+                    params
+                )
+                record_id = cursor.lastrowid
+                logger.debug(f"Health check logged: port={local_port}, result={check_result}")
+                return record_id
+    
+    @_retry_on_locked
+    def insert_health_check_logs(self, rows: List[tuple]) -> None:
+        """
+        批量插入健康检查日志（单个事务）
+        
+        Args:
+            rows: 日志行列表，每行为 (local_port, upstream_server, upstream_port,
+                check_result, response_time_ms, error_message, timestamp)，
+                timestamp 为 Unix 时间戳（毫秒），写入时转换为与 CURRENT_TIMESTAMP 相同的 UTC 格式
+        """
+        with self._get_connection() as conn:
+            with conn:
+                conn.executemany("""
+                    INSERT INTO health_check_log (
+                        local_port, upstream_server, upstream_port,
+                        check_result, response_time_ms, error_message, timestamp
+                    ) VALUES (?, ?, ?, ?, ?, ?, datetime(? / 1000, 'unixepoch'))
+                """, rows)
+                logger.debug(f"Health check logs batch inserted: {len(rows)} rows")
     
     def get_health_check_logs(
         self,
@@ -422,28 +692,68 @@ class Database:
         Returns:
             List[Dict[str, Any]]: 健康检查日志列表
         """
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
+        return list(self.iter_health_check_logs(local_port, limit, offset))
+    
+    def iter_health_check_logs(
+        self,
+        local_port: Optional[int] = None,
+        limit: Optional[int] = None,
+        offset: int = 0
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐页迭代健康检查日志
+        
+        每次在锁内读取 ITER_PAGE_SIZE 条记录后立即释放共享连接，再逐条产出，
+        生成器挂起期间不会阻塞其他线程的数据库写入。后续页按 (timestamp, id)
+        继续读取，期间新插入的记录不会导致重复或遗漏。
+        
+        Args:
+            local_port: 本地端口（可选，None表示查询所有端口）
+            limit: 返回记录数限制（None表示不限制）
+            offset: 偏移量
             
-            if local_port is not None:
-                cursor.execute("""
-                    SELECT * FROM health_check_log
-                    WHERE local_port = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ? OFFSET ?
-                """, (local_port, limit, offset))
-            else:
-                cursor.execute("""
-                    SELECT * FROM health_check_log
-                    ORDER BY timestamp DESC
-                    LIMIT ? OFFSET ?
-                """, (limit, offset))
+        Yields:
+            Dict[str, Any]: 健康检查日志记录
+        """
+        if limit is not None and limit < 0:
+            limit = None  # 与 SQLite 的 LIMIT -1 一致，表示不限制
+        port_clause = "local_port = ?" if local_port is not None else "1"
+        port_params = (local_port,) if local_port is not None else ()
+        remaining = limit
+        last_key = None
+        
+        while remaining is None or remaining > 0:
+            page_size = self.ITER_PAGE_SIZE if remaining is None else min(self.ITER_PAGE_SIZE, remaining)
             
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            with self._get_connection() as conn:
+                if last_key is None:
+                    cursor = conn.execute(f"""
+                        SELECT * FROM health_check_log
+                        WHERE {port_clause}
+                        ORDER BY timestamp DESC, id DESC
+                        LIMIT ? OFFSET ?
+                    """, port_params + (page_size, offset))
+                else:
+                    cursor = conn.execute(f"""
+                        SELECT * FROM health_check_log
+                        WHERE {port_clause} AND (timestamp, id) < (?, ?)
+                        ORDER BY timestamp DESC, id DESC
+                        LIMIT ?
+                    """, port_params + last_key + (page_size,))
+                rows = [dict(row) for row in cursor.fetchall()]
+            
+            # 锁已释放，消费者处理记录期间其他线程可以写入
+            yield from rows
+            
+            if len(rows) < page_size:
+                return
+            if remaining is not None:
+                remaining -= len(rows)
+            last_key = (rows[-1]['timestamp'], rows[-1]['id'])
     
     # ==================== 监控状态操作 ====================
     
+    @_retry_on_locked
     def upsert_monitoring_state(
         self,
         local_port: int,
@@ -463,27 +773,58 @@ class Database:
             last_success_time: 最后成功时间
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO monitoring_state (
-                    local_port, enabled, failure_count, last_check_time, last_success_time
-                ) VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(local_port) DO UPDATE SET
-                    enabled = excluded.enabled,
-                    failure_count = excluded.failure_count,
-                    last_check_time = excluded.last_check_time,
-                    last_success_time = excluded.last_success_time
-            """, (
-                local_port,
-                enabled,
-                failure_count,
-                last_check_time.isoformat() if last_check_time else None,
-                last_success_time.isoformat() if last_success_time else None
-            ))
-            
-            conn.commit()
-            logger.debug(f"Monitoring state updated: port={local_port}, enabled={enabled}")
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    INSERT INTO monitoring_state (
+                        local_port, enabled, failure_count, last_check_time, last_success_time
+                    ) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(local_port) DO UPDATE SET
+                        enabled = excluded.enabled,
+                        failure_count = excluded.failure_count,
+                        last_check_time = excluded.last_check_time,
+                        last_success_time = excluded.last_success_time
+                """, (
+                    local_port,
+                    enabled,
+                    failure_count,
+                    last_check_time.isoformat() if last_check_time else None,
+                    last_success_time.isoformat() if last_success_time else None
+                ))
+                logger.debug(f"Monitoring state updated: port={local_port}, enabled={enabled}")
+    
+    @_retry_on_locked
+    def upsert_monitoring_states(self, rows: List[tuple]) -> None:
+        """
+        批量插入或更新监控状态（单个事务）
+        
+        Args:
+            rows: 状态行列表，每行为 (local_port, enabled, failure_count,
+                last_check_time_ns, last_success_time_ns)，时间为 Unix 纪元纳秒或 None
+        """
+        with self._get_connection() as conn:
+            with conn:
+                conn.executemany("""
+                    INSERT INTO monitoring_state (
+                        local_port, enabled, failure_count, last_check_time, last_success_time
+                    ) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(local_port) DO UPDATE SET
+                        enabled = excluded.enabled,
+                        failure_count = excluded.failure_count,
+                        last_check_time = excluded.last_check_time,
+                        last_success_time = excluded.last_success_time
+                """, [
+                    (
+                        local_port,
+                        enabled,
+                        failure_count,
+                        self._ns_to_isoformat(last_check_time_ns),
+                        self._ns_to_isoformat(last_success_time_ns)
+                    )
+                    for local_port, enabled, failure_count, last_check_time_ns, last_success_time_ns in rows
+                ])
+                logger.debug(f"Monitoring states batch updated: {len(rows)} rows")
     
     def get_monitoring_state(self, local_port: int) -> Optional[Dict[str, Any]]:
         """
@@ -521,6 +862,7 @@ class Database:
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
     
+    @_retry_on_locked
     def delete_monitoring_state(self, local_port: int) -> bool:
         """
         删除指定端口的监控状态
@@ -532,18 +874,17 @@ class Database:
             bool: 是否成功删除
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                DELETE FROM monitoring_state
-                WHERE local_port = ?
-            """, (local_port,))
-            
-            conn.commit()
-            deleted = cursor.rowcount > 0
-            if deleted:
-                logger.info(f"Monitoring state deleted: port={local_port}")
-            return deleted
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    DELETE FROM monitoring_state
+                    WHERE local_port = ?
+                """, (local_port,))
+                deleted = cursor.rowcount > 0
+                if deleted:
+                    logger.info(f"Monitoring state deleted: port={local_port}")
+                return deleted
     
     # ==================== 事务管理 ====================
     
@@ -559,15 +900,13 @@ class Database:
                 cursor.execute("UPDATE ...")
         """
         with self._get_connection() as conn:
-            try:
+            # 连接对象作为上下文管理器：正常退出时提交，异常时回滚
+            with conn:
                 yield conn
-                conn.commit()
-            except Exception:
-                conn.rollback()
-                raise
 
     # ==================== 端口流量统计操作 ====================
     
+    @_retry_on_locked
     def update_port_traffic(
         self,
         local_port: int,
@@ -585,24 +924,23 @@ class Database:
             connections: 连接数
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 更新汇总表
-            cursor.execute("""
-                INSERT INTO port_traffic_summary (
-                    local_port, total_bytes_sent, total_bytes_recv, 
-                    total_connections, last_updated
-                ) VALUES (?, ?, ?, ?, datetime('now'))
-                ON CONFLICT(local_port) DO UPDATE SET
-                    total_bytes_sent = total_bytes_sent + excluded.total_bytes_sent,
-                    total_bytes_recv = total_bytes_recv + excluded.total_bytes_recv,
-                    total_connections = excluded.total_connections,
-                    last_updated = datetime('now')
-            """, (local_port, bytes_sent, bytes_recv, connections))
-            
-            conn.commit()
+            with conn:
+                cursor = conn.cursor()
+                
+                # 更新汇总表
+                cursor.execute("""
+                    INSERT INTO port_traffic_summary (
+                        local_port, total_bytes_sent, total_bytes_recv, 
+                        total_connections, last_updated
+                    ) VALUES (?, ?, ?, ?, datetime('now'))
+                    ON CONFLICT(local_port) DO UPDATE SET
+                        total_bytes_sent = total_bytes_sent + excluded.total_bytes_sent,
+                        total_bytes_recv = total_bytes_recv + excluded.total_bytes_recv,
+                        total_connections = excluded.total_connections,
+                        last_updated = datetime('now')
+                """, (local_port, bytes_sent, bytes_recv, connections))
     
-    def get_port_traffic_summary(self, local_port: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+    def get_port_traffic_summary(self, local_port: Optional[int] = None) -> Dict[int, PortTrafficTuple]:
         """
         获取端口流量汇总
         
@@ -610,30 +948,29 @@ class Database:
             local_port: 本地端口（可选，None表示获取所有端口）
             
         Returns:
-            Dict[int, Dict[str, Any]]: {端口: 流量统计}
+            Dict[int, PortTrafficTuple]: {端口: 流量统计}
         """
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
             if local_port is not None:
                 cursor.execute("""
-                    SELECT * FROM port_traffic_summary
+                    SELECT local_port, total_bytes_sent, total_bytes_recv,
+                           total_connections, last_updated
+                    FROM port_traffic_summary
                     WHERE local_port = ?
                 """, (local_port,))
             else:
-                cursor.execute("SELECT * FROM port_traffic_summary")
+                cursor.execute("""
+                    SELECT local_port, total_bytes_sent, total_bytes_recv,
+                           total_connections, last_updated
+                    FROM port_traffic_summary
+                """)
             
-            rows = cursor.fetchall()
-            result = {}
-            for row in rows:
-                result[row['local_port']] = {
-                    'total_bytes_sent': row['total_bytes_sent'],
-                    'total_bytes_recv': row['total_bytes_recv'],
-                    'total_connections': row['total_connections'],
-                    'last_updated': row['last_updated']
-                }
-            return result
+            # 直接迭代游标，避免 fetchall() 构建中间列表
+            return {p: PortTrafficTuple(s, r, c, u) for p, s, r, c, u in cursor}
     
+    @_retry_on_locked
     def reset_port_traffic(self, local_port: int) -> bool:
         """
         重置端口流量统计
@@ -645,18 +982,18 @@ class Database:
             bool: 是否成功
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE port_traffic_summary
-                SET total_bytes_sent = 0, total_bytes_recv = 0, 
-                    total_connections = 0, last_updated = datetime('now')
-                WHERE local_port = ?
-            """, (local_port,))
-            
-            conn.commit()
-            return cursor.rowcount > 0
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    UPDATE port_traffic_summary
+                    SET total_bytes_sent = 0, total_bytes_recv = 0, 
+                        total_connections = 0, last_updated = datetime('now')
+                    WHERE local_port = ?
+                """, (local_port,))
+                return cursor.rowcount > 0
     
+    @_retry_on_locked
     def delete_port_traffic(self, local_port: int) -> bool:
         """
         删除端口流量统计
@@ -668,15 +1005,14 @@ class Database:
             bool: 是否成功
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                DELETE FROM port_traffic_summary
-                WHERE local_port = ?
-            """, (local_port,))
-            
-            conn.commit()
-            return cursor.rowcount > 0
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    DELETE FROM port_traffic_summary
+                    WHERE local_port = ?
+                """, (local_port,))
+                return cursor.rowcount > 0
 
     # ==================== 出口代理池操作 (v1.2.0) ====================
     
@@ -694,28 +1030,40 @@ class Database:
             cursor = conn.cursor()
             
             cursor.execute("""
-                SELECT COUNT(*) as count FROM upstream_usage
+                SELECT usage_count FROM upstream_usage_summary
                 WHERE upstream_id = ?
             """, (upstream_id,))
             
             row = cursor.fetchone()
-            return row['count'] if row else 0
+            return row['usage_count'] if row else 0
     
+    @_retry_on_locked
     def record_upstream_usage(self, upstream_id: str, local_port: int) -> None:
         """
         记录出口代理使用
         
+        汇总表通过单条 upsert 语句累加计数；仅在 keep_raw_usage 启用时
+        才额外写入 upstream_usage 原始记录。
+        
         Args:
             upstream_id: 出口代理 ID
             local_port: 本地端口
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO upstream_usage (upstream_id, local_port, timestamp)
-                VALUES (?, ?, datetime('now'))
-            """, (upstream_id, local_port))
-            
-            conn.commit()
-            logger.debug(f"Recorded upstream usage: upstream_id={upstream_id}, local_port={local_port}")
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("""
+                    INSERT INTO upstream_usage_summary (upstream_id, usage_count)
+                    VALUES (?, 1)
+                    ON CONFLICT(upstream_id) DO UPDATE SET
+                        usage_count = usage_count + 1,
+                        last_used = CURRENT_TIMESTAMP
+                """, (upstream_id,))
+                
+                if self.keep_raw_usage:
+                    cursor.execute("""
+                        INSERT INTO upstream_usage (upstream_id, local_port)
+                        VALUES (?, ?)
+                    """, (upstream_id, local_port))
+                logger.debug(f"Recorded upstream usage: upstream_id={upstream_id}, local_port={local_port}")
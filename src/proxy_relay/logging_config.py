@@ -2,12 +2,19 @@
 日志配置模块
 
 负责配置Python logging系统，包括日志格式、级别、文件处理器和日志轮转。
+
+日志记录通过 QueueHandler 放入队列，由 QueueListener 的后台线程统一写入文件和控制台，
+业务线程记录日志时不会阻塞在文件 I/O 和日志轮转上。
 """
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
+import time
 from pathlib import Path
+from types import MappingProxyType
 from typing import Optional
 
 
@@ -19,6 +26,25 @@ DEFAULT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 DEFAULT_MAX_BYTES = 100 * 1024 * 1024  # 100MB
 DEFAULT_BACKUP_COUNT = 5  # 保留5个备份文件
 
+# 日志级别名称到 logging 级别的映射（只读）
+_LEVEL_MAP = MappingProxyType({
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARN": logging.WARNING,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL
+})
+_VALID_LEVELS = tuple(_LEVEL_MAP)
+
+# 当前的日志队列监听器（setup_logging 之前为 None）
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+# 是否已注册退出时的 shutdown_logging，以及日志系统是否已关闭
+_atexit_registered = False
+_shutdown_done = False
+
 
 def setup_logging(
     log_file: str,
@@ -47,19 +73,7 @@ def setup_logging(
         IOError: 无法创建日志目录或文件
     """
     # 验证日志级别
-    level_map = {
-        "DEBUG": logging.DEBUG,
-        "INFO": logging.INFO,
-        "WARN": logging.WARNING,
-        "WARNING": logging.WARNING,
-        "ERROR": logging.ERROR,
-        "CRITICAL": logging.CRITICAL
-    }
-    
-    if log_level.upper() not in level_map:
-        raise ValueError(f"Invalid log level: {log_level}. Must be one of {list(level_map.keys())}")
-    
-    level = level_map[log_level.upper()]
+    level = _resolve_level(log_level)
     
     # 确保日志目录存在
     log_dir = os.path.dirname(log_file)
@@ -69,6 +83,9 @@ def setup_logging(
         except Exception as e:
             raise IOError(f"Failed to create log directory {log_dir}: {e}")
     
+    # 停止之前配置的监听器并关闭其处理器
+    _stop_listener(reattach=False)
+    
     # 获取根日志记录器
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
@@ -82,17 +99,17 @@ def setup_logging(
         datefmt=date_format or DEFAULT_DATE_FORMAT
     )
     
-    # 创建文件处理器（带轮转）
+    # 创建文件处理器（带轮转，首次写入时才打开文件）
     try:
         file_handler = logging.handlers.RotatingFileHandler(
             filename=log_file,
             maxBytes=max_bytes,
             backupCount=backup_count,
-            encoding='utf-8'
+            encoding='utf-8',
+            delay=True
         )
         file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
     except Exception as e:
         raise IOError(f"Failed to create log file handler for {log_file}: {e}")
     
@@ -100,7 +117,25 @@ def setup_logging(
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    
+    # 根日志记录器只挂载 QueueHandler，由后台线程写入文件和控制台
+    global _listener, _queue_handler, _atexit_registered, _shutdown_done
+    log_queue = queue.Queue(-1)
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root_logger.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(
+        log_queue,
+        file_handler,
+        console_handler,
+        respect_handler_level=True
+    )
+    _listener.start()
+    _shutdown_done = False
+    
+    # 进程退出时先写完队列中的日志，再由 logging.shutdown 关闭处理器
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
     
     # 记录日志系统初始化信息
     root_logger.info(f"Logging system initialized: level={log_level}, file={log_file}")
@@ -108,6 +143,25 @@ def setup_logging(
     return root_logger
 
 
+def _resolve_level(log_level: str) -> int:
+    """
+    将日志级别名称转换为 logging 级别
+    
+    Args:
+        log_level: 日志级别名称（不区分大小写）
+        
+    Returns:
+        int: logging 级别
+        
+    Raises:
+        ValueError: 日志级别无效
+    """
+    level = _LEVEL_MAP.get(log_level.upper())
+    if level is None:
+        raise ValueError(f"Invalid log level: {log_level}. Must be one of {_VALID_LEVELS}")
+    return level
+
+
 def get_logger(name: str) -> logging.Logger:
     """
     获取指定名称的日志记录器
@@ -131,19 +185,7 @@ def set_log_level(level: str) -> None:
     Raises:
         ValueError: 日志级别无效
     """
-    level_map = {
-        "DEBUG": logging.DEBUG,
-        "INFO": logging.INFO,
-        "WARN": logging.WARNING,
-        "WARNING": logging.WARNING,
-        "ERROR": logging.ERROR,
-        "CRITICAL": logging.CRITICAL
-    }
-    
-    if level.upper() not in level_map:
-        raise ValueError(f"Invalid log level: {level}. Must be one of {list(level_map.keys())}")
-    
-    new_level = level_map[level.upper()]
+    new_level = _resolve_level(level)
     
     # 更新根日志记录器和所有处理器的级别
     root_logger = logging.getLogger()
@@ -152,11 +194,77 @@ def set_log_level(level: str) -> None:
     for handler in root_logger.handlers:
         handler.setLevel(new_level)
     
+    if _listener:
+        for handler in _listener.handlers:
+            handler.setLevel(new_level)
+    
     root_logger.info(f"Log level changed to {level}")
 
 
+def get_log_handlers() -> tuple:
+    """
+    获取实际输出日志的处理器（文件和控制台）
+    
+    Returns:
+        tuple: 处理器元组，未配置日志系统时为空
+    """
+    return _listener.handlers if _listener else ()
+
+
+def flush_logging(timeout: float = 5.0) -> None:
+    """
+    等待队列中的日志全部写出并刷新处理器
+    
+    Args:
+        timeout: 最长等待时间（秒）
+    """
+    if not _listener:
+        return
+    
+    deadline = time.monotonic() + timeout
+    while _listener.queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    
+    for handler in _listener.handlers:
+        handler.flush()
+
+
+def _stop_listener(reattach: bool = True) -> None:
+    """
+    停止后台日志线程（会先写完队列中的日志）
+    
+    Args:
+        reattach: 是否将文件和控制台处理器直接挂回根日志记录器，使之后的日志同步写出；
+            为 False 时关闭这些处理器
+    """
+    global _listener, _queue_handler
+    if not _listener:
+        return
+    
+    _listener.stop()
+    
+    root_logger = logging.getLogger()
+    root_logger.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        if reattach:
+            root_logger.addHandler(handler)
+        else:
+            handler.close()
+    
+    _listener = None
+    _queue_handler = None
+
+
 def shutdown_logging() -> None:
     """
-    关闭日志系统，刷新并关闭所有处理器
+    关闭日志系统，写完队列中的日志后刷新并关闭所有处理器
+    
+    可以重复调用（例如应用主动关闭后进程退出时再次调用），只有第一次生效
     """
+    global _shutdown_done
+    if _shutdown_done:
+        return
+    _shutdown_done = True
+    
+    _stop_listener()
     logging.shutdown()
@@ -4,13 +4,111 @@
 包含系统中使用的所有数据类和验证逻辑。
 """
 
+import os
+import sys
+import weakref
+from types import MappingProxyType
+from array import array
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Optional, List, Dict, Any
-from enum import Enum
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Literal, Mapping, Sequence, get_args
+from enum import StrEnum
 
 
-class LogLevel(str, Enum):
+# 是否校验高频创建的数据对象（UpstreamProxy、MonitoringStatus、ProxyPortInfo、SwitchHistoryEntry）
+# 生产环境可设置 PROXY_RELAY_VALIDATE=0 跳过这些检查；
+# 其中 ProxyPortInfo、SwitchHistoryEntry 的字段类型检查在 python -O 下也会被移除
+_VALIDATE = os.environ.get("PROXY_RELAY_VALIDATE", "1") == "1"
+
+# 枚举型字段的取值类型（Web API 的 Pydantic 模型也使用这些类型，在请求入口处完成校验）
+ProxyProtocol = Literal["socks5", "http", "https", "vless"]
+VlessNetwork = Literal["tcp", "ws", "grpc", "http"]
+SwitchReason = Literal["health_check_failed", "manual", "api_error"]
+HttpMethod = Literal["GET", "POST"]
+ResponseFormatType = Literal["91http", "custom"]
+CheckMode = Literal["tcp", "socks_handshake", "http"]
+CheckMethod = Literal["GET", "HEAD"]
+
+# 合法取值集合
+_PROXY_PROTOCOLS = frozenset(get_args(ProxyProtocol))
+_VLESS_NETWORKS = frozenset(get_args(VlessNetwork))
+_SWITCH_REASONS = frozenset(get_args(SwitchReason))
+_HTTP_METHODS = frozenset(get_args(HttpMethod))
+_RESPONSE_FORMAT_TYPES = frozenset(get_args(ResponseFormatType))
+_CHECK_MODES = frozenset(get_args(CheckMode))
+_CHECK_METHODS = frozenset(get_args(CheckMethod))
+
+# 可选映射/序列字段的共享空值，调用方无需判断 None 即可直接遍历
+_EMPTY_MAP: Mapping[str, Any] = MappingProxyType({})
+_EMPTY_TUPLE: Sequence[str] = ()
+
+# 代理协议到代理URL scheme 的映射
+# 对于 SOCKS5 代理，使用 socks5h:// 让代理服务器解析 DNS，避免本地 DNS 泄露，并且更可靠
+_PROTO_MAP = {"socks5": "socks5h", "http": "http", "https": "https", "vless": "vless"}
+
+
+def _check_port(name: str, value: int, low: int = 1024) -> None:
+    """
+    检查端口号的类型和范围
+    
+    高频创建的数据对象先内联 `type(value) is int and low <= value <= 65535` 这一条件，
+    只有不满足时才调用本函数（以保持原有的 bool 等子类处理和错误信息）
+    
+    Args:
+        name: 字段名（用于错误信息）
+        value: 端口号
+        low: 允许的最小端口号
+        
+    Raises:
+        TypeError: 端口号不是整数
+        ValueError: 端口号超出范围
+    """
+    if not isinstance(value, int):
+        raise TypeError(f"{name} must be an integer")
+    if not (low <= value <= 65535):
+        raise ValueError(f"{name} must be between {low} and 65535, got {value}")
+
+
+def _ns_to_datetime(ns: Optional[int]) -> Optional[datetime]:
+    """
+    将 Unix 纪元纳秒转换为 UTC datetime
+    
+    Args:
+        ns: Unix 纪元纳秒（可为 None）
+        
+    Returns:
+        Optional[datetime]: 带 UTC 时区的 datetime，输入为 None 时返回 None
+    """
+    if ns is None:
+        return None
+    return datetime.fromtimestamp(ns / 1_000_000_000, tz=timezone.utc)
+
+
+def _ensure_unique(values, field_name: str, collection: str) -> set:
+    """
+    单次遍历检查取值不重复
+    
+    Args:
+        values: 待检查的取值
+        field_name: 字段名（用于错误信息）
+        collection: 所在列表名（用于错误信息）
+        
+    Returns:
+        set: 所有取值的集合
+        
+    Raises:
+        ValueError: 存在重复取值
+    """
+    seen = set()
+    add = seen.add
+    for value in values:
+        if value in seen:
+            raise ValueError(f"duplicate {field_name} found in {collection}: {value}")
+        add(value)
+    return seen
+
+
+class LogLevel(StrEnum):
     """日志级别枚举"""
     DEBUG = "DEBUG"
     INFO = "INFO"
@@ -18,19 +116,23 @@ class LogLevel(str, Enum):
     ERROR = "ERROR"
 
 
-@dataclass
+@dataclass(frozen=True, eq=False, slots=True, weakref_slot=True)
 class UpstreamProxy:
-    """上游代理服务器配置"""
+    """
+    上游代理服务器配置
+    
+    实例创建后不可修改：相等比较和哈希基于创建时生成的字段元组，可以作为字典键使用
+    """
     server: str
     port: int
     username: Optional[str] = None
     password: Optional[str] = None
-    protocol: str = "socks5"
+    protocol: ProxyProtocol = "socks5"
     # VLESS 特定配置
     uuid: Optional[str] = None  # VLESS UUID
     flow: Optional[str] = None  # VLESS flow (如 xtls-rprx-vision)
     encryption: str = "none"  # VLESS 加密方式，默认 none
-    network: str = "tcp"  # 传输协议: tcp, ws, grpc, http
+    network: VlessNetwork = "tcp"  # 传输协议: tcp, ws, grpc, http
     # 传输层配置
     tls: bool = False  # 是否启用 TLS
     sni: Optional[str] = None  # TLS SNI
@@ -46,37 +148,113 @@ class UpstreamProxy:
     ws_host: Optional[str] = None  # WebSocket Host
     # gRPC 配置
     grpc_service_name: Optional[str] = None  # gRPC service name
+    # 预先生成的代理URL（见 proxy_url）
+    _proxy_url: str = field(default="", init=False, repr=False, compare=False)
+    # 所有配置字段组成的元组及其哈希值（见 __eq__、__hash__）
+    _key: tuple = field(default=(), init=False, repr=False, compare=False)
+    _hash: int = field(default=0, init=False, repr=False, compare=False)
     
     def __post_init__(self):
         """数据验证"""
+        # 实例是冻结的，派生字段通过 object.__setattr__ 写入
+        setattr_ = object.__setattr__
+        
+        # 协议只有少数几种取值，驻留后各实例共享同一个字符串
+        setattr_(self, "protocol", sys.intern(self.protocol))
+        
+        # 上游代理创建后不再修改，因此在创建时生成代理URL和比较用的字段元组
+        auth = f"{self.username}:{self.password}@" if self.username and self.password else ""
+        setattr_(self, "_proxy_url", f"{_PROTO_MAP.get(self.protocol, self.protocol)}://{auth}{self.server}:{self.port}")
+        key = (
+            self.server, self.port, self.username, self.password, self.protocol,
+            self.uuid, self.flow, self.encryption, self.network,
+            self.tls, self.sni, tuple(self.alpn) if self.alpn is not None else None,
+            self.reality, self.reality_public_key, self.reality_short_id,
+            self.reality_server_name, self.reality_fingerprint,
+            self.ws_path, self.ws_host, self.grpc_service_name
+        )
+        setattr_(self, "_key", key)
+        setattr_(self, "_hash", hash(key))
+        
+        if not _VALIDATE:
+            return
+        
         if not self.server:
             raise ValueError("server cannot be empty")
-        if not isinstance(self.port, int):
-            raise TypeError("port must be an integer")
-        if not (1 <= self.port <= 65535):
-            raise ValueError(f"port must be between 1 and 65535, got {self.port}")
-        if self.protocol not in ["socks5", "http", "https", "vless"]:
-            raise ValueError(f"protocol must be socks5, http, https, or vless, got {self.protocol}")
+        port = self.port
+        if type(port) is not int or not 1 <= port <= 65535:
+            _check_port("port", port, low=1)
+        protocol = self.protocol
+        if protocol != "vless":
+            # 非 VLESS 代理（大多数情况）没有其他需要验证的字段
+            if protocol not in _PROXY_PROTOCOLS:
+                raise ValueError(f"protocol must be socks5, http, https, or vless, got {protocol}")
+            return
         
         # VLESS 协议特定验证
-        if self.protocol == "vless":
-            if not self.uuid:
-                raise ValueError("uuid is required for vless protocol")
-            if self.network not in ["tcp", "ws", "grpc", "http"]:
-                raise ValueError(f"network must be tcp, ws, grpc, or http, got {self.network}")
+        if not self.uuid:
+            raise ValueError("uuid is required for vless protocol")
+        if self.network not in _VLESS_NETWORKS:
+            raise ValueError(f"network must be tcp, ws, grpc, or http, got {self.network}")
+        
+        # Reality 验证
+        if self.reality:
+            if not self.reality_public_key:
+                raise ValueError("reality_public_key is required when reality is enabled")
+            if not self.reality_short_id:
+                raise ValueError("reality_short_id is required when reality is enabled")
+    
+    @classmethod
+    def intern(cls, **kwargs: Any) -> "UpstreamProxy":
+        """
+        获取或创建共享的上游代理实例
+        
+        用于从数据库、上游 API 还原大量重复的只读记录：字段值相同的调用返回同一个实例，
+        只在首次出现时执行 __post_init__。返回的实例可能被其他记录引用，不能修改
+        
+        Args:
+            **kwargs: UpstreamProxy 构造参数
             
-            # Reality 验证
-            if self.reality:
-                if not self.reality_public_key:
-                    raise ValueError("reality_public_key is required when reality is enabled")
-                if not self.reality_short_id:
-                    raise ValueError("reality_short_id is required when reality is enabled")
+        Returns:
+            UpstreamProxy: 上游代理实例
+        """
+        key = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in kwargs.items()
+        ))
+        upstream = _UPSTREAM_INTERN.get(key)
+        if upstream is None:
+            upstream = cls(**kwargs)
+            _UPSTREAM_INTERN[key] = upstream
+        return upstream
+    
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, UpstreamProxy):
+            return NotImplemented
+        return self._hash == other._hash and self._key == other._key
+    
+    def __hash__(self) -> int:
+        return self._hash
+    
+    @property
+    def proxy_url(self) -> str:
+        """
+        代理URL（格式：protocol://[username:password@]server:port）
+        """
+        return self._proxy_url
+
+
+# intern 共享的上游代理实例: {按字段名排序的 (字段名, 值) 元组: UpstreamProxy}
+# 键直接使用元组而不是其哈希值，避免哈希冲突时返回错误的实例；没有记录引用后自动移除
+_UPSTREAM_INTERN: "weakref.WeakValueDictionary[tuple, UpstreamProxy]" = weakref.WeakValueDictionary()
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseFormat:
     """API响应格式配置"""
-    type: str  # "91http", "custom"
+    type: ResponseFormatType
     success_code: Optional[int] = None
     success_field: Optional[str] = None
     success_value: Optional[Any] = None
@@ -88,21 +266,21 @@ class ResponseFormat:
     
     def __post_init__(self):
         """数据验证"""
-        if self.type not in ["91http", "custom"]:
+        if self.type not in _RESPONSE_FORMAT_TYPES:
             raise ValueError(f"response format type must be '91http' or 'custom', got {self.type}")
 
 
-@dataclass
+@dataclass(slots=True)
 class APIProviderConfig:
     """API提供商配置"""
     id: str
     name: str
     enabled: bool
     endpoint: str
-    method: str = "GET"
-    params: Optional[Dict[str, Any]] = None
-    headers: Optional[Dict[str, str]] = None
-    body: Optional[Dict[str, Any]] = None
+    method: HttpMethod = "GET"
+    params: Mapping[str, Any] = field(default_factory=lambda: _EMPTY_MAP)
+    headers: Mapping[str, str] = field(default_factory=lambda: _EMPTY_MAP)
+    body: Optional[Dict[str, Any]] = None  # None 表示不发送请求体，与空对象不同
     timeout: int = 10
     retry_attempts: int = 3
     retry_backoff: int = 2
@@ -116,7 +294,7 @@ class APIProviderConfig:
             raise ValueError("name cannot be empty")
         if not self.endpoint:
             raise ValueError("endpoint cannot be empty")
-        if self.method not in ["GET", "POST"]:
+        if self.method not in _HTTP_METHODS:
             raise ValueError(f"method must be GET or POST, got {self.method}")
         if self.timeout <= 0:
             raise ValueError(f"timeout must be positive, got {self.timeout}")
@@ -124,9 +302,13 @@ class APIProviderConfig:
             raise ValueError(f"retry_attempts must be non-negative, got {self.retry_attempts}")
         if self.retry_backoff <= 0:
             raise ValueError(f"retry_backoff must be positive, got {self.retry_backoff}")
+        if self.params is None:
+            self.params = _EMPTY_MAP
+        if self.headers is None:
+            self.headers = _EMPTY_MAP
 
 
-@dataclass
+@dataclass(slots=True)
 class UpstreamProxyPool:
     """出口代理池配置"""
     id: str  # 唯一标识符
@@ -134,7 +316,7 @@ class UpstreamProxyPool:
     proxy: UpstreamProxy  # 代理配置
     enabled: bool = True  # 是否启用
     description: Optional[str] = None  # 描述
-    tags: Optional[List[str]] = None  # 标签（如：美国、日本、高速）
+    tags: Sequence[str] = _EMPTY_TUPLE  # 标签（如：美国、日本、高速）
     
     def __post_init__(self):
         """数据验证"""
@@ -144,9 +326,11 @@ class UpstreamProxyPool:
             raise ValueError("name cannot be empty")
         if not isinstance(self.proxy, UpstreamProxy):
             raise TypeError("proxy must be an UpstreamProxy instance")
+        if self.tags is None:
+            self.tags = _EMPTY_TUPLE
 
 
-@dataclass
+@dataclass(slots=True)
 class ProxyConfig:
     """代理配置"""
     local_port: int
@@ -161,10 +345,7 @@ class ProxyConfig:
     
     def __post_init__(self):
         """数据验证"""
-        if not isinstance(self.local_port, int):
-            raise TypeError("local_port must be an integer")
-        if not (1024 <= self.local_port <= 65535):
-            raise ValueError(f"local_port must be between 1024 and 65535, got {self.local_port}")
+        _check_port("local_port", self.local_port)
         if not self.name:
             raise ValueError("name cannot be empty")
         
@@ -177,7 +358,7 @@ class ProxyConfig:
             raise ValueError("monitoring cannot be enabled for direct mode proxies")
 
 
-@dataclass
+@dataclass(slots=True)
 class WebAuthConfig:
     """Web认证配置"""
     enabled: bool = True
@@ -190,40 +371,46 @@ class WebAuthConfig:
             raise ValueError("password_hash is required when authentication is enabled")
 
 
-@dataclass
+@dataclass(slots=True)
 class SystemConfig:
     """系统配置"""
     web_port: int = 8080
     web_auth: Optional[WebAuthConfig] = None
-    log_level: str = "INFO"
+    log_level: LogLevel = LogLevel.INFO
     log_file: str = "/var/log/proxy-relay/app.log"
     database: str = "/var/lib/proxy-relay/data.db"
+    keep_raw_usage: bool = False  # 是否保留出口代理使用的原始记录（默认只维护汇总计数）
+    singbox_config_path: str = "/etc/sing-box/config.json"  # 生成的 sing-box 配置文件路径
     
     def __post_init__(self):
         """数据验证"""
-        if not isinstance(self.web_port, int):
-            raise TypeError("web_port must be an integer")
-        if not (1024 <= self.web_port <= 65535):
-            raise ValueError(f"web_port must be between 1024 and 65535, got {self.web_port}")
-        if self.log_level not in ["DEBUG", "INFO", "WARN", "ERROR"]:
-            raise ValueError(f"log_level must be DEBUG, INFO, WARN, or ERROR, got {self.log_level}")
+        _check_port("web_port", self.web_port)
+        # 由枚举完成取值校验，字符串同时转换为枚举成员
+        try:
+            self.log_level = LogLevel(self.log_level)
+        except ValueError:
+            raise ValueError(f"log_level must be DEBUG, INFO, WARN, or ERROR, got {self.log_level}") from None
         if not self.log_file:
             raise ValueError("log_file cannot be empty")
         if not self.database:
             raise ValueError("database cannot be empty")
+        if not self.singbox_config_path:
+            raise ValueError("singbox_config_path cannot be empty")
         
         # 设置默认的 web_auth
         if self.web_auth is None:
             self.web_auth = WebAuthConfig()
 
 
-@dataclass
+@dataclass(slots=True)
 class MonitoringConfig:
     """监控配置"""
     check_interval: int = 30
     failure_threshold: int = 3
     check_timeout: int = 10
     check_url: str = "http://www.google.com"
+    check_mode: CheckMode = "http"  # 检查方式: tcp, socks_handshake, http
+    check_method: CheckMethod = "GET"  # http 检查方式使用的请求方法: GET, HEAD
     
     def __post_init__(self):
         """数据验证"""
@@ -235,9 +422,13 @@ class MonitoringConfig:
             raise ValueError(f"check_timeout must be positive, got {self.check_timeout}")
         if not self.check_url:
             raise ValueError("check_url cannot be empty")
+        if self.check_mode not in _CHECK_MODES:
+            raise ValueError(f"Invalid check_mode: {self.check_mode}")
+        if self.check_method not in _CHECK_METHODS:
+            raise ValueError(f"Invalid check_method: {self.check_method}")
 
 
-@dataclass
+@dataclass(slots=True)
 class Config:
     """完整的系统配置"""
     system: SystemConfig
@@ -259,23 +450,18 @@ class Config:
         if not isinstance(self.proxies, list):
             raise TypeError("proxies must be a list")
         
-        # 验证代理端口不重复
-        ports = [p.local_port for p in self.proxies]
-        if len(ports) != len(set(ports)):
-            raise ValueError("duplicate local_port found in proxies")
+        # 验证API提供商ID和出口代理池ID不重复
+        provider_ids = _ensure_unique((p.id for p in self.api_providers), "id", "api_providers")
+        upstream_ids = _ensure_unique((u.id for u in self.upstream_proxies), "id", "upstream_proxies")
         
-        # 验证API提供商ID不重复
-        provider_ids = [p.id for p in self.api_providers]
-        if len(provider_ids) != len(set(provider_ids)):
-            raise ValueError("duplicate id found in api_providers")
-        
-        # 验证出口代理池ID不重复
-        upstream_ids = [u.id for u in self.upstream_proxies]
-        if len(upstream_ids) != len(set(upstream_ids)):
-            raise ValueError("duplicate id found in upstream_proxies")
-        
-        # 验证所有代理引用的API提供商存在（如果指定了 API 提供商）
+        # 单次遍历代理列表：验证端口不重复，以及引用的API提供商（如果指定了 API 提供商）存在
+        ports = set()
+        add_port = ports.add
         for proxy in self.proxies:
+            if proxy.local_port in ports:
+                raise ValueError(f"duplicate local_port found in proxies: {proxy.local_port}")
+            add_port(proxy.local_port)
+            
             if proxy.api_provider_id is not None and proxy.api_provider_id not in provider_ids:
                 raise ValueError(f"proxy {proxy.name} references non-existent api_provider_id: {proxy.api_provider_id}")
             
@@ -288,27 +474,38 @@ class Config:
                 raise TypeError(f"proxy {proxy.name} upstream must be an UpstreamProxy instance or None")
 
 
-@dataclass
+@dataclass(slots=True)
 class MonitoringStatus:
     """监控状态"""
     local_port: int
     enabled: bool
     failure_count: int = 0
-    last_check_time: Optional[datetime] = None
-    last_success_time: Optional[datetime] = None
+    last_check_time_ns: Optional[int] = None  # 最后检查时间（Unix 纪元纳秒，time.time_ns()）
+    last_success_time_ns: Optional[int] = None  # 最后成功时间（Unix 纪元纳秒）
     current_upstream: Optional[UpstreamProxy] = None
     
     def __post_init__(self):
         """数据验证"""
-        if not isinstance(self.local_port, int):
-            raise TypeError("local_port must be an integer")
-        if not (1024 <= self.local_port <= 65535):
-            raise ValueError(f"local_port must be between 1024 and 65535, got {self.local_port}")
+        if not _VALIDATE:
+            return
+        local_port = self.local_port
+        if type(local_port) is not int or not 1024 <= local_port <= 65535:
+            _check_port("local_port", local_port)
         if self.failure_count < 0:
             raise ValueError(f"failure_count must be non-negative, got {self.failure_count}")
+    
+    @property
+    def last_check_time(self) -> Optional[datetime]:
+        """最后检查时间（UTC）"""
+        return _ns_to_datetime(self.last_check_time_ns)
+    
+    @property
+    def last_success_time(self) -> Optional[datetime]:
+        """最后成功时间（UTC）"""
+        return _ns_to_datetime(self.last_success_time_ns)
 
 
-@dataclass
+@dataclass(slots=True)
 class ProxyPortInfo:
     """代理端口信息"""
     local_port: int
@@ -320,38 +517,144 @@ class ProxyPortInfo:
     
     def __post_init__(self):
         """数据验证"""
-        if not isinstance(self.local_port, int):
-            raise TypeError("local_port must be an integer")
-        if not (1024 <= self.local_port <= 65535):
-            raise ValueError(f"local_port must be between 1024 and 65535, got {self.local_port}")
+        if not _VALIDATE:
+            return
+        local_port = self.local_port
+        if type(local_port) is not int or not 1024 <= local_port <= 65535:
+            _check_port("local_port", local_port)
         if not self.name:
             raise ValueError("name cannot be empty")
-        if not isinstance(self.upstream, UpstreamProxy):
-            raise TypeError("upstream must be an UpstreamProxy instance")
+        # 类型检查只在调试模式下执行（python -O 时编译器会移除）
+        if __debug__:
+            if not isinstance(self.upstream, UpstreamProxy):
+                raise TypeError("upstream must be an UpstreamProxy instance")
 
 
-@dataclass
+@dataclass(slots=True)
 class SwitchHistoryEntry:
     """代理切换历史记录"""
     id: int
     local_port: int
     old_upstream: Optional[UpstreamProxy]
     new_upstream: UpstreamProxy
-    reason: str
-    timestamp: datetime
+    reason: SwitchReason
+    timestamp_ns: int  # 切换时间（Unix 纪元纳秒）
     success: bool
     
     def __post_init__(self):
         """数据验证"""
-        if not isinstance(self.local_port, int):
-            raise TypeError("local_port must be an integer")
-        if not (1024 <= self.local_port <= 65535):
-            raise ValueError(f"local_port must be between 1024 and 65535, got {self.local_port}")
-        if not isinstance(self.new_upstream, UpstreamProxy):
-            raise TypeError("new_upstream must be an UpstreamProxy instance")
-        if self.old_upstream is not None and not isinstance(self.old_upstream, UpstreamProxy):
-            raise TypeError("old_upstream must be an UpstreamProxy instance or None")
-        if self.reason not in ["health_check_failed", "manual", "api_error"]:
+        if not _VALIDATE:
+            return
+        local_port = self.local_port
+        if type(local_port) is not int or not 1024 <= local_port <= 65535:
+            _check_port("local_port", local_port)
+        if self.reason not in _SWITCH_REASONS:
             raise ValueError(f"reason must be 'health_check_failed', 'manual', or 'api_error', got {self.reason}")
-        if not isinstance(self.timestamp, datetime):
-            raise TypeError("timestamp must be a datetime instance")
+        # 类型检查只在调试模式下执行（python -O 时编译器会移除）
+        if __debug__:
+            if not isinstance(self.new_upstream, UpstreamProxy):
+                raise TypeError("new_upstream must be an UpstreamProxy instance")
+            if self.old_upstream is not None and not isinstance(self.old_upstream, UpstreamProxy):
+                raise TypeError("old_upstream must be an UpstreamProxy instance or None")
+            if not isinstance(self.timestamp_ns, int):
+                raise TypeError("timestamp_ns must be an integer")
+    
+    @property
+    def timestamp(self) -> datetime:
+        """切换时间（UTC）"""
+        return _ns_to_datetime(self.timestamp_ns)
+
+
+class SwitchHistoryBatch:
+    """
+    代理切换历史的列式存储（Struct of Arrays）
+    
+    批量查询结果按列保存在 array 中，上游代理去重后放在 upstreams 表里，各行只保存其下标，
+    避免为每一行创建 SwitchHistoryEntry。需要行对象时通过 row(i) 按需构造
+    """
+    
+    __slots__ = (
+        "ids", "local_ports", "timestamps_ns", "reasons", "successes",
+        "old_upstream_ids", "new_upstream_ids", "upstreams", "_upstream_index"
+    )
+    
+    def __init__(self):
+        self.ids = array("q")
+        self.local_ports = array("I")
+        self.timestamps_ns = array("q")
+        self.reasons: List[SwitchReason] = []
+        self.successes = array("b")
+        # 旧上游代理下标，-1 表示无旧上游代理
+        self.old_upstream_ids = array("i")
+        self.new_upstream_ids = array("I")
+        # 去重后的上游代理表
+        self.upstreams: List[UpstreamProxy] = []
+        # {id(upstream): upstreams 中的下标}，upstreams 持有引用，id 在批次生命周期内不会复用
+        self._upstream_index: Dict[int, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def _upstream_id(self, upstream: UpstreamProxy) -> int:
+        """返回上游代理在去重表中的下标，首次出现时加入表中"""
+        index = self._upstream_index.get(id(upstream))
+        if index is None:
+            index = len(self.upstreams)
+            self.upstreams.append(upstream)
+            self._upstream_index[id(upstream)] = index
+        return index
+    
+    def append(
+        self,
+        id: int,
+        local_port: int,
+        old_upstream: Optional[UpstreamProxy],
+        new_upstream: UpstreamProxy,
+        reason: SwitchReason,
+        timestamp_ns: int,
+        success: bool
+    ) -> None:
+        """
+        追加一行记录
+        
+        Args:
+            id: 记录ID
+            local_port: 本地端口
+            old_upstream: 旧上游代理（可为 None）
+            new_upstream: 新上游代理
+            reason: 切换原因
+            timestamp_ns: 切换时间（Unix 纪元纳秒）
+            success: 是否成功
+        """
+        self.ids.append(id)
+        self.local_ports.append(local_port)
+        self.timestamps_ns.append(timestamp_ns)
+        self.reasons.append(reason)
+        self.successes.append(1 if success else 0)
+        self.old_upstream_ids.append(-1 if old_upstream is None else self._upstream_id(old_upstream))
+        self.new_upstream_ids.append(self._upstream_id(new_upstream))
+    
+    def timestamp(self, i: int) -> datetime:
+        """第 i 行的切换时间（UTC）"""
+        return _ns_to_datetime(self.timestamps_ns[i])
+    
+    def row(self, i: int) -> SwitchHistoryEntry:
+        """
+        按需构造第 i 行的 SwitchHistoryEntry
+        
+        Args:
+            i: 行下标
+            
+        Returns:
+            SwitchHistoryEntry: 切换历史记录
+        """
+        old_id = self.old_upstream_ids[i]
+        return SwitchHistoryEntry(
+            id=self.ids[i],
+            local_port=self.local_ports[i],
+            old_upstream=None if old_id < 0 else self.upstreams[old_id],
+            new_upstream=self.upstreams[self.new_upstream_ids[i]],
+            reason=self.reasons[i],
+            timestamp_ns=self.timestamps_ns[i],
+            success=bool(self.successes[i])
+        )
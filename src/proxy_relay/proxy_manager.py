@@ -5,18 +5,239 @@
 """
 
 import os
+import sys
 import json
 import signal
 import subprocess
+import time
 import logging
-from typing import Optional, List, Dict, Any
+import tempfile
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, List, Dict, Any, Tuple
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，未安装时使用标准库 json
+    orjson = None
+
+try:
+    from jeepney import DBusAddress, DBusErrorResponse, MatchRule, message_bus, new_method_call
+    from jeepney.wrappers import unwrap_msg
+    from jeepney.io.blocking import open_dbus_connection
+except ImportError:  # jeepney 是可选依赖，未安装时通过 systemctl 管理服务
+    open_dbus_connection = None
+
+from .api_client import APIClient
 from .config_manager import ConfigManager
 from .models import Config, ProxyConfig, UpstreamProxy, ProxyPortInfo
 
 logger = logging.getLogger(__name__)
 
+# systemd 管理接口与 sing-box 单元名
+_SYSTEMD_MANAGER = (
+    DBusAddress(
+        '/org/freedesktop/systemd1',
+        bus_name='org.freedesktop.systemd1',
+        interface='org.freedesktop.systemd1.Manager'
+    )
+    if open_dbus_connection is not None else None
+)
+_SINGBOX_UNIT = "sing-box.service"
+
+# systemd 在任务（job）结束时发出的 JobRemoved 信号，参数为 (id, 任务路径, 单元名, 结果)
+_JOB_REMOVED_RULE = (
+    MatchRule(
+        type='signal',
+        sender='org.freedesktop.systemd1',
+        interface='org.freedesktop.systemd1.Manager',
+        member='JobRemoved',
+        path='/org/freedesktop/systemd1'
+    )
+    if open_dbus_connection is not None else None
+)
+
+# inbound/outbound 标签前缀（驻留字符串，标签由前缀直接拼接端口号）
+_INBOUND_PREFIX = sys.intern("socks-")
+_OUTBOUND_PREFIX = sys.intern("upstream-")
+
+# 上游代理协议到 sing-box outbound 类型的映射，未列出的协议同名
+_PROTO_MAP = {"socks5": "socks"}
+
+# sing-box 日志配置
+_SINGBOX_LOG = {"level": "info", "timestamp": True}
+
+
+def _dump_singbox_config(config: Dict[str, Any]) -> bytes:
+    """
+    将 sing-box 配置序列化为 UTF-8 编码的 JSON（缩进 2 格，不转义非 ASCII 字符）
+    
+    Args:
+        config: sing-box配置字典
+        
+    Returns:
+        bytes: JSON 字节
+    """
+    if orjson is not None:
+        return orjson.dumps(config, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(config, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def _build_direct_outbound(tag: str, upstream_proxy: None) -> Dict[str, Any]:
+    """
+    生成 direct 模式的 outbound：直接连接，不使用上游代理
+    
+    Args:
+        tag: outbound 标签
+        upstream_proxy: 未使用（与其他 outbound 生成函数的参数保持一致）
+        
+    Returns:
+        Dict[str, Any]: outbound 配置
+    """
+    return {
+        "type": "direct",
+        "tag": tag
+    }
+
+
+def _build_vless_outbound(tag: str, upstream_proxy: UpstreamProxy) -> Dict[str, Any]:
+    """
+    生成 VLESS 上游代理的 outbound（含 TLS/Reality 和传输层配置）
+    
+    Args:
+        tag: outbound 标签
+        upstream_proxy: 上游代理配置
+        
+    Returns:
+        Dict[str, Any]: outbound 配置
+    """
+    # VLESS 协议配置
+    outbound = {
+        "type": "vless",
+        "tag": tag,
+        "server": upstream_proxy.server,
+        "server_port": upstream_proxy.port,
+        "uuid": upstream_proxy.uuid,
+        "domain_strategy": "ipv4_only"  # 强制使用 IPv4，避免 IPv6 连接问题
+    }
+    
+    # Flow 字段（仅在有值时添加）
+    if upstream_proxy.flow:
+        outbound["flow"] = upstream_proxy.flow
+    
+    # TLS 配置
+    if upstream_proxy.tls:
+        tls_config = {
+            "enabled": True
+        }
+        
+        # Reality 配置
+        if upstream_proxy.reality:
+            reality_config = {
+                "enabled": True
+            }
+            if upstream_proxy.reality_public_key:
+                reality_config["public_key"] = upstream_proxy.reality_public_key
+            if upstream_proxy.reality_short_id:
+                reality_config["short_id"] = upstream_proxy.reality_short_id
+            
+            # Reality 模式下，server_name 必须设置
+            # 优先使用 reality_server_name，其次使用 sni
+            server_name = upstream_proxy.reality_server_name or upstream_proxy.sni
+            if server_name:
+                tls_config["server_name"] = server_name
+            
+            tls_config["reality"] = reality_config
+            
+            # uTLS fingerprint (Reality 通常需要)
+            if upstream_proxy.reality_fingerprint:
+                tls_config["utls"] = {
+                    "enabled": True,
+                    "fingerprint": upstream_proxy.reality_fingerprint
+                }
+            
+            logger.debug(f"Enabled Reality with server_name={server_name}")
+        else:
+            # 非 Reality 模式的 TLS 配置
+            if upstream_proxy.sni:
+                tls_config["server_name"] = upstream_proxy.sni
+            if upstream_proxy.alpn:
+                tls_config["alpn"] = upstream_proxy.alpn
+        
+        outbound["tls"] = tls_config
+    
+    # 传输层配置
+    if upstream_proxy.network and upstream_proxy.network != "tcp":
+        transport_config = {
+            "type": upstream_proxy.network
+        }
+        
+        if upstream_proxy.network == "ws":
+            # WebSocket 配置
+            if upstream_proxy.ws_path:
+                transport_config["path"] = upstream_proxy.ws_path
+            if upstream_proxy.ws_host:
+                transport_config["headers"] = {
+                    "Host": upstream_proxy.ws_host
+                }
+        elif upstream_proxy.network == "grpc":
+            # gRPC 配置
+            if upstream_proxy.grpc_service_name:
+                transport_config["service_name"] = upstream_proxy.grpc_service_name
+        
+        outbound["transport"] = transport_config
+    
+    return outbound
+
+
+def _build_proxy_outbound(tag: str, upstream_proxy: UpstreamProxy) -> Dict[str, Any]:
+    """
+    生成 SOCKS5/HTTP/HTTPS 上游代理的 outbound
+    
+    Args:
+        tag: outbound 标签
+        upstream_proxy: 上游代理配置
+        
+    Returns:
+        Dict[str, Any]: outbound 配置
+    """
+    # 其他代理协议（SOCKS5, HTTP, HTTPS）
+    # sing-box 使用 "socks" 而不是 "socks5"
+    outbound = {
+        "type": _PROTO_MAP.get(upstream_proxy.protocol, upstream_proxy.protocol),
+        "tag": tag,
+        "server": upstream_proxy.server,
+        "server_port": upstream_proxy.port
+    }
+    
+    # 如果需要认证，添加认证信息
+    if upstream_proxy.username and upstream_proxy.password:
+        outbound["username"] = upstream_proxy.username
+        outbound["password"] = upstream_proxy.password
+    
+    return outbound
+
+
+# 按上游代理协议选择 outbound 生成函数，未列出的协议使用 _build_proxy_outbound
+_OUTBOUND_BUILDERS = {"vless": _build_vless_outbound}
+
+
+_SWITCH_REASONS = ('health_check_failed', 'manual', 'api_error')
+
+
+class _SwitchBatch:
+    """合并到同一次配置写入和重载中的一批上游代理切换"""
+    
+    __slots__ = ("changes", "done", "error")
+    
+    def __init__(self):
+        # (本地端口, 新的上游代理, 切换原因)，按提交顺序排列
+        self.changes: List[Tuple[int, UpstreamProxy, str]] = []
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+
 
 class ProxyManager:
     """代理管理器类"""
@@ -24,6 +245,15 @@ class ProxyManager:
     DEFAULT_SINGBOX_CONFIG_PATH = "/etc/sing-box/config.json"
     DEFAULT_SINGBOX_PID_FILE = "/var/run/sing-box.pid"
     
+    # 单个切换请求等待合并其他并发切换的时间（秒）
+    SWITCH_DEBOUNCE = 0.1
+    
+    # 并发验证上游代理的最大线程数
+    MAX_VALIDATION_WORKERS = 16
+    
+    # 通过 D-Bus 重载 sing-box 时等待 systemd 任务完成的最长时间（秒）
+    SYSTEMD_JOB_TIMEOUT = 30
+    
     def __init__(self, config_manager: ConfigManager, api_client=None, database=None):
         """
         初始化代理管理器
@@ -39,12 +269,54 @@ class ProxyManager:
         self.singbox_config_path = self.DEFAULT_SINGBOX_CONFIG_PATH
         self.singbox_pid_file = self.DEFAULT_SINGBOX_PID_FILE
         
-        # 加载当前配置
+        # 到 systemd 的 D-Bus 系统总线连接（首次使用时建立）
+        self._sd_bus = None
+        
+        # 各代理端口生成的 (inbound, outbound, rule) 片段: {_fragment_key(): 片段}
+        self._proxy_fragment_cache: Dict[tuple, Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]] = {}
+        # 最近一次生成的 sing-box 配置序列化结果: (各代理片段键组成的元组, JSON 字节)
+        self._serialized_cache: Optional[Tuple[tuple, bytes]] = None
+        # 最近一次生成的 sing-box 配置、对应的片段键元组及端口在其中的位置，
+        # 单个端口切换时在此基础上替换该端口的片段
+        self._last_config: Optional[Dict[str, Any]] = None
+        self._last_config_keys: tuple = ()
+        self._last_config_positions: Dict[int, int] = {}
+        # 最近一次成功应用（或回滚）后配置文件的内容，用于下次应用失败时回滚
+        self._applied_payload: Optional[bytes] = None
+        # 成功应用后配置文件的 (修改时间纳秒, 大小)，用于判断文件是否仍是 sing-box 正在使用的配置
+        self._applied_stat: Optional[Tuple[int, int]] = None
+        
+        # 正在收集的切换批次（首个加入的调用方负责执行）
+        self._pending_switches: Optional[_SwitchBatch] = None
+        self._pending_lock = threading.Lock()
+        # 串行化配置修改、sing-box 配置生成/写入/重载/回滚的锁（可重入：切换时在持锁状态下应用配置）
+        self._apply_lock = threading.RLock()
+        
+        # 提供商 ID -> API 客户端
+        self._api_clients: Dict[str, APIClient] = {}
+        
+        # 加载当前配置（配置管理器已加载且文件未变化时直接复用）
         try:
-            self.config = self.config_manager.load_config()
+            self.config = self.config_manager.reload_config()
         except FileNotFoundError:
             # 如果配置文件不存在，使用空配置
             self.config = None
+        
+        # 跟随配置管理器之后加载或保存的配置（注册时以当前配置立即调用一次）
+        self.config_manager.on_change(self._on_config_change)
+        
+        # sing-box 配置文件路径取自系统配置（修改后需重启服务生效）
+        if self.config:
+            self.singbox_config_path = self.config.system.singbox_config_path
+    
+    def _on_config_change(self, config: Config) -> None:
+        """
+        配置变更回调，更新当前配置（按端口/提供商 ID 的查询使用配置管理器的索引）
+        
+        Args:
+            config: 新的配置对象
+        """
+        self.config = config
     
     def generate_singbox_config(self) -> Dict[str, Any]:
         """
@@ -66,165 +338,30 @@ class ProxyManager:
         outbounds = []
         rules = []
         
-        # 为每个代理端口生成配置
+        # 为每个代理端口生成配置：配置未变化的代理直接复用上次生成的片段，
+        # 本次未用到的片段随旧缓存一起丢弃
+        fragment_cache = {}
+        keys = []
         for proxy in self.config.proxies:
-            logger.debug(f"Generating configuration for proxy: {proxy.name} (port {proxy.local_port})")
-            
-            # 生成inbound配置（本地SOCKS5代理）
-            inbound_tag = f"socks-{proxy.local_port}"
-            inbound = {
-                "type": "socks",
-                "tag": inbound_tag,
-                "listen": "0.0.0.0",
-                "listen_port": proxy.local_port
-            }
-            
-            # 如果配置了本地认证，添加认证信息
-            if proxy.local_username and proxy.local_password:
-                inbound["users"] = [{
-                    "username": proxy.local_username,
-                    "password": proxy.local_password
-                }]
-                logger.debug(f"Added local authentication for proxy {proxy.name}")
+            upstream_proxy = self._resolve_upstream(proxy)
+            key = self._fragment_key(proxy, upstream_proxy)
+            fragments = self._proxy_fragment_cache.get(key)
+            if fragments is None:
+                fragments = self._build_proxy_fragments(proxy, upstream_proxy)
+            fragment_cache[key] = fragments
+            keys.append(key)
             
+            inbound, outbound, rule = fragments
             inbounds.append(inbound)
-            
-            # 解析上游代理：优先使用 upstream_id，其次使用 upstream
-            upstream_proxy = None
-            if proxy.upstream_id:
-                # 从出口代理池中查找
-                upstream_proxy = self._get_upstream_by_id(proxy.upstream_id)
-                if not upstream_proxy:
-                    logger.error(f"Upstream proxy with id '{proxy.upstream_id}' not found for proxy {proxy.name}")
-                    raise RuntimeError(f"Upstream proxy with id '{proxy.upstream_id}' not found")
-                logger.debug(f"Resolved upstream_id '{proxy.upstream_id}' to {upstream_proxy.server}:{upstream_proxy.port}")
-            elif proxy.upstream:
-                # 使用直接配置的上游代理（向后兼容）
-                upstream_proxy = proxy.upstream
-                logger.debug(f"Using directly configured upstream for proxy {proxy.name}")
-            
-            # 生成outbound配置
-            outbound_tag = f"upstream-{proxy.local_port}"
-            
-            if upstream_proxy is None:
-                # Direct 模式：直接连接，不使用上游代理
-                outbound = {
-                    "type": "direct",
-                    "tag": outbound_tag
-                }
-                logger.debug(f"Using direct mode for proxy {proxy.name}")
-            elif upstream_proxy.protocol == "vless":
-                # VLESS 协议配置
-                outbound = {
-                    "type": "vless",
-                    "tag": outbound_tag,
-                    "server": upstream_proxy.server,
-                    "server_port": upstream_proxy.port,
-                    "uuid": upstream_proxy.uuid,
-                    "domain_strategy": "ipv4_only"  # 强制使用 IPv4，避免 IPv6 连接问题
-                }
-                
-                # Flow 字段（仅在有值时添加）
-                if upstream_proxy.flow:
-                    outbound["flow"] = upstream_proxy.flow
-                
-                # TLS 配置
-                if upstream_proxy.tls:
-                    tls_config = {
-                        "enabled": True
-                    }
-                    
-                    # Reality 配置
-                    if upstream_proxy.reality:
-                        reality_config = {
-                            "enabled": True
-                        }
-                        if upstream_proxy.reality_public_key:
-                            reality_config["public_key"] = upstream_proxy.reality_public_key
-                        if upstream_proxy.reality_short_id:
-                            reality_config["short_id"] = upstream_proxy.reality_short_id
-                        
-                        # Reality 模式下，server_name 必须设置
-                        # 优先使用 reality_server_name，其次使用 sni
-                        server_name = upstream_proxy.reality_server_name or upstream_proxy.sni
-                        if server_name:
-                            tls_config["server_name"] = server_name
-                        
-                        tls_config["reality"] = reality_config
-                        
-                        # uTLS fingerprint (Reality 通常需要)
-                        if upstream_proxy.reality_fingerprint:
-                            tls_config["utls"] = {
-                                "enabled": True,
-                                "fingerprint": upstream_proxy.reality_fingerprint
-                            }
-                        
-                        logger.debug(f"Enabled Reality for proxy {proxy.name} with server_name={server_name}")
-                    else:
-                        # 非 Reality 模式的 TLS 配置
-                        if upstream_proxy.sni:
-                            tls_config["server_name"] = upstream_proxy.sni
-                        if upstream_proxy.alpn:
-                            tls_config["alpn"] = upstream_proxy.alpn
-                    
-                    outbound["tls"] = tls_config
-                
-                # 传输层配置
-                if upstream_proxy.network and upstream_proxy.network != "tcp":
-                    transport_config = {
-                        "type": upstream_proxy.network
-                    }
-                    
-                    if upstream_proxy.network == "ws":
-                        # WebSocket 配置
-                        if upstream_proxy.ws_path:
-                            transport_config["path"] = upstream_proxy.ws_path
-                        if upstream_proxy.ws_host:
-                            transport_config["headers"] = {
-                                "Host": upstream_proxy.ws_host
-                            }
-                    elif upstream_proxy.network == "grpc":
-                        # gRPC 配置
-                        if upstream_proxy.grpc_service_name:
-                            transport_config["service_name"] = upstream_proxy.grpc_service_name
-                    
-                    outbound["transport"] = transport_config
-                
-                logger.debug(f"Using VLESS protocol for proxy {proxy.name}")
-            else:
-                # 其他代理协议（SOCKS5, HTTP, HTTPS）
-                # sing-box 使用 "socks" 而不是 "socks5"
-                outbound_type = "socks" if upstream_proxy.protocol == "socks5" else upstream_proxy.protocol
-                outbound = {
-                    "type": outbound_type,
-                    "tag": outbound_tag,
-                    "server": upstream_proxy.server,
-                    "server_port": upstream_proxy.port
-                }
-                
-                # 如果需要认证，添加认证信息
-                if upstream_proxy.username and upstream_proxy.password:
-                    outbound["username"] = upstream_proxy.username
-                    outbound["password"] = upstream_proxy.password
-                    logger.debug(f"Added upstream authentication for proxy {proxy.name}")
-            
             outbounds.append(outbound)
-            
-            # 生成路由规则（将inbound流量路由到对应的outbound）
-            rule = {
-                "inbound": [inbound_tag],
-                "outbound": outbound_tag
-            }
             rules.append(rule)
+        self._proxy_fragment_cache = fragment_cache
         
         logger.info(f"Generated sing-box configuration: {len(inbounds)} inbounds, {len(outbounds)} outbounds, {len(rules)} rules")
         
         # 构建完整的sing-box配置
         singbox_config = {
-            "log": {
-                "level": "info",
-                "timestamp": True
-            },
+            "log": dict(_SINGBOX_LOG),
             "inbounds": inbounds,
             "outbounds": outbounds,
             "route": {
@@ -232,8 +369,171 @@ class ProxyManager:
             }
         }
         
+        self._last_config = singbox_config
+        self._last_config_keys = tuple(keys)
+        self._last_config_positions = {proxy.local_port: i for i, proxy in enumerate(self.config.proxies)}
+        
         return singbox_config
     
+    def _patch_singbox_config(self, proxy_config: ProxyConfig) -> Optional[Dict[str, Any]]:
+        """
+        在最近一次生成的 sing-box 配置上只替换一个代理端口的片段
+        
+        其他端口沿用上次生成的片段，不再逐个解析上游代理和计算缓存键。返回新的配置字典
+        （列表为副本，上次返回的配置和缓存的片段都不会被修改）
+        
+        Args:
+            proxy_config: 发生变化的代理配置
+            
+        Returns:
+            Optional[Dict[str, Any]]: 替换后的sing-box配置；尚未生成过配置或代理端口列表已变化时返回None
+        """
+        last_config = self._last_config
+        if last_config is None or not self.config:
+            return None
+        
+        i = self._last_config_positions.get(proxy_config.local_port)
+        proxies = self.config.proxies
+        if i is None or len(proxies) != len(self._last_config_keys) or proxies[i] is not proxy_config:
+            return None
+        
+        upstream_proxy = self._resolve_upstream(proxy_config)
+        key = self._fragment_key(proxy_config, upstream_proxy)
+        fragments = self._proxy_fragment_cache.get(key)
+        if fragments is None:
+            fragments = self._build_proxy_fragments(proxy_config, upstream_proxy)
+            self._proxy_fragment_cache.pop(self._last_config_keys[i], None)
+            self._proxy_fragment_cache[key] = fragments
+        
+        inbound, outbound, rule = fragments
+        inbounds = list(last_config["inbounds"])
+        outbounds = list(last_config["outbounds"])
+        rules = list(last_config["route"]["rules"])
+        inbounds[i] = inbound
+        outbounds[i] = outbound
+        rules[i] = rule
+        
+        singbox_config = {
+            "log": dict(_SINGBOX_LOG),
+            "inbounds": inbounds,
+            "outbounds": outbounds,
+            "route": {
+                "rules": rules
+            }
+        }
+        
+        keys = self._last_config_keys
+        self._last_config = singbox_config
+        self._last_config_keys = keys[:i] + (key,) + keys[i + 1:]
+        
+        return singbox_config
+    
+    def _singbox_config_key(self) -> tuple:
+        """
+        当前配置对应的 sing-box 配置缓存键（各代理端口片段键组成的元组）
+        
+        Returns:
+            tuple: 缓存键
+            
+        Raises:
+            RuntimeError: 如果没有加载配置或引用的出口代理不存在
+        """
+        if not self.config:
+            raise RuntimeError("No configuration loaded. Call config_manager.load_config() first.")
+        return tuple(
+            self._fragment_key(proxy, self._resolve_upstream(proxy))
+            for proxy in self.config.proxies
+        )
+    
+    def _resolve_upstream(self, proxy: ProxyConfig) -> Optional[UpstreamProxy]:
+        """
+        解析代理端口使用的上游代理：优先使用 upstream_id，其次使用 upstream
+        
+        Args:
+            proxy: 代理配置
+            
+        Returns:
+            Optional[UpstreamProxy]: 上游代理配置，None 表示 direct 模式
+            
+        Raises:
+            RuntimeError: 如果引用的出口代理不存在
+        """
+        upstream_proxy = None
+        if proxy.upstream_id:
+            # 从出口代理池中查找
+            upstream_proxy = self._get_upstream_by_id(proxy.upstream_id)
+            if not upstream_proxy:
+                logger.error(f"Upstream proxy with id '{proxy.upstream_id}' not found for proxy {proxy.name}")
+                raise RuntimeError(f"Upstream proxy with id '{proxy.upstream_id}' not found")
+            logger.debug(f"Resolved upstream_id '{proxy.upstream_id}' to {upstream_proxy.server}:{upstream_proxy.port}")
+        elif proxy.upstream:
+            # 使用直接配置的上游代理（向后兼容）
+            upstream_proxy = proxy.upstream
+            logger.debug(f"Using directly configured upstream for proxy {proxy.name}")
+        
+        return upstream_proxy
+    
+    @staticmethod
+    def _fragment_key(proxy: ProxyConfig, upstream_proxy: Optional[UpstreamProxy]) -> tuple:
+        """
+        代理端口配置片段的缓存键（UpstreamProxy 不可修改且可哈希，直接作为键的一部分）
+        """
+        return (proxy.local_port, proxy.local_username, proxy.local_password, upstream_proxy)
+    
+    def _build_proxy_fragments(
+        self,
+        proxy: ProxyConfig,
+        upstream_proxy: Optional[UpstreamProxy]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+        """
+        生成单个代理端口的 inbound、outbound 和路由规则
+        
+        返回的字典会被缓存并在之后生成的配置中复用，调用方不能修改
+        
+        Args:
+            proxy: 代理配置
+            upstream_proxy: 解析后的上游代理（None 表示 direct 模式）
+            
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]: (inbound, outbound, rule)
+        """
+        logger.debug(f"Generating configuration for proxy: {proxy.name} (port {proxy.local_port})")
+        
+        # 生成inbound配置（本地SOCKS5代理）
+        port = str(proxy.local_port)
+        inbound_tag = _INBOUND_PREFIX + port
+        inbound = {
+            "type": "socks",
+            "tag": inbound_tag,
+            "listen": "0.0.0.0",
+            "listen_port": proxy.local_port
+        }
+        
+        # 如果配置了本地认证，添加认证信息
+        if proxy.local_username and proxy.local_password:
+            inbound["users"] = [{
+                "username": proxy.local_username,
+                "password": proxy.local_password
+            }]
+            logger.debug(f"Added local authentication for proxy {proxy.name}")
+        
+        # 生成outbound配置：按上游代理类型选择生成函数
+        outbound_tag = _OUTBOUND_PREFIX + port
+        build = (
+            _build_direct_outbound if upstream_proxy is None
+            else _OUTBOUND_BUILDERS.get(upstream_proxy.protocol, _build_proxy_outbound)
+        )
+        outbound = build(outbound_tag, upstream_proxy)
+        logger.debug(f"Using {outbound['type']} outbound for proxy {proxy.name}")
+        
+        # 生成路由规则（将inbound流量路由到对应的outbound）
+        rule = {
+            "inbound": [inbound_tag],
+            "outbound": outbound_tag
+        }
+        
+        return inbound, outbound, rule
+    
     def _get_upstream_by_id(self, upstream_id: str) -> Optional[UpstreamProxy]:
         """
         根据 ID 从出口代理池中获取上游代理
@@ -268,70 +568,145 @@ class ProxyManager:
         """
         logger.info("Applying sing-box configuration")
         
-        # 如果没有提供配置，生成新配置
-        if config is None:
-            config = self.generate_singbox_config()
-        
-        # 备份当前配置（用于回滚）
-        backup_path = None
-        if os.path.exists(self.singbox_config_path):
-            backup_path = f"{self.singbox_config_path}.backup"
+        # 与其他线程的配置应用和上游代理切换串行执行，缓存和回滚状态只在持锁时读写
+        with self._apply_lock:
+            # 如果没有提供配置，生成新配置；各代理端口的配置都未变化时直接复用上次的序列化结果
+            if config is None:
+                config_key = self._singbox_config_key()
+                if self._serialized_cache is not None and self._serialized_cache[0] == config_key:
+                    logger.debug("sing-box configuration unchanged, reusing serialized configuration")
+                    payload = self._serialized_cache[1]
+                else:
+                    payload = _dump_singbox_config(self.generate_singbox_config())
+                    self._serialized_cache = (config_key, payload)
+            else:
+                payload = _dump_singbox_config(config)
+                if config is self._last_config:
+                    # 由当前配置生成（或替换单个端口片段得到）的配置，记录序列化结果供下次复用
+                    self._serialized_cache = (self._last_config_keys, payload)
+            
+            # 与上次成功应用的配置完全相同且文件未被外部修改时，不再写入和重载
+            if payload == self._applied_payload and self._applied_file_unchanged():
+                logger.info("sing-box configuration unchanged, skipping write and reload")
+                return True
+            
+            # 回滚用的旧配置：优先使用上次成功应用的内容，进程内首次应用时读取现有文件
+            previous = self._applied_payload
+            if previous is None:
+                try:
+                    with open(self.singbox_config_path, 'rb') as f:
+                        previous = f.read()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # 读取失败不应该阻止配置更新
+                    logger.warning(f"Failed to read current configuration for rollback: {e}")
+            
+            # 写入后到成功重载之前，磁盘上的文件与 sing-box 正在使用的配置不一致
+            self._applied_stat = None
             try:
-                with open(self.singbox_config_path, 'r') as f:
-                    backup_content = f.read()
-                with open(backup_path, 'w') as f:
-                    f.write(backup_content)
-                logger.debug(f"Created configuration backup at: {backup_path}")
+                applied_stat = self._write_singbox_config(payload)
+                
+                logger.info(f"Configuration written to: {self.singbox_config_path}")
+                
+                # 重载sing-box
+                success = self._reload_singbox()
+                
+                if not success:
+                    # 重载失败，由下面的异常处理回滚
+                    logger.error("Failed to reload sing-box")
+                    raise RuntimeError("Failed to reload sing-box, configuration rolled back")
+                
+                logger.info("sing-box configuration applied and reloaded successfully")
+                self._applied_payload = payload
+                self._applied_stat = applied_stat
+                
+                return True
+                
             except Exception as e:
-                # 备份失败不应该阻止配置更新
-                logger.warning(f"Failed to create configuration backup: {e}")
-                backup_path = None
+                # 发生错误，尝试回滚
+                logger.error(f"Error applying configuration: {e}")
+                if previous is not None:
+                    self._rollback_config(previous)
+                raise RuntimeError(f"Failed to apply sing-box configuration: {e}")
+    
+    def _applied_file_unchanged(self) -> bool:
+        """
+        配置文件是否仍是上次成功应用时写入的文件（比较修改时间和大小）
         
+        Returns:
+            bool: 文件未变化返回True；未记录、文件不存在或已被修改返回False
+        """
+        if self._applied_stat is None:
+            return False
         try:
-            # 确保配置目录存在
-            config_dir = os.path.dirname(self.singbox_config_path)
-            if config_dir:
-                os.makedirs(config_dir, exist_ok=True)
-            
-            # 写入新配置
-            with open(self.singbox_config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-            
-            logger.info(f"Configuration written to: {self.singbox_config_path}")
-            
-            # 重载sing-box
-            success = self._reload_singbox()
-            
-            if not success:
-                # 重载失败，尝试回滚
-                logger.error("Failed to reload sing-box")
-                if backup_path and os.path.exists(backup_path):
-                    self._rollback_config(backup_path)
-                raise RuntimeError("Failed to reload sing-box, configuration rolled back")
-            
-            logger.info("sing-box configuration applied and reloaded successfully")
-            
-            # 清理备份文件
-            if backup_path and os.path.exists(backup_path):
-                os.remove(backup_path)
-                logger.debug("Removed configuration backup")
-            
-            return True
+            st = os.stat(self.singbox_config_path)
+        except OSError:
+            return False
+        return (st.st_mtime_ns, st.st_size) == self._applied_stat
+    
+    def _write_singbox_config(self, payload: bytes) -> Tuple[int, int]:
+        """
+        原子地替换 sing-box 配置文件
+        
+        先写入同目录下唯一命名的临时文件并 fsync，再用 os.replace 替换，
+        任何时刻配置文件都是完整的旧内容或新内容。配置目录只在创建临时文件失败时才创建
+        
+        Args:
+            payload: 配置文件内容
             
-        except Exception as e:
-            # 发生错误，尝试回滚
-            logger.error(f"Error applying configuration: {e}")
-            if backup_path and os.path.exists(backup_path):
-                self._rollback_config(backup_path)
-            raise RuntimeError(f"Failed to apply sing-box configuration: {e}")
+        Returns:
+            Tuple[int, int]: 写入后文件的 (修改时间纳秒, 大小)
+        """
+        config_dir = os.path.dirname(self.singbox_config_path) or '.'
+        prefix = f".{os.path.basename(self.singbox_config_path)}."
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix=".new", dir=config_dir)
+        except FileNotFoundError:
+            # 配置目录不存在时创建（通常只在首次写入时发生）
+            os.makedirs(config_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix=".new", dir=config_dir)
+        
+        # mkstemp 创建的文件权限为 0600，沿用原配置文件的权限
+        try:
+            mode = os.stat(self.singbox_config_path).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        
+        try:
+            with open(fd, 'wb') as f:
+                os.fchmod(f.fileno(), mode)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+                st = os.fstat(f.fileno())
+            os.replace(tmp_path, self.singbox_config_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return (st.st_mtime_ns, st.st_size)
     
     def _reload_singbox(self) -> bool:
         """
         重载sing-box进程
         
+        优先向 PID 文件中的进程发送 SIGHUP，sing-box 重新读取配置而不关闭监听端口和已有连接；
+        没有可用的 PID 时通过缓存的 D-Bus 连接请求 systemd 重载（未运行时启动）服务并等待任务完成；
+        D-Bus 不可用（未安装 jeepney 或无权限）时使用 systemctl reload，服务不支持 reload 时才重启服务
+        
         Returns:
             bool: 成功返回True，失败返回False
         """
+        if self._signal_singbox_reload():
+            return True
+        
+        dbus_result = self._systemd_reload_or_restart()
+        if dbus_result is not None:
+            return dbus_result
+        
         try:
             # 检查 sing-box 服务是否运行
             result = subprocess.run(
@@ -342,8 +717,21 @@ class ProxyManager:
             )
             
             if result.returncode == 0:
-                # 服务正在运行，重启以应用新配置
-                logger.info("Restarting sing-box service to apply new configuration")
+                # 服务正在运行，优先重载配置（不中断已有连接）
+                logger.info("Reloading sing-box service to apply new configuration")
+                result = subprocess.run(
+                    ["sudo", "systemctl", "reload", "sing-box"],
+                    capture_output=True,
+                    text=True,
+                    timeout=10
+                )
+                
+                if result.returncode == 0:
+                    logger.info("sing-box service reloaded successfully")
+                    return True
+                
+                # 服务不支持 reload，重启以应用新配置
+                logger.warning(f"Failed to reload sing-box, falling back to restart: stderr={result.stderr}")
                 result = subprocess.run(
                     ["sudo", "systemctl", "restart", "sing-box"],
                     capture_output=True,
@@ -354,7 +742,6 @@ class ProxyManager:
                 if result.returncode == 0:
                     logger.info("sing-box service restarted successfully")
                     # 等待服务启动
-                    import time
                     time.sleep(1)
                     return True
                 else:
@@ -373,7 +760,6 @@ class ProxyManager:
                 if result.returncode == 0:
                     logger.info("sing-box service started successfully")
                     # 等待服务启动
-                    import time
                     time.sleep(1)
                     return True
                 else:
@@ -390,21 +776,144 @@ class ProxyManager:
             logger.error(f"Unexpected error reloading sing-box: {e}")
             return False
     
-    def _rollback_config(self, backup_path: str) -> None:
+    def _signal_singbox_reload(self) -> bool:
+        """
+        向 PID 文件中的 sing-box 进程发送 SIGHUP 使其重新加载配置
+        
+        PID 文件可能是旧安装残留的（systemd 单元不写 PID 文件），发送信号前确认该 PID
+        对应的确实是 sing-box 进程，避免 SIGHUP 的默认动作终止无关进程
+        
+        Returns:
+            bool: 信号已发送且进程仍在运行返回True；PID 文件不存在、无效或不是 sing-box 进程返回False
+        """
+        try:
+            with open(self.singbox_pid_file, 'r') as f:
+                pid = int(f.read().strip())
+        except (OSError, ValueError):
+            return False
+        
+        if not self._is_singbox_process(pid):
+            logger.warning(f"PID file {self.singbox_pid_file} does not point to a running sing-box process (pid {pid}), ignoring it")
+            return False
+        
+        try:
+            os.kill(pid, signal.SIGHUP)
+            # 确认进程仍在运行（不阻塞等待）
+            os.kill(pid, 0)
+        except OSError as e:
+            logger.warning(f"Failed to send SIGHUP to sing-box (pid {pid}): {e}")
+            return False
+        
+        logger.info(f"Sent SIGHUP to sing-box (pid {pid}) to reload configuration")
+        return True
+    
+    @staticmethod
+    def _is_singbox_process(pid: int) -> bool:
+        """
+        检查指定 PID 的进程是否为 sing-box
+        
+        Args:
+            pid: 进程 ID
+            
+        Returns:
+            bool: /proc/<pid>/comm 为 sing-box 返回True；进程不存在或无法读取返回False
+        """
+        try:
+            with open(f"/proc/{pid}/comm", 'r') as f:
+                return f.read().strip() == "sing-box"
+        except OSError:
+            return False
+    
+    def _get_sd_bus(self):
+        """
+        获取到 systemd 的 D-Bus 系统总线连接，首次调用时建立并缓存
+        
+        建立连接时订阅 systemd 的 JobRemoved 信号（systemd 只向订阅者发送任务信号），用于等待重载任务完成
+        
+        Returns:
+            D-Bus 连接；未安装 jeepney 或无法连接系统总线时返回None
+        """
+        if self._sd_bus is None and open_dbus_connection is not None:
+            connection = None
+            try:
+                connection = open_dbus_connection(bus='SYSTEM')
+                unwrap_msg(connection.send_and_get_reply(message_bus.AddMatch(_JOB_REMOVED_RULE), timeout=5))
+                unwrap_msg(connection.send_and_get_reply(new_method_call(_SYSTEMD_MANAGER, 'Subscribe'), timeout=5))
+                self._sd_bus = connection
+            except Exception as e:
+                logger.debug(f"System D-Bus unavailable, using systemctl: {e}")
+                if connection is not None:
+                    connection.close()
+        return self._sd_bus
+    
+    def _systemd_reload_or_restart(self) -> Optional[bool]:
+        """
+        通过 D-Bus 调用 systemd 的 ReloadOrRestartUnit：服务运行时重载（不支持重载则重启），未运行时启动
+        
+        ReloadOrRestartUnit 只是把任务放入 systemd 队列，这里等待该任务的 JobRemoved 信号，
+        与 systemctl 一样以任务结果判断是否成功
+        
+        Returns:
+            Optional[bool]: 任务结果为 done 返回True，任务失败返回False；
+                D-Bus 不可用、调用被拒绝（如权限不足）或等待任务超时返回None，由 systemctl 处理
+        """
+        connection = self._get_sd_bus()
+        if connection is None:
+            return None
+        
+        message = new_method_call(
+            _SYSTEMD_MANAGER, 'ReloadOrRestartUnit', 'ss', (_SINGBOX_UNIT, 'replace')
+        )
+        try:
+            # 发送请求前注册过滤器，避免错过在回复之前到达的 JobRemoved 信号
+            with connection.filter(_JOB_REMOVED_RULE, bufsize=64) as signals:
+                job_path, = unwrap_msg(connection.send_and_get_reply(message, timeout=10))
+                
+                deadline = time.monotonic() + self.SYSTEMD_JOB_TIMEOUT
+                while True:
+                    job_signal = connection.recv_until_filtered(
+                        signals, timeout=max(deadline - time.monotonic(), 0)
+                    )
+                    _, removed_job, _, result = job_signal.body
+                    if removed_job == job_path:
+                        break
+        except DBusErrorResponse as e:
+            logger.debug(f"systemd rejected ReloadOrRestartUnit, using systemctl: {e}")
+            return None
+        except TimeoutError:
+            logger.warning("Timed out waiting for systemd to reload sing-box, using systemctl")
+            return None
+        except Exception as e:
+            # 连接已失效，下次重新建立
+            logger.warning(f"D-Bus call to systemd failed: {e}")
+            try:
+                connection.close()
+            except Exception:
+                pass
+            self._sd_bus = None
+            return None
+        
+        if result != 'done':
+            logger.error(f"systemd failed to reload sing-box: job result {result}")
+            return False
+        
+        logger.info("sing-box reloaded via systemd D-Bus")
+        return True
+    
+    def _rollback_config(self, previous: bytes) -> None:
         """
-        回滚配置到备份
+        回滚配置到应用前的内容
         
         Args:
-            backup_path: 备份文件路径
+            previous: 应用前的配置文件内容
         """
         try:
-            with open(backup_path, 'r') as f:
-                backup_content = f.read()
-            with open(self.singbox_config_path, 'w') as f:
-                f.write(backup_content)
+            applied_stat = self._write_singbox_config(previous)
+            self._applied_payload = previous
             
-            # 尝试重载回滚后的配置
-            self._reload_singbox()
+            # 尝试重载回滚后的配置，重载成功后才认为 sing-box 正在使用该配置
+            if self._reload_singbox():
+                self._applied_stat = applied_stat
             
         except Exception:
             # 回滚失败，但不抛出异常，因为已经在错误处理流程中
@@ -414,6 +923,9 @@ class ProxyManager:
         """
         切换指定端口的上游代理
         
+        请求会等待 SWITCH_DEBOUNCE 秒，期间其他线程提交的切换合并为一批，
+        只保存一次配置、写入并重载一次 sing-box；返回时本次切换已经生效
+        
         Args:
             local_port: 本地端口
             new_upstream: 新的上游代理配置
@@ -426,86 +938,165 @@ class ProxyManager:
             ValueError: 如果端口不存在或原因无效
             RuntimeError: 如果切换失败
         """
-        if reason not in ['health_check_failed', 'manual', 'api_error']:
-            raise ValueError(f"Invalid reason: {reason}. Must be 'health_check_failed', 'manual', or 'api_error'")
+        self._check_switch(local_port, reason)
         
         logger.info(f"Switching upstream proxy for port {local_port}, reason: {reason}")
         
-        if not self.config:
-            raise RuntimeError("No configuration loaded")
+        with self._pending_lock:
+            batch = self._pending_switches
+            leader = batch is None
+            if leader:
+                batch = self._pending_switches = _SwitchBatch()
+            batch.changes.append((local_port, new_upstream, reason))
         
-        # 查找指定端口的代理配置
-        proxy_config = None
-        for proxy in self.config.proxies:
-            if proxy.local_port == local_port:
-                proxy_config = proxy
-                break
+        if leader:
+            # 等待其他切换加入本批次，然后统一执行
+            time.sleep(self.SWITCH_DEBOUNCE)
+            with self._pending_lock:
+                self._pending_switches = None
+            try:
+                self._apply_switches(batch.changes)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
         
-        if not proxy_config:
-            raise ValueError(f"No proxy configuration found for port {local_port}")
+        if batch.error is not None:
+            raise RuntimeError(f"Failed to switch upstream proxy: {batch.error}")
+        return True
+    
+    def switch_upstream_proxies(self, changes: List[Tuple[int, UpstreamProxy]], reason: str = "manual") -> bool:
+        """
+        批量切换多个端口的上游代理（只保存一次配置、写入并重载一次 sing-box）
         
-        # 保存旧的上游代理（用于日志记录）
-        old_upstream = proxy_config.upstream
-        logger.info(f"Old upstream: {old_upstream.server}:{old_upstream.port}")
-        logger.info(f"New upstream: {new_upstream.server}:{new_upstream.port}")
+        Args:
+            changes: (本地端口, 新的上游代理配置) 列表
+            reason: 切换原因 ('health_check_failed', 'manual', 'api_error')
+            
+        Returns:
+            bool: 成功返回True
+            
+        Raises:
+            ValueError: 如果端口不存在或原因无效
+            RuntimeError: 如果切换失败（所有端口都回滚到原来的上游代理）
+        """
+        for local_port, _ in changes:
+            self._check_switch(local_port, reason)
         
-        # 更新配置中的上游代理
-        proxy_config.upstream = new_upstream
+        logger.info(f"Switching upstream proxies for ports {[port for port, _ in changes]}, reason: {reason}")
         
-        success = False
         try:
-            # 保存更新后的配置到文件
-            self.config_manager.save_config(self.config)
-            logger.debug("Configuration saved to file")
-            
-            # 生成并应用新的sing-box配置
-            self.apply_singbox_config()
+            self._apply_switches([(port, upstream, reason) for port, upstream in changes])
+        except Exception as e:
+            raise RuntimeError(f"Failed to switch upstream proxy: {e}")
+        return True
+    
+    def _check_switch(self, local_port: int, reason: str) -> None:
+        """
+        检查切换请求的原因和端口是否有效
+        
+        Raises:
+            ValueError: 如果端口不存在或原因无效
+            RuntimeError: 如果没有加载配置
+        """
+        if reason not in _SWITCH_REASONS:
+            raise ValueError(f"Invalid reason: {reason}. Must be 'health_check_failed', 'manual', or 'api_error'")
+        
+        if not self.config:
+            raise RuntimeError("No configuration loaded")
+        
+        if self.config_manager.get_proxy_config(local_port) is None:
+            raise ValueError(f"No proxy configuration found for port {local_port}")
+    
+    def _apply_switches(self, changes: List[Tuple[int, UpstreamProxy, str]]) -> None:
+        """
+        修改各端口的上游代理，保存配置并应用一次 sing-box 配置，记录切换历史
+        
+        失败时所有端口回滚到原来的上游代理，记录失败的切换事件后重新抛出异常
+        
+        Args:
+            changes: (本地端口, 新的上游代理, 切换原因) 列表，同一端口的多次切换按顺序生效
+        """
+        with self._apply_lock:
+            # 修改任何端口之前先确认所有端口仍然存在
+            proxy_configs = []
+            for local_port, _, _ in changes:
+                proxy_config = self.config_manager.get_proxy_config(local_port)
+                if proxy_config is None:
+                    raise ValueError(f"No proxy configuration found for port {local_port}")
+                proxy_configs.append(proxy_config)
             
-            success = True
-            logger.info(f"Successfully switched upstream proxy for port {local_port}")
+            # 记录每个端口最初的上游代理（用于回滚）和每次切换前的上游代理（用于历史记录）
+            original: Dict[int, Optional[UpstreamProxy]] = {}
+            history = []
+            changed = []
+            for proxy_config, (local_port, new_upstream, reason) in zip(proxy_configs, changes):
+                old_upstream = proxy_config.upstream
+                if local_port not in original:
+                    original[local_port] = old_upstream
+                    changed.append(proxy_config)
+                if old_upstream:
+                    logger.info(f"Old upstream: {old_upstream.server}:{old_upstream.port}")
+                logger.info(f"New upstream: {new_upstream.server}:{new_upstream.port}")
+                
+                # 更新配置中的上游代理
+                proxy_config.upstream = new_upstream
+                history.append((local_port, old_upstream, new_upstream, reason))
             
-        except Exception as e:
-            # 切换失败，回滚配置
-            logger.error(f"Failed to switch upstream proxy: {e}")
-            proxy_config.upstream = old_upstream
             try:
+                # 保存更新后的配置到文件
                 self.config_manager.save_config(self.config)
-                self.apply_singbox_config()
-            except Exception as rollback_error:
-                logger.error(f"Failed to rollback configuration: {rollback_error}")
-            
-            # 记录失败的切换事件到数据库
-            if self.database:
+                logger.debug("Configuration saved to file")
+                
+                # 应用新的sing-box配置：只替换切换端口的片段，无法替换时完整生成
+                singbox_config = None
+                for proxy_config in changed:
+                    singbox_config = self._patch_singbox_config(proxy_config)
+                    if singbox_config is None:
+                        break
+                self.apply_singbox_config(singbox_config)
+                
+                logger.info(f"Successfully switched upstream proxy for ports {list(original)}")
+                
+            except Exception as e:
+                # 切换失败，回滚配置
+                logger.error(f"Failed to switch upstream proxy: {e}")
+                for proxy_config in changed:
+                    proxy_config.upstream = original[proxy_config.local_port]
                 try:
-                    self.database.insert_switch_history(
-                        local_port=local_port,
-                        old_upstream=old_upstream,
-                        new_upstream=new_upstream,
-                        reason=reason,
-                        success=False
-                    )
-                    logger.debug("Failed switch event recorded to database")
-                except Exception as db_error:
-                    logger.error(f"Failed to record switch event to database: {db_error}")
+                    self.config_manager.save_config(self.config)
+                    self.apply_singbox_config()
+                except Exception as rollback_error:
+                    logger.error(f"Failed to rollback configuration: {rollback_error}")
+                
+                # 记录失败的切换事件到数据库
+                self._record_switches(history, success=False)
+                raise
             
-            raise RuntimeError(f"Failed to switch upstream proxy: {e}")
+            # 记录成功的切换事件到数据库
+            self._record_switches(history, success=True)
+    
+    def _record_switches(self, history: List[Tuple[int, Optional[UpstreamProxy], UpstreamProxy, str]], success: bool) -> None:
+        """
+        记录切换事件到数据库（数据库记录失败不影响切换操作）
         
-        # 记录成功的切换事件到数据库
-        if self.database:
-            try:
-                self.database.insert_switch_history(
-                    local_port=local_port,
-                    old_upstream=old_upstream,
-                    new_upstream=new_upstream,
-                    reason=reason,
-                    success=True
-                )
-                logger.debug("Switch event recorded to database")
-            except Exception as db_error:
-                logger.error(f"Failed to record switch event to database: {db_error}")
-                # 数据库记录失败不应该影响切换操作
+        Args:
+            history: (本地端口, 旧的上游代理, 新的上游代理, 切换原因) 列表
+            success: 切换是否成功
+        """
+        if not self.database:
+            return
         
-        return success
+        try:
+            self.database.insert_switch_history_many([
+                (local_port, old_upstream, new_upstream, reason, success)
+                for local_port, old_upstream, new_upstream, reason in history
+            ])
+            logger.debug(f"{len(history)} switch events recorded to database")
+        except Exception as db_error:
+            logger.error(f"Failed to record switch events to database: {db_error}")
     
     def get_new_proxy_from_api(self, api_provider_id: str) -> UpstreamProxy:
         """
@@ -527,11 +1118,7 @@ class ProxyManager:
             raise RuntimeError("No configuration loaded")
         
         # 查找指定的API提供商配置
-        provider_config = None
-        for provider in self.config.api_providers:
-            if provider.id == api_provider_id:
-                provider_config = provider
-                break
+        provider_config = self.config_manager.get_api_provider_config(api_provider_id)
         
         if not provider_config:
             raise ValueError(f"API provider not found: {api_provider_id}")
@@ -539,9 +1126,12 @@ class ProxyManager:
         if not provider_config.enabled:
             raise ValueError(f"API provider is disabled: {api_provider_id}")
         
-        # 创建API客户端实例
-        from .api_client import APIClient
-        api_client = APIClient(provider_config)
+        # 复用该提供商的API客户端（保持 HTTP 连接），提供商配置变化后重新创建
+        api_client = self._api_clients.get(api_provider_id)
+        if api_client is None or api_client.provider_config != provider_config:
+            if api_client is not None:
+                api_client.close()
+            api_client = self._api_clients[api_provider_id] = APIClient(provider_config)
         
         try:
             # 从API获取新代理
@@ -564,34 +1154,66 @@ class ProxyManager:
         Returns:
             bool: 可用返回True，不可用返回False
         """
-        logger.info(f"Validating upstream proxy: {upstream.server}:{upstream.port}")
+        return self._check_upstream(upstream, self._validation_url(), timeout)
+    
+    def validate_upstream_proxies(self, upstreams: List[UpstreamProxy], timeout: int = 10) -> Dict[UpstreamProxy, bool]:
+        """
+        并发验证多个上游代理是否可用
         
-        try:
-            # Import here to avoid requiring PySocks at module level
-            import requests
-            import socks
-            import socket
-            import importlib
-            
-            # 配置SOCKS代理
-            socks.set_default_proxy(
-                socks.SOCKS5,
-                upstream.server,
-                upstream.port,
-                username=upstream.username,
-                password=upstream.password
-            )
-            socket.socket = socks.socksocket
-            
-            # 尝试通过代理发送HTTP请求
-            test_url = "http://www.google.com"
-            if self.config and self.config.monitoring:
-                test_url = self.config.monitoring.check_url
+        Args:
+            upstreams: 上游代理配置列表
+            timeout: 每个代理的超时时间（秒）
             
-            response = requests.get(test_url, timeout=timeout)
+        Returns:
+            Dict[UpstreamProxy, bool]: 各上游代理的验证结果
+        """
+        results: Dict[UpstreamProxy, bool] = {}
+        if not upstreams:
+            return results
+        
+        # 检查地址在分发前读取一次，工作线程不访问 self.config
+        test_url = self._validation_url()
+        workers = min(self.MAX_VALIDATION_WORKERS, len(upstreams))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ProxyValidate") as executor:
+            futures = {
+                executor.submit(self._check_upstream, upstream, test_url, timeout): upstream
+                for upstream in upstreams
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        
+        return results
+    
+    def _validation_url(self) -> str:
+        """
+        验证上游代理时请求的地址（监控配置的检查地址）
+        """
+        if self.config and self.config.monitoring:
+            return self.config.monitoring.check_url
+        return "http://www.google.com"
+    
+    @staticmethod
+    def _check_upstream(upstream: UpstreamProxy, test_url: str, timeout: int) -> bool:
+        """
+        通过上游代理请求检查地址，返回是否可用
+        
+        Args:
+            upstream: 上游代理配置
+            test_url: 检查地址
+            timeout: 超时时间（秒）
             
-            # 恢复默认socket
-            importlib.reload(socket)
+        Returns:
+            bool: 可用返回True，不可用返回False
+        """
+        logger.info(f"Validating upstream proxy: {upstream.server}:{upstream.port}")
+        
+        # 代理只作用于本次请求，不修改全局 socket，可在多个线程中并发验证
+        proxy_url = upstream.proxy_url
+        proxies = {"http": proxy_url, "https": proxy_url}
+        
+        try:
+            # SOCKS 代理需要 requests[socks]（PySocks）
+            response = requests.get(test_url, proxies=proxies, timeout=timeout)
             
             if response.status_code == 200:
                 logger.info(f"Upstream proxy validation successful")
@@ -602,11 +1224,4 @@ class ProxyManager:
                 
         except Exception as e:
             logger.warning(f"Upstream proxy validation failed: {e}")
-            # 恢复默认socket
-            try:
-                import importlib
-                import socket
-                importlib.reload(socket)
-            except:
-                pass
             return False
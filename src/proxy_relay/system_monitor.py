@@ -4,19 +4,120 @@
 提供系统资源监控功能，包括：
 - 网络连接数统计
 - 网卡流量统计
-- 端口流量统计（通过 iptables）
+- 端口流量统计（通过 ipset / iptables）
 """
 
 import os
+import re
 import time
 import logging
 import subprocess
 import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Optional, Tuple, Callable
 from dataclasses import dataclass, field
 
 logger = logging.getLogger(__name__)
 
+# iptables-save -c 输出中的端口计数规则：[包数:字节数] -A PREROUTING ... --dport 端口 / -A OUTPUT ... --sport 端口
+_IPTABLES_COUNTER_RE = re.compile(
+    r'^\[(\d+):(\d+)\]\s+-A\s+(PREROUTING|OUTPUT)\s+.*?--([ds])port\s+(\d+)\b',
+    re.MULTILINE
+)
+
+# iptables/iptables-restore 在 xtables 锁被占用时最多等待 2 秒，而不是立即失败
+# （-n 只对 -L 有效，已在列出规则时使用；iptables-save 不取锁）
+_XTABLES_WAIT = ("-w", "2")
+
+_PROC_NET_DEV = "/proc/net/dev"
+
+# /proc/net/dev 中每个网卡一行：接口名: 接收字节 接收包 ...(6 列) 发送字节 发送包 ...
+# 表头两行不含 "接口名:数字" 形式，不会被匹配
+_NETDEV_RE = re.compile(
+    rb'^\s*([^\s:]+):\s*(\d+)\s+(\d+)\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)\s+(\d+)',
+    re.MULTILINE
+)
+# 不计入网卡流量的接口
+_NETDEV_SKIP = frozenset([b'lo'])
+
+# TCP 连接表，state 列为 01 表示 ESTABLISHED
+_PROC_NET_TCP = ("/proc/net/tcp", "/proc/net/tcp6")
+_TCP_ESTABLISHED = "01"
+
+# 端口流量统计使用的 ipset 集合：入站按目标端口匹配，出站按源端口匹配
+_IPSET_IN = "relay_ports_in"
+_IPSET_OUT = "relay_ports_out"
+
+# ipset save 输出中的元素计数：add 集合名 端口 packets 包数 bytes 字节数
+_IPSET_COUNTER_RE = re.compile(
+    rf'^add\s+({_IPSET_IN}|{_IPSET_OUT})\s+(\d+)\s+packets\s+\d+\s+bytes\s+(\d+)',
+    re.MULTILINE
+)
+
+
+def _parse_iptables_counters(output: str) -> Dict[int, Tuple[int, int]]:
+    """
+    从 iptables-save -c 的输出中提取各端口的流量计数
+    
+    PREROUTING 链中匹配目标端口的规则计为接收，OUTPUT 链中匹配源端口的规则计为发送；
+    同一端口有多条规则时与 iptables -L 的查找方式一致，取第一条
+    
+    Args:
+        output: iptables-save -c 的输出
+    
+    Returns:
+        Dict[int, Tuple[int, int]]: {端口: (发送字节数, 接收字节数)}
+    """
+    sent: Dict[int, int] = {}
+    recv: Dict[int, int] = {}
+    for match in _IPTABLES_COUNTER_RE.finditer(output):
+        _, byte_count, chain, direction, port = match.groups()
+        if chain == 'PREROUTING' and direction == 'd':
+            recv.setdefault(int(port), int(byte_count))
+        elif chain == 'OUTPUT' and direction == 's':
+            sent.setdefault(int(port), int(byte_count))
+    return {port: (sent.get(port, 0), recv.get(port, 0)) for port in sent.keys() | recv.keys()}
+
+
+def _parse_ipset_counters(output: str) -> Dict[int, Tuple[int, int]]:
+    """
+    从 ipset save 的输出中提取各端口的流量计数
+    
+    Args:
+        output: ipset save 的输出
+    
+    Returns:
+        Dict[int, Tuple[int, int]]: {端口: (发送字节数, 接收字节数)}
+    """
+    sent: Dict[int, int] = {}
+    recv: Dict[int, int] = {}
+    for match in _IPSET_COUNTER_RE.finditer(output):
+        set_name, port, byte_count = match.groups()
+        target = recv if set_name == _IPSET_IN else sent
+        target[int(port)] = int(byte_count)
+    return {port: (sent.get(port, 0), recv.get(port, 0)) for port in sent.keys() | recv.keys()}
+
+
+def _counter_delta(current: int, last: int) -> int:
+    """
+    计算两次读取之间的计数器增量
+    
+    计数器比上次小说明规则被重建或计数被清零，此时当前值即为清零后的增量
+    
+    Args:
+        current: 本次读取的计数
+        last: 上次读取的计数
+    
+    Returns:
+        int: 增量
+    """
+    return current - last if current >= last else current
+
+
+# _format_bytes 使用的单位及小数位数，下标为 1024 的幂次
+_BYTE_UNITS = (("B", 0), ("KB", 1), ("MB", 2), ("GB", 2))
+
 
 @dataclass
 class NetworkStats:
@@ -36,57 +137,83 @@ class PortTrafficStats:
     bytes_recv: int = 0
     last_bytes_sent: int = 0
     last_bytes_recv: int = 0
+    sampled: bool = False  # 是否已记录过计数器基准值
 
 
 class SystemMonitor:
     """系统监控类"""
     
+    # 网卡统计缓存有效期（秒），同一次请求内的多个调用共享一次 /proc/net/dev 读取
+    NETWORK_STATS_TTL = 0.25
+    
+    # 批量读取计数失败、逐个端口查询 iptables 时的最大并发数
+    MAX_TRAFFIC_WORKERS = 16
+    
     def __init__(self):
         self._last_network_stats: Optional[NetworkStats] = None
         self._last_check_time: float = 0
+        self._last_network_speed: Tuple[float, float] = (0.0, 0.0)
+        self._stats_cache: Optional[Tuple[float, NetworkStats]] = None
         self._port_traffic: Dict[int, PortTrafficStats] = {}
         self._traffic_collector_thread: Optional[threading.Thread] = None
         self._stop_event = threading.Event()
+        # 停止或请求立即采集时唤醒采集线程
+        self._wakeup_event = threading.Event()
         self._database = None
         self._iptables_initialized = False
+        self._ipset_initialized = False
     
     def set_database(self, database):
         """设置数据库实例"""
         self._database = database
     
+    def _count_established(self) -> Tuple[int, Counter]:
+        """
+        读取 /proc/net/tcp 和 /proc/net/tcp6，统计 ESTABLISHED 连接
+        
+        Returns:
+            Tuple[int, Counter]: (连接总数, {端口: 本地或远端使用该端口的连接数})
+        """
+        total = 0
+        by_port: Counter = Counter()
+        for path in _PROC_NET_TCP:
+            try:
+                with open(path, 'r') as f:
+                    next(f, None)  # 跳过表头
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) < 4 or parts[3] != _TCP_ESTABLISHED:
+                            continue
+                        total += 1
+                        local_port = int(parts[1].rsplit(':', 1)[1], 16)
+                        remote_port = int(parts[2].rsplit(':', 1)[1], 16)
+                        by_port[local_port] += 1
+                        if remote_port != local_port:
+                            by_port[remote_port] += 1
+            except FileNotFoundError:
+                # 未启用 IPv6 时没有 /proc/net/tcp6
+                continue
+        return total, by_port
+    
     def get_connection_count(self, port: Optional[int] = None) -> int:
         """
         获取当前连接数
         
         Args:
             port: 指定端口，None 表示所有端口
-            
+        
         Returns:
             int: 连接数
         """
         try:
-            if port:
-                # 统计指定端口的连接数
-                cmd = f"ss -tn state established '( sport = :{port} or dport = :{port} )' 2>/dev/null | tail -n +2 | wc -l"
-            else:
-                # 统计所有 ESTABLISHED 连接
-                cmd = "ss -tn state established 2>/dev/null | tail -n +2 | wc -l"
-            
-            result = subprocess.run(
-                cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            
-            if result.returncode == 0:
-                return int(result.stdout.strip() or 0)
-            return 0
-            
+            total, by_port = self._count_established()
         except Exception as e:
             logger.warning(f"Failed to get connection count: {e}")
             return 0
+        
+        if port:
+            return by_port[port]
+        return total
     
     def get_network_stats(self) -> NetworkStats:
         """
@@ -97,30 +224,22 @@ class SystemMonitor:
         """
         try:
             # 读取 /proc/net/dev
-            with open('/proc/net/dev', 'r') as f:
-                lines = f.readlines()
+            with open(_PROC_NET_DEV, 'rb') as f:
+                buf = f.read()
             
             total_recv = 0
             total_sent = 0
             total_packets_recv = 0
             total_packets_sent = 0
             
-            for line in lines[2:]:  # 跳过头两行
-                parts = line.split()
-                if len(parts) < 10:
-                    continue
-                
-                interface = parts[0].rstrip(':')
-                # 跳过 lo 接口
-                if interface == 'lo':
+            for match in _NETDEV_RE.finditer(buf):
+                interface, recv, packets_recv, sent, packets_sent = match.groups()
+                if interface in _NETDEV_SKIP:
                     continue
-                
-                # bytes: recv=1, sent=9
-                # packets: recv=2, sent=10
-                total_recv += int(parts[1])
-                total_packets_recv += int(parts[2])
-                total_sent += int(parts[9])
-                total_packets_sent += int(parts[10])
+                total_recv += int(recv)
+                total_packets_recv += int(packets_recv)
+                total_sent += int(sent)
+                total_packets_sent += int(packets_sent)
             
             return NetworkStats(
                 bytes_sent=total_sent,
@@ -129,11 +248,33 @@ class SystemMonitor:
                 packets_recv=total_packets_recv,
                 timestamp=time.time()
             )
-            
+        
         except Exception as e:
             logger.warning(f"Failed to get network stats: {e}")
             return NetworkStats()
     
+    def _get_network_stats_cached(self, ttl: Optional[float] = None) -> NetworkStats:
+        """
+        获取网络统计数据，在 ttl 内复用上一次读取的结果
+        
+        Args:
+            ttl: 缓存有效期（秒），None 表示使用 NETWORK_STATS_TTL
+        
+        Returns:
+            NetworkStats: 网络统计
+        """
+        if ttl is None:
+            ttl = self.NETWORK_STATS_TTL
+        
+        now = time.monotonic()
+        cached = self._stats_cache
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+        
+        stats = self.get_network_stats()
+        self._stats_cache = (now, stats)
+        return stats
+    
     def get_network_speed(self) -> Tuple[float, float]:
         """
         获取网络速度（字节/秒）
@@ -141,7 +282,7 @@ class SystemMonitor:
         Returns:
             Tuple[float, float]: (发送速度, 接收速度)
         """
-        current_stats = self.get_network_stats()
+        current_stats = self._get_network_stats_cached()
         
         if self._last_network_stats is None:
             self._last_network_stats = current_stats
@@ -149,14 +290,16 @@ class SystemMonitor:
         
         time_diff = current_stats.timestamp - self._last_network_stats.timestamp
         if time_diff <= 0:
-            return (0.0, 0.0)
+            # 仍是缓存中的同一份快照，沿用上次计算的速度
+            return self._last_network_speed
         
         send_speed = (current_stats.bytes_sent - self._last_network_stats.bytes_sent) / time_diff
         recv_speed = (current_stats.bytes_recv - self._last_network_stats.bytes_recv) / time_diff
         
         self._last_network_stats = current_stats
+        self._last_network_speed = (max(0, send_speed), max(0, recv_speed))
         
-        return (max(0, send_speed), max(0, recv_speed))
+        return self._last_network_speed
     
     def get_port_connections(self, ports: list) -> Dict[int, int]:
         """
@@ -164,108 +307,279 @@ class SystemMonitor:
         
         Args:
             ports: 端口列表
-            
+        
         Returns:
             Dict[int, int]: {端口: 连接数}
         """
-        result = {}
-        for port in ports:
-            result[port] = self.get_connection_count(port)
-        return result
+        try:
+            _, by_port = self._count_established()
+        except Exception as e:
+            logger.warning(f"Failed to get port connections: {e}")
+            by_port = Counter()
+        
+        return {port: by_port[port] for port in ports}
     
     # ==================== 端口流量统计 ====================
     
     def init_port_traffic_rules(self, ports: list) -> bool:
         """
-        初始化端口流量统计的 iptables 规则
+        初始化端口流量统计规则
+        
+        优先使用 ipset：所有端口放入带计数器的 bitmap:port 集合，入站和出站各只需一条
+        iptables 规则，每个包的匹配开销与端口数量无关；ipset 不可用时回退为每个端口
+        一对 iptables 规则
+        
+        规则只用于计数（不带 -j 目标），放在 raw 表的 PREROUTING/OUTPUT 链中，
+        在连接跟踪和 filter 表之前完成统计，也不影响已有的过滤规则
         
         Args:
             ports: 要监控的端口列表
-            
+        
         Returns:
             bool: 是否成功
         """
         try:
-            for port in ports:
-                # 添加入站规则
-                subprocess.run(
-                    ["sudo", "iptables", "-A", "INPUT", "-p", "tcp", "--dport", str(port), "-j", "ACCEPT"],
-                    capture_output=True,
-                    timeout=5
-                )
-                # 添加出站规则
-                subprocess.run(
-                    ["sudo", "iptables", "-A", "OUTPUT", "-p", "tcp", "--sport", str(port), "-j", "ACCEPT"],
+            if self._init_ipset_rules(ports):
+                self._ipset_initialized = True
+                logger.info(f"Initialized ipset rules for ports: {ports}")
+            else:
+                # 所有端口的入站/出站规则通过一次 iptables-restore 原子安装，
+                # --noflush 保留 raw 表中已有的规则
+                lines = ["*raw"]
+                for port in ports:
+                    lines.append(f"-I PREROUTING -p tcp --dport {port}")
+                    lines.append(f"-I OUTPUT -p tcp --sport {port}")
+                lines.append("COMMIT")
+                result = subprocess.run(
+                    ["sudo", "iptables-restore", *_XTABLES_WAIT, "--noflush"],
+                    input="\n".join(lines) + "\n",
                     capture_output=True,
-                    timeout=5
+                    text=True,
+                    timeout=10
                 )
-                
+                if result.returncode != 0:
+                    logger.error(f"iptables-restore failed: {result.stderr.strip()}")
+                    return False
+                logger.info(f"Initialized iptables rules for ports: {ports}")
+            
+            for port in ports:
                 self._port_traffic[port] = PortTrafficStats(port=port)
             
             self._iptables_initialized = True
-            logger.info(f"Initialized iptables rules for ports: {ports}")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Failed to init iptables rules: {e}")
             return False
     
+    def _init_ipset_rules(self, ports: list) -> bool:
+        """
+        创建端口集合并安装引用集合的 iptables 规则
+        
+        Args:
+            ports: 要监控的端口列表
+        
+        Returns:
+            bool: 是否成功，ipset 不可用时返回 False
+        """
+        # 集合和所有端口通过一次 ipset restore 创建，-exist 使重复执行时保留已有计数
+        lines = []
+        for set_name in (_IPSET_IN, _IPSET_OUT):
+            lines.append(f"create {set_name} bitmap:port range 0-65535 counters")
+            for port in ports:
+                lines.append(f"add {set_name} {port}")
+        
+        try:
+            result = subprocess.run(
+                ["sudo", "ipset", "restore", "-exist"],
+                input="\n".join(lines) + "\n",
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"ipset unavailable, falling back to per-port iptables rules: {e}")
+            return False
+        if result.returncode != 0:
+            logger.warning(f"ipset failed, falling back to per-port iptables rules: {result.stderr.strip()}")
+            return False
+        
+        rules = (
+            ["PREROUTING", "-p", "tcp", "-m", "set", "--match-set", _IPSET_IN, "dst"],
+            ["OUTPUT", "-p", "tcp", "-m", "set", "--match-set", _IPSET_OUT, "src"],
+        )
+        try:
+            for rule in rules:
+                # 规则已存在时不重复添加
+                check = subprocess.run(["sudo", "iptables", *_XTABLES_WAIT, "-t", "raw", "-C", *rule], capture_output=True, timeout=5)
+                if check.returncode == 0:
+                    continue
+                # 插入失败（如缺少 xt_set 模块、等待锁超时或没有 sudo 权限）时集合不会被计数
+                insert = subprocess.run(
+                    ["sudo", "iptables", *_XTABLES_WAIT, "-t", "raw", "-I", *rule],
+                    capture_output=True,
+                    text=True,
+                    timeout=5
+                )
+                if insert.returncode != 0:
+                    logger.warning(f"Failed to add ipset iptables rule, falling back to per-port iptables rules: {insert.stderr.strip()}")
+                    return False
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Failed to add ipset iptables rules, falling back to per-port iptables rules: {e}")
+            return False
+        
+        return True
+    
     def get_port_traffic_from_iptables(self, port: int) -> Tuple[int, int]:
         """
         从 iptables 获取端口流量
         
         Args:
             port: 端口号
-            
+        
+        Returns:
+            Tuple[int, int]: (发送字节数, 接收字节数)，读取失败时为 (0, 0)
+        """
+        return self._read_port_counters(port) or (0, 0)
+    
+    def _read_port_counters(self, port: int) -> Optional[Tuple[int, int]]:
+        """
+        从 iptables 读取单个端口规则的流量计数
+        
+        Args:
+            port: 端口号
+        
         Returns:
-            Tuple[int, int]: (发送字节数, 接收字节数)
+            Optional[Tuple[int, int]]: (发送字节数, 接收字节数)，
+                iptables 调用失败或两条规则都不存在时返回 None
         """
         bytes_sent = 0
         bytes_recv = 0
+        found = False
         
         try:
             # 获取入站流量（接收）
             result = subprocess.run(
-                ["sudo", "iptables", "-L", "INPUT", "-v", "-n", "-x"],
+                ["sudo", "iptables", *_XTABLES_WAIT, "-t", "raw", "-L", "PREROUTING", "-v", "-n", "-x"],
                 capture_output=True,
                 text=True,
                 timeout=5
             )
             
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if f"dpt:{port}" in line:
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            try:
-                                bytes_recv = int(parts[1])
-                            except ValueError:
-                                pass
-                        break
+            if result.returncode != 0:
+                return None
+            for line in result.stdout.split('\n'):
+                if f"dpt:{port}" in line:
+                    parts = line.split()
+                    if len(parts) >= 2:
+                        try:
+                            bytes_recv = int(parts[1])
+                            found = True
+                        except ValueError:
+                            pass
+                    break
             
             # 获取出站流量（发送）
             result = subprocess.run(
-                ["sudo", "iptables", "-L", "OUTPUT", "-v", "-n", "-x"],
+                ["sudo", "iptables", *_XTABLES_WAIT, "-t", "raw", "-L", "OUTPUT", "-v", "-n", "-x"],
                 capture_output=True,
                 text=True,
                 timeout=5
             )
             
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if f"spt:{port}" in line:
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            try:
-                                bytes_sent = int(parts[1])
-                            except ValueError:
-                                pass
-                        break
-                        
+            if result.returncode != 0:
+                return None
+            for line in result.stdout.split('\n'):
+                if f"spt:{port}" in line:
+                    parts = line.split()
+                    if len(parts) >= 2:
+                        try:
+                            bytes_sent = int(parts[1])
+                            found = True
+                        except ValueError:
+                            pass
+                    break
+        
         except Exception as e:
             logger.warning(f"Failed to get port traffic from iptables: {e}")
+            return None
         
-        return (bytes_sent, bytes_recv)
+        return (bytes_sent, bytes_recv) if found else None
+    
+    def _read_iptables_counters(self) -> Optional[Dict[int, Tuple[int, int]]]:
+        """
+        通过一次 iptables-save -c 读取 raw 表中所有端口规则的流量计数
+        
+        Returns:
+            Optional[Dict[int, Tuple[int, int]]]: {端口: (发送字节数, 接收字节数)}，读取失败返回 None
+        """
+        try:
+            result = subprocess.run(
+                ["sudo", "iptables-save", "-c", "-t", "raw"],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+        except Exception as e:
+            logger.warning(f"Failed to run iptables-save: {e}")
+            return None
+        
+        if result.returncode != 0:
+            logger.warning(f"iptables-save failed: {result.stderr.strip()}")
+            return None
+        
+        return _parse_iptables_counters(result.stdout)
+    
+    def _read_ipset_counters(self) -> Optional[Dict[int, Tuple[int, int]]]:
+        """
+        通过一次 ipset save 读取端口集合中所有端口的流量计数
+        
+        Returns:
+            Optional[Dict[int, Tuple[int, int]]]: {端口: (发送字节数, 接收字节数)}，读取失败返回 None
+        """
+        try:
+            result = subprocess.run(
+                ["sudo", "ipset", "save"],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+        except Exception as e:
+            logger.warning(f"Failed to run ipset save: {e}")
+            return None
+        
+        if result.returncode != 0:
+            logger.warning(f"ipset save failed: {result.stderr.strip()}")
+            return None
+        
+        return _parse_ipset_counters(result.stdout)
+    
+    def _query_port_traffic(self, ports: list) -> Dict[int, Tuple[int, int]]:
+        """
+        并发地逐个端口查询 iptables 流量计数
+        
+        Args:
+            ports: 端口列表
+        
+        Returns:
+            Dict[int, Tuple[int, int]]: {端口: (发送字节数, 接收字节数)}，不含读取失败的端口
+        """
+        counters: Dict[int, Tuple[int, int]] = {}
+        if not ports:
+            return counters
+        
+        workers = min(self.MAX_TRAFFIC_WORKERS, len(ports))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="PortTraffic") as executor:
+            futures = {
+                executor.submit(self._read_port_counters, port): port
+                for port in ports
+            }
+            for future in as_completed(futures):
+                reading = future.result()
+                if reading is not None:
+                    counters[futures[future]] = reading
+        
+        return counters
     
     def collect_port_traffic(self, ports: list) -> Dict[int, Dict[str, int]]:
         """
@@ -273,30 +587,54 @@ class SystemMonitor:
         
         Args:
             ports: 端口列表
-            
+        
         Returns:
             Dict[int, Dict[str, int]]: {端口: {bytes_sent, bytes_recv, delta_sent, delta_recv}}
         """
         result = {}
         
+        # 一次读取所有端口的计数。使用 ipset 时 raw 表中只有引用集合的规则，
+        # ipset save 失败时本轮没有数据；否则 iptables-save 失败时逐个端口查询
+        if self._ipset_initialized:
+            counters = self._read_ipset_counters() or {}
+        else:
+            counters = self._read_iptables_counters()
+            if counters is None:
+                counters = self._query_port_traffic(ports)
+        
         for port in ports:
-            current_sent, current_recv = self.get_port_traffic_from_iptables(port)
-            
             # 获取上次的值
             if port not in self._port_traffic:
                 self._port_traffic[port] = PortTrafficStats(port=port)
             
             stats = self._port_traffic[port]
             
-            # 计算增量
-            delta_sent = max(0, current_sent - stats.last_bytes_sent) if stats.last_bytes_sent > 0 else 0
-            delta_recv = max(0, current_recv - stats.last_bytes_recv) if stats.last_bytes_recv > 0 else 0
+            # 本轮没有读到该端口的计数（读取失败或规则不存在）时不更新基准值，
+            # 否则下次读到的累计值会被当作清零后的增量重复计入
+            reading = counters.get(port)
+            if reading is None:
+                result[port] = {
+                    'bytes_sent': stats.bytes_sent,
+                    'bytes_recv': stats.bytes_recv,
+                    'delta_sent': 0,
+                    'delta_recv': 0
+                }
+                continue
+            current_sent, current_recv = reading
+            
+            # 计算增量，首次采集只记录基准值
+            if stats.sampled:
+                delta_sent = _counter_delta(current_sent, stats.last_bytes_sent)
+                delta_recv = _counter_delta(current_recv, stats.last_bytes_recv)
+            else:
+                delta_sent = delta_recv = 0
             
             # 更新累计值
             stats.bytes_sent += delta_sent
             stats.bytes_recv += delta_recv
             stats.last_bytes_sent = current_sent
             stats.last_bytes_recv = current_recv
+            stats.sampled = True
             
             result[port] = {
                 'bytes_sent': stats.bytes_sent,
@@ -320,6 +658,7 @@ class SystemMonitor:
             return
         
         self._stop_event.clear()
+        self._wakeup_event.clear()
         self._traffic_collector_thread = threading.Thread(
             target=self._traffic_collector_loop,
             args=(ports, interval),
@@ -331,32 +670,47 @@ class SystemMonitor:
     def stop_traffic_collector(self):
         """停止流量采集"""
         self._stop_event.set()
+        self._wakeup_event.set()
         if self._traffic_collector_thread:
             self._traffic_collector_thread.join(timeout=5)
         logger.info("Stopped traffic collector")
     
+    def request_traffic_collection(self):
+        """请求采集线程立即进行一次采集，不必等到下一个采集间隔"""
+        self._wakeup_event.set()
+    
     def _traffic_collector_loop(self, ports: list, interval: int):
         """流量采集循环"""
         while not self._stop_event.is_set():
+            # 先清除唤醒标记，采集期间到达的请求会触发下一轮采集
+            self._wakeup_event.clear()
             try:
                 traffic_data = self.collect_port_traffic(ports)
                 
                 # 保存到数据库
                 if self._database:
+                    connections = None
                     for port, data in traffic_data.items():
                         if data['delta_sent'] > 0 or data['delta_recv'] > 0:
+                            # 本轮有流量时才读取一次连接表
+                            if connections is None:
+                                connections = self.get_port_connections(ports)
                             self._database.update_port_traffic(
                                 local_port=port,
                                 bytes_sent=data['delta_sent'],
                                 bytes_recv=data['delta_recv'],
-                                connections=self.get_connection_count(port)
+                                connections=connections[port]
                             )
-                
+            
             except Exception as e:
                 logger.error(f"Error in traffic collector: {e}")
             
-            # 等待下一次采集
-            self._stop_event.wait(timeout=interval)
+            # 本轮开头的 clear() 可能清掉了停止时设置的唤醒标记，等待前重新检查
+            if self._stop_event.is_set():
+                break
+            
+            # 等待下一次采集，停止或请求立即采集时提前返回
+            self._wakeup_event.wait(timeout=interval)
     
     def get_system_metrics(self) -> dict:
         """
@@ -365,7 +719,7 @@ class SystemMonitor:
         Returns:
             dict: 系统指标
         """
-        network_stats = self.get_network_stats()
+        network_stats = self._get_network_stats_cached()
         send_speed, recv_speed = self.get_network_speed()
         total_connections = self.get_connection_count()
         
@@ -391,12 +745,10 @@ class SystemMonitor:
         """格式化字节数"""
         if bytes_value < 1024:
             return f"{bytes_value:.0f} B"
-        elif bytes_value < 1024 * 1024:
-            return f"{bytes_value / 1024:.1f} KB"
-        elif bytes_value < 1024 * 1024 * 1024:
-            return f"{bytes_value / (1024 * 1024):.2f} MB"
-        else:
-            return f"{bytes_value / (1024 * 1024 * 1024):.2f} GB"
+        # 按整数位数直接定位单位（每 10 位一级），超过 GB 的仍以 GB 显示
+        exponent = min((int(bytes_value).bit_length() - 1) // 10, len(_BYTE_UNITS) - 1)
+        unit, precision = _BYTE_UNITS[exponent]
+        return f"{bytes_value / (1 << (10 * exponent)):.{precision}f} {unit}"
 
 
 # 全局实例
@@ -8,11 +8,44 @@ import re
 import json
 import logging
 from typing import Optional, Dict, Any
-from urllib.parse import urlparse, parse_qs, unquote
+from urllib.parse import unquote_plus
 from .models import UpstreamProxy
 
 logger = logging.getLogger(__name__)
 
+# vless://uuid@server:port[/path][?query][#name]，IPv6 地址写在方括号中；名称不保存到配置中
+_VLESS_URL_RE = re.compile(
+    r'^vless://(?:(?P<uuid>[^@/?#]*)@)?'
+    r'(?P<server>\[[^\]/?#]*\]|[^:/?#]*)'
+    r'(?::(?P<port>\d*))?'
+    r'(?:/[^?#]*)?'
+    r'(?:\?(?P<query>[^#]*))?'
+    r'(?:#.*)?$',
+    re.DOTALL
+)
+
+
+def _parse_query(query: Optional[str]) -> Dict[str, str]:
+    """
+    解析 URL 查询参数
+    
+    与 parse_qs 一致：值做 URL 解码，空值忽略，同名参数取第一个
+    
+    Args:
+        query: 查询字符串（不含 "?"）
+        
+    Returns:
+        Dict[str, str]: {参数名: 参数值}
+    """
+    params: Dict[str, str] = {}
+    if not query:
+        return params
+    for pair in query.split("&"):
+        key, _, value = pair.partition("=")
+        if value:
+            params.setdefault(unquote_plus(key), unquote_plus(value))
+    return params
+
 
 class VLESSParseError(Exception):
     """VLESS 解析错误"""
@@ -47,62 +80,62 @@ class VLESSParser:
                 raise VLESSParseError("URL must start with 'vless://'")
             
             # 解析 URL
-            parsed = urlparse(vless_url)
+            match = _VLESS_URL_RE.match(vless_url)
+            if not match:
+                raise VLESSParseError("Invalid VLESS URL format")
             
             # 提取 UUID
-            uuid = parsed.username
+            uuid = match.group("uuid")
             if not uuid:
                 raise VLESSParseError("UUID not found in URL")
             
             # 提取服务器和端口
-            server = parsed.hostname
-            port = parsed.port
+            server = match.group("server").strip("[]").lower()
+            port_str = match.group("port")
+            port = int(port_str) if port_str else None
             
             if not server:
                 raise VLESSParseError("Server address not found in URL")
             if not port:
                 raise VLESSParseError("Port not found in URL")
+            if port > 65535:
+                raise VLESSParseError(f"Port out of range 0-65535: {port}")
             
             # 解析查询参数
-            params = parse_qs(parsed.query)
-            
-            # 提取参数（parse_qs 返回列表，取第一个值）
-            def get_param(key: str, default: Optional[str] = None) -> Optional[str]:
-                values = params.get(key, [])
-                return values[0] if values else default
+            params = _parse_query(match.group("query"))
             
-            encryption = get_param("encryption", "none")
-            security = get_param("security", "none")  # none, tls, reality
-            network = get_param("type", "tcp")  # tcp, ws, grpc, http
-            flow = get_param("flow")
+            encryption = params.get("encryption", "none")
+            security = params.get("security", "none")  # none, tls, reality
+            network = params.get("type", "tcp")  # tcp, ws, grpc, http
+            flow = params.get("flow")
             
             # TLS 配置
             tls = security in ["tls", "reality"]
-            sni = get_param("sni")
-            alpn_str = get_param("alpn")
+            sni = params.get("sni")
+            alpn_str = params.get("alpn")
             alpn = alpn_str.split(",") if alpn_str else None
             
-            # Reality 配置
+            # Reality 配置，仅 security=reality 时读取相关参数
             reality = security == "reality"
-            reality_public_key = get_param("pbk") if reality else None  # pbk = public key
-            reality_short_id = get_param("sid") if reality else None  # sid = short id
-            reality_server_name = sni if reality else None  # Reality 使用 SNI 作为服务器名
-            reality_fingerprint = get_param("fp") if reality else None  # fp = fingerprint
+            reality_public_key = None
+            reality_short_id = None
+            reality_server_name = None
+            reality_fingerprint = None
+            if reality:
+                reality_public_key = params.get("pbk")  # pbk = public key
+                reality_short_id = params.get("sid")  # sid = short id
+                reality_server_name = sni  # Reality 使用 SNI 作为服务器名
+                reality_fingerprint = params.get("fp")  # fp = fingerprint
             
-            # WebSocket 配置
+            # 传输层配置，只读取当前 network 对应的参数
             ws_path = None
             ws_host = None
-            if network == "ws":
-                ws_path = get_param("path", "/")
-                ws_host = get_param("host")
-            
-            # gRPC 配置
             grpc_service_name = None
-            if network == "grpc":
-                grpc_service_name = get_param("serviceName")
-            
-            # 提取名称（fragment）
-            name = unquote(parsed.fragment) if parsed.fragment else None
+            if network == "ws":
+                ws_path = params.get("path", "/")
+                ws_host = params.get("host")
+            elif network == "grpc":
+                grpc_service_name = params.get("serviceName")
             
             logger.info(f"Successfully parsed VLESS URL: {server}:{port}, Reality: {reality}")
             
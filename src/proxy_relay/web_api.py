@@ -6,16 +6,17 @@ Web API 模块
 
 import logging
 import asyncio
-import json
 import subprocess
+from datetime import datetime, timezone
 from typing import Optional, List
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, Depends, status, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, Field
+from pydantic_core import to_json
 
 from .config_manager import ConfigManager
 from .proxy_manager import ProxyManager
@@ -29,11 +30,48 @@ from .models import (
     APIProviderConfig,
     ResponseFormat,
     Config,
+    ProxyProtocol,
+    HttpMethod,
+    ResponseFormatType,
+    LogLevel,
+    MonitoringStatus,
 )
 
 logger = logging.getLogger(__name__)
 
 
+def _json_response(content, status_code: int = status.HTTP_200_OK) -> Response:
+    """
+    使用 pydantic-core 的 C 实现直接编码 JSON 响应
+    
+    Web 界面轮询的端点返回较大的嵌套字典，直接返回 Response 可以跳过 FastAPI 对
+    返回值逐层执行的 jsonable_encoder
+    
+    Args:
+        content: 可 JSON 序列化的数据（dict、list、dataclass 等）
+        status_code: HTTP 状态码（直接返回 Response 时路由上声明的状态码不生效）
+        
+    Returns:
+        Response: application/json 响应
+    """
+    return Response(content=to_json(content), status_code=status_code, media_type="application/json")
+
+
+def _utc_isoformat(value: Optional[str]) -> Optional[str]:
+    """
+    将数据库中的 UTC 时间字符串转换为带时区偏移的 ISO 格式
+    
+    Args:
+        value: 数据库时间字符串（YYYY-MM-DD HH:MM:SS，UTC），可为 None
+        
+    Returns:
+        Optional[str]: 带 +00:00 偏移的 ISO 时间字符串
+    """
+    if value is None:
+        return None
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).isoformat()
+
+
 # ==================== Pydantic 模型 ====================
 
 class UpstreamProxyModel(BaseModel):
@@ -42,7 +80,7 @@ class UpstreamProxyModel(BaseModel):
     port: int = Field(ge=1, le=65535)
     username: Optional[str] = None
     password: Optional[str] = None
-    protocol: str = "socks5"
+    protocol: ProxyProtocol = "socks5"
     # VLESS 特定字段
     uuid: Optional[str] = None
     flow: Optional[str] = None
@@ -78,7 +116,7 @@ class ProxyConfigModel(BaseModel):
 
 class ResponseFormatModel(BaseModel):
     """API响应格式模型"""
-    type: str
+    type: ResponseFormatType
     success_code: Optional[int] = None
     success_field: Optional[str] = None
     success_value: Optional[str] = None
@@ -95,7 +133,7 @@ class APIProviderConfigModel(BaseModel):
     name: str
     enabled: bool = True
     endpoint: str
-    method: str = "GET"
+    method: HttpMethod = "GET"
     params: Optional[dict] = None
     headers: Optional[dict] = None
     body: Optional[dict] = None
@@ -127,7 +165,7 @@ class APIProviderUpdateModel(BaseModel):
     name: Optional[str] = None
     enabled: Optional[bool] = None
     endpoint: Optional[str] = None
-    method: Optional[str] = None
+    method: Optional[HttpMethod] = None
     params: Optional[dict] = None
     headers: Optional[dict] = None
     body: Optional[dict] = None
@@ -172,11 +210,104 @@ class UpstreamProxyPoolUpdateModel(BaseModel):
     tags: Optional[List[str]] = None
 
 
+def _build_upstream_proxy(model: UpstreamProxyModel) -> UpstreamProxy:
+    """
+    由已通过 Pydantic 校验的请求模型构建 UpstreamProxy
+    
+    代理、出口代理池的创建和更新接口共用，保证 VLESS/Reality/传输层字段一致地复制
+    
+    Args:
+        model: 上游代理请求模型
+        
+    Returns:
+        UpstreamProxy: 上游代理配置
+    """
+    return UpstreamProxy(
+        server=model.server,
+        port=model.port,
+        username=model.username,
+        password=model.password,
+        protocol=model.protocol,
+        # VLESS 特定字段
+        uuid=model.uuid,
+        flow=model.flow,
+        encryption=model.encryption or "none",
+        network=model.network or "tcp",
+        tls=model.tls or False,
+        sni=model.sni,
+        alpn=model.alpn,
+        # Reality 配置
+        reality=model.reality or False,
+        reality_public_key=model.reality_public_key,
+        reality_short_id=model.reality_short_id,
+        reality_server_name=model.reality_server_name,
+        reality_fingerprint=model.reality_fingerprint,
+        # WebSocket/gRPC 配置
+        ws_path=model.ws_path,
+        ws_host=model.ws_host,
+        grpc_service_name=model.grpc_service_name
+    )
+
+
+def _serialize_proxy(
+    proxy: ProxyConfig,
+    monitoring_status: Optional[MonitoringStatus] = None,
+    mask_passwords: bool = False
+) -> dict:
+    """
+    将代理配置转换为接口返回的字典
+    
+    代理列表、单个代理以及创建、更新接口共用，保证返回字段一致
+    
+    Args:
+        proxy: 代理配置
+        monitoring_status: 监控状态（可选）
+        mask_passwords: 是否将密码替换为 "***"
+        
+    Returns:
+        dict: 代理配置字典（时间字段保持 datetime，由 _json_response 编码）
+    """
+    upstream_dict = None
+    if proxy.upstream is not None:
+        upstream = proxy.upstream
+        upstream_dict = {
+            "server": upstream.server,
+            "port": upstream.port,
+            "username": upstream.username,
+            "password": "***" if mask_passwords and upstream.password else upstream.password,
+            "protocol": upstream.protocol
+        }
+    
+    status_dict = None
+    if monitoring_status is not None:
+        status_dict = {
+            "enabled": monitoring_status.enabled,
+            "failure_count": monitoring_status.failure_count,
+            "last_check_time": monitoring_status.last_check_time,
+            "last_success_time": monitoring_status.last_success_time
+        }
+    
+    return {
+        "local_port": proxy.local_port,
+        "name": proxy.name,
+        "upstream_id": proxy.upstream_id,  # v1.2.0 新增
+        "api_provider_id": proxy.api_provider_id,
+        "upstream": upstream_dict,
+        "monitoring_enabled": proxy.monitoring_enabled,
+        "monitoring_status": status_dict,
+        "local_username": proxy.local_username,
+        "local_password": "***" if mask_passwords and proxy.local_password else proxy.local_password
+    }
+
+
 # ==================== FastAPI 应用 ====================
 
 class WebAPI:
     """Web API 类"""
     
+    # 写操作等待合并其他并发写操作后再应用 sing-box 配置的时间（秒）
+    APPLY_DEBOUNCE = 0.05
+    
     def __init__(
         self,
         config_manager: ConfigManager,
@@ -202,6 +333,9 @@ class WebAPI:
         self._sse_clients: List[asyncio.Queue] = []
         self._sse_lock = asyncio.Lock()
         
+        # 等待应用的 sing-box 配置批次（由第一个写请求创建，其余并发写请求共享结果）
+        self._pending_apply: Optional[asyncio.Task] = None
+        
         # 启动后台任务监控状态变化
         self._monitoring_task = None
         
@@ -360,7 +494,7 @@ class WebAPI:
         获取所有代理配置
         
         Returns:
-            List[dict]: 代理配置列表
+            Response: 代理配置列表（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -381,46 +515,23 @@ class WebAPI:
             # 构建响应
             proxies = []
             for proxy in config.proxies:
-                monitoring_status = monitoring_statuses.get(proxy.local_port)
-                traffic = traffic_stats.get(proxy.local_port, {})
+                traffic = traffic_stats.get(proxy.local_port)
+                total_sent = traffic.total_bytes_sent if traffic else 0
+                total_recv = traffic.total_bytes_recv if traffic else 0
                 
-                proxy_dict = {
-                    "local_port": proxy.local_port,
-                    "name": proxy.name,
-                    "upstream_id": proxy.upstream_id,  # v1.2.0 新增
-                    "api_provider_id": proxy.api_provider_id,
-                    "upstream": {
-                        "server": proxy.upstream.server,
-                        "port": proxy.upstream.port,
-                        "username": proxy.upstream.username,
-                        "password": proxy.upstream.password,
-                        "protocol": proxy.upstream.protocol
-                    } if proxy.upstream else None,
-                    "monitoring_enabled": proxy.monitoring_enabled,
-                    "monitoring_status": None,
-                    "local_username": proxy.local_username,
-                    "local_password": proxy.local_password,
-                    "connections": port_connections.get(proxy.local_port, 0),
-                    "traffic": {
-                        "total_sent": traffic.get('total_bytes_sent', 0),
-                        "total_recv": traffic.get('total_bytes_recv', 0),
-                        "total_sent_formatted": self._format_bytes(traffic.get('total_bytes_sent', 0)),
-                        "total_recv_formatted": self._format_bytes(traffic.get('total_bytes_recv', 0))
-                    }
+                proxy_dict = _serialize_proxy(proxy, monitoring_statuses.get(proxy.local_port))
+                proxy_dict["connections"] = port_connections.get(proxy.local_port, 0)
+                proxy_dict["traffic"] = {
+                    "total_sent": total_sent,
+                    "total_recv": total_recv,
+                    "total_sent_formatted": self._format_bytes(total_sent),
+                    "total_recv_formatted": self._format_bytes(total_recv)
                 }
                 
-                if monitoring_status:
-                    proxy_dict["monitoring_status"] = {
-                        "enabled": monitoring_status.enabled,
-                        "failure_count": monitoring_status.failure_count,
-                        "last_check_time": monitoring_status.last_check_time.isoformat() if monitoring_status.last_check_time else None,
-                        "last_success_time": monitoring_status.last_success_time.isoformat() if monitoring_status.last_success_time else None
-                    }
-                
                 proxies.append(proxy_dict)
             
             logger.info(f"Retrieved {len(proxies)} proxy configurations")
-            return {"proxies": proxies}
+            return _json_response({"proxies": proxies})
             
         except Exception as e:
             logger.error(f"Failed to get proxies: {e}")
@@ -449,7 +560,7 @@ class WebAPI:
             proxy: 代理配置
             
         Returns:
-            dict: 创建的代理配置
+            Response: 创建的代理配置（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -457,17 +568,15 @@ class WebAPI:
                 config = self.config_manager.load_config()
             
             # 检查端口是否已存在
-            for existing_proxy in config.proxies:
-                if existing_proxy.local_port == proxy.local_port:
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail=f"Proxy with port {proxy.local_port} already exists"
-                    )
+            if self.config_manager.get_proxy_config(proxy.local_port) is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Proxy with port {proxy.local_port} already exists"
+                )
             
             # 如果指定了 API 提供商，检查其是否存在
             if proxy.api_provider_id:
-                provider_exists = any(p.id == proxy.api_provider_id for p in config.api_providers)
-                if not provider_exists:
+                if self.config_manager.get_api_provider_config(proxy.api_provider_id) is None:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail=f"API provider '{proxy.api_provider_id}' not found"
@@ -490,24 +599,7 @@ class WebAPI:
                 pass
             elif proxy.upstream:
                 # 手动输入的上游代理
-                upstream = UpstreamProxy(
-                    server=proxy.upstream.server,
-                    port=proxy.upstream.port,
-                    username=proxy.upstream.username,
-                    password=proxy.upstream.password,
-                    protocol=proxy.upstream.protocol,
-                    # VLESS 特定字段
-                    uuid=proxy.upstream.uuid,
-                    flow=proxy.upstream.flow,
-                    encryption=proxy.upstream.encryption or "none",
-                    network=proxy.upstream.network or "tcp",
-                    tls=proxy.upstream.tls or False,
-                    sni=proxy.upstream.sni,
-                    alpn=proxy.upstream.alpn,
-                    ws_path=proxy.upstream.ws_path,
-                    ws_host=proxy.upstream.ws_host,
-                    grpc_service_name=proxy.upstream.grpc_service_name
-                )
+                upstream = _build_upstream_proxy(proxy.upstream)
             elif proxy.api_provider_id:
                 # 通过 API 获取上游代理
                 try:
@@ -548,7 +640,7 @@ class WebAPI:
             
             # 应用sing-box配置
             try:
-                self.proxy_manager.apply_singbox_config()
+                await self._schedule_apply()
                 logger.info(f"sing-box configuration applied successfully for proxy {proxy.name}")
             except Exception as apply_error:
                 # 配置应用失败，回滚
@@ -562,28 +654,8 @@ class WebAPI:
             
             logger.info(f"Created proxy: {proxy.name} (port {proxy.local_port})")
             
-            # 构建返回数据
-            result = {
-                "local_port": new_proxy.local_port,
-                "name": new_proxy.name,
-                "upstream_id": new_proxy.upstream_id,  # v1.2.0 新增
-                "api_provider_id": new_proxy.api_provider_id,
-                "upstream": None,
-                "monitoring_enabled": new_proxy.monitoring_enabled,
-                "local_username": new_proxy.local_username,
-                "local_password": "***" if new_proxy.local_password else None
-            }
-            
-            if new_proxy.upstream:
-                result["upstream"] = {
-                    "server": new_proxy.upstream.server,
-                    "port": new_proxy.upstream.port,
-                    "username": new_proxy.upstream.username,
-                    "password": "***" if new_proxy.upstream.password else None,
-                    "protocol": new_proxy.upstream.protocol
-                }
-            
-            return result
+            # 构建返回数据（不回显密码）
+            return _json_response(_serialize_proxy(new_proxy, mask_passwords=True), status.HTTP_201_CREATED)
             
         except HTTPException:
             raise
@@ -602,7 +674,7 @@ class WebAPI:
             port: 本地端口号
             
         Returns:
-            dict: 代理配置
+            Response: 代理配置（JSON）
         """
         try:
             proxy_config = self.config_manager.get_proxy_config(port)
@@ -613,37 +685,10 @@ class WebAPI:
                 )
             
             # 获取监控状态
-            monitoring_statuses = self.health_monitor.get_monitoring_status()
-            monitoring_status = monitoring_statuses.get(port)
-            
-            proxy_dict = {
-                "local_port": proxy_config.local_port,
-                "name": proxy_config.name,
-                "upstream_id": proxy_config.upstream_id,  # v1.2.0 新增
-                "api_provider_id": proxy_config.api_provider_id,
-                "upstream": {
-                    "server": proxy_config.upstream.server,
-                    "port": proxy_config.upstream.port,
-                    "username": proxy_config.upstream.username,
-                    "password": proxy_config.upstream.password,
-                    "protocol": proxy_config.upstream.protocol
-                } if proxy_config.upstream else None,
-                "monitoring_enabled": proxy_config.monitoring_enabled,
-                "monitoring_status": None,
-                "local_username": proxy_config.local_username,
-                "local_password": proxy_config.local_password
-            }
-            
-            if monitoring_status:
-                proxy_dict["monitoring_status"] = {
-                    "enabled": monitoring_status.enabled,
-                    "failure_count": monitoring_status.failure_count,
-                    "last_check_time": monitoring_status.last_check_time.isoformat() if monitoring_status.last_check_time else None,
-                    "last_success_time": monitoring_status.last_success_time.isoformat() if monitoring_status.last_success_time else None
-                }
+            monitoring_status = self.health_monitor.get_port_status(port)
             
             logger.info(f"Retrieved proxy configuration for port {port}")
-            return proxy_dict
+            return _json_response(_serialize_proxy(proxy_config, monitoring_status))
             
         except HTTPException:
             raise
@@ -663,7 +708,7 @@ class WebAPI:
             proxy_update: 更新的配置
             
         Returns:
-            dict: 更新后的代理配置
+            Response: 更新后的代理配置（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -671,12 +716,7 @@ class WebAPI:
                 config = self.config_manager.load_config()
             
             # 查找代理配置
-            proxy_config = None
-            for proxy in config.proxies:
-                if proxy.local_port == port:
-                    proxy_config = proxy
-                    break
-            
+            proxy_config = self.config_manager.get_proxy_config(port)
             if not proxy_config:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -701,8 +741,7 @@ class WebAPI:
             
             if proxy_update.api_provider_id is not None:
                 # 检查API提供商是否存在
-                provider_exists = any(p.id == proxy_update.api_provider_id for p in config.api_providers)
-                if not provider_exists:
+                if self.config_manager.get_api_provider_config(proxy_update.api_provider_id) is None:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail=f"API provider '{proxy_update.api_provider_id}' not found"
@@ -712,24 +751,7 @@ class WebAPI:
             # 处理上游代理配置
             if proxy_update.upstream is not None:
                 # 手动输入的上游代理（向后兼容）
-                proxy_config.upstream = UpstreamProxy(
-                    server=proxy_update.upstream.server,
-                    port=proxy_update.upstream.port,
-                    username=proxy_update.upstream.username,
-                    password=proxy_update.upstream.password,
-                    protocol=proxy_update.upstream.protocol,
-                    # VLESS 特定字段
-                    uuid=proxy_update.upstream.uuid,
-                    flow=proxy_update.upstream.flow,
-                    encryption=proxy_update.upstream.encryption or "none",
-                    network=proxy_update.upstream.network or "tcp",
-                    tls=proxy_update.upstream.tls or False,
-                    sni=proxy_update.upstream.sni,
-                    alpn=proxy_update.upstream.alpn,
-                    ws_path=proxy_update.upstream.ws_path,
-                    ws_host=proxy_update.upstream.ws_host,
-                    grpc_service_name=proxy_update.upstream.grpc_service_name
-                )
+                proxy_config.upstream = _build_upstream_proxy(proxy_update.upstream)
                 # 清空 upstream_id
                 proxy_config.upstream_id = None
             elif proxy_update.fetch_from_api and proxy_config.api_provider_id:
@@ -759,26 +781,11 @@ class WebAPI:
             self.config_manager.save_config(config)
             
             # 应用sing-box配置
-            self.proxy_manager.apply_singbox_config()
+            await self._schedule_apply()
             
             logger.info(f"Updated proxy configuration for port {port}")
             
-            return {
-                "local_port": proxy_config.local_port,
-                "name": proxy_config.name,
-                "upstream_id": proxy_config.upstream_id,  # v1.2.0 新增
-                "api_provider_id": proxy_config.api_provider_id,
-                "upstream": {
-                    "server": proxy_config.upstream.server,
-                    "port": proxy_config.upstream.port,
-                    "username": proxy_config.upstream.username,
-                    "password": proxy_config.upstream.password,
-                    "protocol": proxy_config.upstream.protocol
-                } if proxy_config.upstream else None,
-                "monitoring_enabled": proxy_config.monitoring_enabled,
-                "local_username": proxy_config.local_username,
-                "local_password": proxy_config.local_password
-            }
+            return _json_response(_serialize_proxy(proxy_config, self.health_monitor.get_port_status(port)))
             
         except HTTPException:
             raise
@@ -789,6 +796,35 @@ class WebAPI:
                 detail=f"Failed to update proxy: {str(e)}"
             )
     
+    async def _schedule_apply(self) -> None:
+        """
+        应用sing-box配置，合并短时间内的并发写操作
+        
+        第一个请求创建批次任务，任务等待 APPLY_DEBOUNCE 秒，期间其他请求修改的配置
+        合并为一批，在工作线程中只生成、写入并重载一次 sing-box；返回时本次修改已经生效。
+        所有请求（包括创建批次的请求）都通过 shield 等待批次任务，取消单个请求
+        不会取消本批次的应用，也不会影响其他请求
+        
+        Raises:
+            Exception: 应用配置失败时，本批次的所有请求都收到同一个异常
+        """
+        batch = self._pending_apply
+        if batch is None:
+            batch = self._pending_apply = asyncio.create_task(self._apply_batch())
+        await asyncio.shield(batch)
+    
+    async def _apply_batch(self) -> None:
+        """等待其他写操作加入本批次，然后统一应用 sing-box 配置"""
+        try:
+            await asyncio.sleep(self.APPLY_DEBOUNCE)
+        finally:
+            # 之后到达的写操作开始新的批次
+            self._pending_apply = None
+        
+        # 写入、fsync 和重载（可能重启服务）在工作线程中执行，不阻塞事件循环；
+        # apply_singbox_config 持有 ProxyManager 的应用锁，与上游代理切换串行
+        await asyncio.to_thread(self.proxy_manager.apply_singbox_config)
+    
     async def delete_proxy(self, port: int):
         """
         删除代理
@@ -801,35 +837,30 @@ class WebAPI:
             if not config:
                 config = self.config_manager.load_config()
             
-            # 查找并删除代理配置
-            proxy_index = None
-            for i, proxy in enumerate(config.proxies):
-                if proxy.local_port == port:
-                    proxy_index = i
-                    break
-            
-            if proxy_index is None:
+            # 查找代理配置
+            deleted_proxy = self.config_manager.get_proxy_config(port)
+            if deleted_proxy is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Proxy with port {port} not found"
                 )
             
             # 如果监控正在运行，先停止监控
-            monitoring_statuses = self.health_monitor.get_monitoring_status()
-            if port in monitoring_statuses and monitoring_statuses[port].enabled:
+            monitoring_status = self.health_monitor.get_port_status(port)
+            if monitoring_status and monitoring_status.enabled:
                 try:
                     self.health_monitor.stop_monitoring(port)
                 except Exception as e:
                     logger.warning(f"Failed to stop monitoring for port {port}: {e}")
             
             # 删除代理配置
-            deleted_proxy = config.proxies.pop(proxy_index)
+            config.proxies.remove(deleted_proxy)
             
             # 保存配置
             self.config_manager.save_config(config)
             
             # 应用sing-box配置
-            self.proxy_manager.apply_singbox_config()
+            await self._schedule_apply()
             
             # 删除监控状态
             self.database.delete_monitoring_state(port)
@@ -1006,7 +1037,7 @@ class WebAPI:
             port: 本地端口号
             
         Returns:
-            dict: 监控状态
+            Response: 监控状态（JSON）
         """
         try:
             # 检查代理配置是否存在
@@ -1018,31 +1049,30 @@ class WebAPI:
                 )
             
             # 获取监控状态
-            monitoring_statuses = self.health_monitor.get_monitoring_status()
-            monitoring_status = monitoring_statuses.get(port)
+            monitoring_status = self.health_monitor.get_port_status(port)
             
             if not monitoring_status:
                 # 监控未启动
-                return {
+                return _json_response({
                     "port": port,
                     "enabled": False,
                     "failure_count": 0,
                     "last_check_time": None,
                     "last_success_time": None
-                }
+                })
             
-            return {
+            return _json_response({
                 "port": port,
                 "enabled": monitoring_status.enabled,
                 "failure_count": monitoring_status.failure_count,
-                "last_check_time": monitoring_status.last_check_time.isoformat() if monitoring_status.last_check_time else None,
-                "last_success_time": monitoring_status.last_success_time.isoformat() if monitoring_status.last_success_time else None,
+                "last_check_time": monitoring_status.last_check_time,
+                "last_success_time": monitoring_status.last_success_time,
                 "current_upstream": {
                     "server": monitoring_status.current_upstream.server,
                     "port": monitoring_status.current_upstream.port,
                     "protocol": monitoring_status.current_upstream.protocol
                 } if monitoring_status.current_upstream else None
-            }
+            })
             
         except HTTPException:
             raise
@@ -1074,11 +1104,15 @@ class WebAPI:
                     detail=f"Proxy with port {port} not found"
                 )
             
-            # 从API获取新代理
-            new_upstream = self.proxy_manager.get_new_proxy_from_api(proxy_config.api_provider_id)
+            # 从API获取新代理（HTTP 请求和切换都会阻塞，在工作线程中执行）
+            new_upstream = await asyncio.to_thread(
+                self.proxy_manager.get_new_proxy_from_api,
+                proxy_config.api_provider_id
+            )
             
-            # 切换代理
-            success = self.proxy_manager.switch_upstream_proxy(
+            # 切换代理（等待合并并发切换并重载 sing-box）
+            success = await asyncio.to_thread(
+                self.proxy_manager.switch_upstream_proxy,
                 local_port=port,
                 new_upstream=new_upstream,
                 reason="manual"
@@ -1183,7 +1217,7 @@ class WebAPI:
         获取系统状态
         
         Returns:
-            dict: 系统状态信息
+            Response: 系统状态信息（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -1221,7 +1255,7 @@ class WebAPI:
             proxy_ports = [p.local_port for p in config.proxies]
             port_connections = system_monitor.get_port_connections(proxy_ports)
             
-            return {
+            return _json_response({
                 "status": "running",
                 "total_proxies": total_proxies,
                 "active_monitoring": active_monitoring,
@@ -1237,7 +1271,7 @@ class WebAPI:
                 },
                 "metrics": system_metrics,
                 "port_connections": port_connections
-            }
+            })
             
         except Exception as e:
             logger.error(f"Failed to get system status: {e}")
@@ -1251,7 +1285,7 @@ class WebAPI:
         获取系统实时监控指标
         
         Returns:
-            dict: 系统监控指标
+            Response: 系统监控指标（JSON）
         """
         try:
             system_monitor = get_system_monitor()
@@ -1267,7 +1301,7 @@ class WebAPI:
             
             metrics["port_connections"] = port_connections
             
-            return metrics
+            return _json_response(metrics)
             
         except Exception as e:
             logger.error(f"Failed to get system metrics: {e}")
@@ -1285,20 +1319,22 @@ class WebAPI:
             offset: 偏移量
             
         Returns:
-            dict: 日志列表
+            Response: 日志列表（JSON）
         """
         try:
             # 获取健康检查日志
             health_logs = self.database.get_health_check_logs(limit=limit, offset=offset)
+            for log in health_logs:
+                log["timestamp"] = _utc_isoformat(log["timestamp"])
             
             logger.info(f"Retrieved {len(health_logs)} health check logs")
             
-            return {
+            return _json_response({
                 "logs": health_logs,
                 "limit": limit,
                 "offset": offset,
                 "total": len(health_logs)
-            }
+            })
             
         except Exception as e:
             logger.error(f"Failed to get logs: {e}")
@@ -1317,51 +1353,51 @@ class WebAPI:
             offset: 偏移量
             
         Returns:
-            dict: 切换历史列表
+            Response: 切换历史列表（JSON）
         """
         try:
             # 获取切换历史
-            history_entries = self.database.get_switch_history(
+            batch = self.database.get_switch_history_batch(
                 local_port=port,
                 limit=limit,
                 offset=offset
             )
             
-            # 转换为字典列表
-            history = []
-            for entry in history_entries:
-                history_dict = {
-                    "id": entry.id,
-                    "local_port": entry.local_port,
-                    "old_upstream": None,
-                    "new_upstream": {
-                        "server": entry.new_upstream.server,
-                        "port": entry.new_upstream.port,
-                        "protocol": entry.new_upstream.protocol
-                    },
-                    "reason": entry.reason,
-                    "timestamp": entry.timestamp.isoformat(),
-                    "success": entry.success
+            # 去重后的上游代理只转换一次，各行按下标引用
+            upstreams = [
+                {
+                    "server": upstream.server,
+                    "port": upstream.port,
+                    "protocol": upstream.protocol
                 }
-                
-                if entry.old_upstream:
-                    history_dict["old_upstream"] = {
-                        "server": entry.old_upstream.server,
-                        "port": entry.old_upstream.port,
-                        "protocol": entry.old_upstream.protocol
-                    }
-                
-                history.append(history_dict)
+                for upstream in batch.upstreams
+            ]
+            
+            # 直接遍历列数组转换为字典列表
+            history = []
+            for i, (entry_id, local_port, old_id, new_id, reason, success) in enumerate(zip(
+                batch.ids, batch.local_ports, batch.old_upstream_ids,
+                batch.new_upstream_ids, batch.reasons, batch.successes
+            )):
+                history.append({
+                    "id": entry_id,
+                    "local_port": local_port,
+                    "old_upstream": None if old_id < 0 else upstreams[old_id],
+                    "new_upstream": upstreams[new_id],
+                    "reason": reason,
+                    "timestamp": batch.timestamp(i).isoformat(),
+                    "success": bool(success)
+                })
             
             logger.info(f"Retrieved {len(history)} switch history entries")
             
-            return {
+            return _json_response({
                 "history": history,
                 "port": port,
                 "limit": limit,
                 "offset": offset,
                 "total": len(history)
-            }
+            })
             
         except Exception as e:
             logger.error(f"Failed to get history: {e}")
@@ -1680,7 +1716,7 @@ class WebAPI:
         获取系统配置
         
         Returns:
-            dict: 系统配置
+            Response: 系统配置（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -1704,12 +1740,14 @@ class WebAPI:
                     "check_interval": config.monitoring.check_interval,
                     "failure_threshold": config.monitoring.failure_threshold,
                     "check_timeout": config.monitoring.check_timeout,
-                    "check_url": config.monitoring.check_url
+                    "check_url": config.monitoring.check_url,
+                    "check_mode": config.monitoring.check_mode,
+                    "check_method": config.monitoring.check_method
                 }
             }
             
             logger.info("Retrieved system configuration")
-            return config_dict
+            return _json_response(config_dict)
             
         except Exception as e:
             logger.error(f"Failed to get config: {e}")
@@ -1729,6 +1767,26 @@ class WebAPI:
             dict: 更新后的配置
         """
         try:
+            # 先校验检查方式和请求方法，避免部分更新后才发现参数无效
+            check_mode = str(config_update.get("monitoring", {}).get("check_mode", "http"))
+            if check_mode not in ["tcp", "socks_handshake", "http"]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid check_mode: {check_mode}"
+                )
+            check_method = str(config_update.get("monitoring", {}).get("check_method", "GET")).upper()
+            if check_method not in ["GET", "HEAD"]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid check_method: {check_method}"
+                )
+            log_level = str(config_update.get("system", {}).get("log_level", "INFO"))
+            if log_level not in LogLevel.__members__:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid log_level: {log_level}"
+                )
+            
             config = self.config_manager._current_config
             if not config:
                 config = self.config_manager.load_config()
@@ -1739,7 +1797,7 @@ class WebAPI:
                 if "web_port" in system_update:
                     config.system.web_port = int(system_update["web_port"])
                 if "log_level" in system_update:
-                    config.system.log_level = str(system_update["log_level"])
+                    config.system.log_level = LogLevel(log_level)
                 if "log_file" in system_update:
                     config.system.log_file = str(system_update["log_file"])
                 if "database" in system_update:
@@ -1756,6 +1814,10 @@ class WebAPI:
                     config.monitoring.check_timeout = int(monitoring_update["check_timeout"])
                 if "check_url" in monitoring_update:
                     config.monitoring.check_url = str(monitoring_update["check_url"])
+                if "check_mode" in monitoring_update:
+                    config.monitoring.check_mode = check_mode
+                if "check_method" in monitoring_update:
+                    config.monitoring.check_method = check_method
             
             # 保存配置
             self.config_manager.save_config(config)
@@ -1775,10 +1837,14 @@ class WebAPI:
                     "check_interval": config.monitoring.check_interval,
                     "failure_threshold": config.monitoring.failure_threshold,
                     "check_timeout": config.monitoring.check_timeout,
-                    "check_url": config.monitoring.check_url
+                    "check_url": config.monitoring.check_url,
+                    "check_mode": config.monitoring.check_mode,
+                    "check_method": config.monitoring.check_method
                 }
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Failed to update config: {e}")
             raise HTTPException(
@@ -1793,7 +1859,7 @@ class WebAPI:
         获取所有API提供商
         
         Returns:
-            dict: API提供商列表
+            Response: API提供商列表（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -1827,7 +1893,7 @@ class WebAPI:
                 providers.append(provider_dict)
             
             logger.info(f"Retrieved {len(providers)} API providers")
-            return {"providers": providers}
+            return _json_response({"providers": providers})
             
         except Exception as e:
             logger.error(f"Failed to get API providers: {e}")
@@ -1852,12 +1918,11 @@ class WebAPI:
                 config = self.config_manager.load_config()
             
             # 检查ID是否已存在
-            for existing_provider in config.api_providers:
-                if existing_provider.id == provider.id:
-                    raise HTTPException(
-                        status_code=status.HTTP_409_CONFLICT,
-                        detail=f"API provider with id '{provider.id}' already exists"
-                    )
+            if self.config_manager.get_api_provider_config(provider.id) is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"API provider with id '{provider.id}' already exists"
+                )
             
             # 创建新的API提供商配置
             response_format = ResponseFormat(
@@ -1923,7 +1988,7 @@ class WebAPI:
             provider_id: API提供商ID
             
         Returns:
-            dict: API提供商配置
+            Response: API提供商配置（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -1931,26 +1996,21 @@ class WebAPI:
                 config = self.config_manager.load_config()
             
             # 查找API提供商
-            provider_config = None
-            for provider in config.api_providers:
-                if provider.id == provider_id:
-                    provider_config = provider
-                    break
-            
+            provider_config = self.config_manager.get_api_provider_config(provider_id)
             if not provider_config:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"API provider with id '{provider_id}' not found"
                 )
             
-            return {
+            return _json_response({
                 "id": provider_config.id,
                 "name": provider_config.name,
                 "enabled": provider_config.enabled,
                 "endpoint": provider_config.endpoint,
                 "method": provider_config.method,
-                "params": provider_config.params,
-                "headers": provider_config.headers,
+                "params": dict(provider_config.params),
+                "headers": dict(provider_config.headers),
                 "body": provider_config.body,
                 "timeout": provider_config.timeout,
                 "retry_attempts": provider_config.retry_attempts,
@@ -1966,7 +2026,7 @@ class WebAPI:
                     "username_field": provider_config.response_format.username_field,
                     "password_field": provider_config.response_format.password_field
                 }
-            }
+            })
             
         except HTTPException:
             raise
@@ -1994,12 +2054,7 @@ class WebAPI:
                 config = self.config_manager.load_config()
             
             # 查找API提供商
-            provider_config = None
-            for provider in config.api_providers:
-                if provider.id == provider_id:
-                    provider_config = provider
-                    break
-            
+            provider_config = self.config_manager.get_api_provider_config(provider_id)
             if not provider_config:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -2131,12 +2186,7 @@ class WebAPI:
                 config = self.config_manager.load_config()
             
             # 查找API提供商
-            provider_config = None
-            for provider in config.api_providers:
-                if provider.id == provider_id:
-                    provider_config = provider
-                    break
-            
+            provider_config = self.config_manager.get_api_provider_config(provider_id)
             if not provider_config:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -2302,8 +2352,8 @@ class WebAPI:
                     proxy_dict["monitoring_status"] = {
                         "enabled": monitoring_status.enabled,
                         "failure_count": monitoring_status.failure_count,
-                        "last_check_time": monitoring_status.last_check_time.isoformat() if monitoring_status.last_check_time else None,
-                        "last_success_time": monitoring_status.last_success_time.isoformat() if monitoring_status.last_success_time else None,
+                        "last_check_time": monitoring_status.last_check_time,
+                        "last_success_time": monitoring_status.last_success_time,
                         "is_healthy": monitoring_status.failure_count == 0
                     }
                 
@@ -2329,7 +2379,7 @@ class WebAPI:
         Returns:
             str: 格式化的SSE消息
         """
-        return f"data: {json.dumps(data)}\n\n"
+        return f"data: {to_json(data).decode()}\n\n"
     
     def _get_timestamp(self) -> str:
         """
@@ -2480,7 +2530,7 @@ class WebAPI:
         获取所有出口代理池配置
         
         Returns:
-            dict: 出口代理池列表
+            Response: 出口代理池列表（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -2532,7 +2582,7 @@ class WebAPI:
                 upstream_proxies.append(upstream_dict)
             
             logger.info(f"Retrieved {len(upstream_proxies)} upstream proxy configurations")
-            return {"upstream_proxies": upstream_proxies}
+            return _json_response({"upstream_proxies": upstream_proxies})
             
         except Exception as e:
             logger.error(f"Failed to get upstream proxies: {e}")
@@ -2566,31 +2616,7 @@ class WebAPI:
             
             # 创建上游代理配置
             from .models import UpstreamProxyPool
-            proxy = UpstreamProxy(
-                server=upstream.proxy.server,
-                port=upstream.proxy.port,
-                username=upstream.proxy.username,
-                password=upstream.proxy.password,
-                protocol=upstream.proxy.protocol,
-                # VLESS 特定字段
-                uuid=upstream.proxy.uuid,
-                flow=upstream.proxy.flow,
-                encryption=upstream.proxy.encryption or "none",
-                network=upstream.proxy.network or "tcp",
-                tls=upstream.proxy.tls or False,
-                sni=upstream.proxy.sni,
-                alpn=upstream.proxy.alpn,
-                # Reality 配置
-                reality=upstream.proxy.reality or False,
-                reality_public_key=upstream.proxy.reality_public_key,
-                reality_short_id=upstream.proxy.reality_short_id,
-                reality_server_name=upstream.proxy.reality_server_name,
-                reality_fingerprint=upstream.proxy.reality_fingerprint,
-                # WebSocket/gRPC 配置
-                ws_path=upstream.proxy.ws_path,
-                ws_host=upstream.proxy.ws_host,
-                grpc_service_name=upstream.proxy.grpc_service_name
-            )
+            proxy = _build_upstream_proxy(upstream.proxy)
             
             new_upstream = UpstreamProxyPool(
                 id=upstream.id,
@@ -2639,7 +2665,7 @@ class WebAPI:
             upstream_id: 出口代理 ID
             
         Returns:
-            dict: 出口代理配置
+            Response: 出口代理配置（JSON）
         """
         try:
             config = self.config_manager._current_config
@@ -2701,7 +2727,7 @@ class WebAPI:
                 })
             
             logger.info(f"Retrieved upstream proxy: {upstream_id}")
-            return result
+            return _json_response(result)
             
         except HTTPException:
             raise
@@ -2756,31 +2782,7 @@ class WebAPI:
             
             if upstream_update.proxy is not None:
                 # 更新代理配置
-                upstream.proxy = UpstreamProxy(
-                    server=upstream_update.proxy.server,
-                    port=upstream_update.proxy.port,
-                    username=upstream_update.proxy.username,
-                    password=upstream_update.proxy.password,
-                    protocol=upstream_update.proxy.protocol,
-                    # VLESS 特定字段
-                    uuid=upstream_update.proxy.uuid,
-                    flow=upstream_update.proxy.flow,
-                    encryption=upstream_update.proxy.encryption or "none",
-                    network=upstream_update.proxy.network or "tcp",
-                    tls=upstream_update.proxy.tls or False,
-                    sni=upstream_update.proxy.sni,
-                    alpn=upstream_update.proxy.alpn,
-                    # Reality 配置
-                    reality=upstream_update.proxy.reality or False,
-                    reality_public_key=upstream_update.proxy.reality_public_key,
-                    reality_short_id=upstream_update.proxy.reality_short_id,
-                    reality_server_name=upstream_update.proxy.reality_server_name,
-                    reality_fingerprint=upstream_update.proxy.reality_fingerprint,
-                    # WebSocket/gRPC 配置
-                    ws_path=upstream_update.proxy.ws_path,
-                    ws_host=upstream_update.proxy.ws_host,
-                    grpc_service_name=upstream_update.proxy.grpc_service_name
-                )
+                upstream.proxy = _build_upstream_proxy(upstream_update.proxy)
             
             # 保存配置
             self.config_manager.save_config(config)
@@ -2789,7 +2791,7 @@ class WebAPI:
             usage_count = sum(1 for p in config.proxies if p.upstream_id == upstream_id)
             if usage_count > 0:
                 try:
-                    self.proxy_manager.apply_singbox_config()
+                    await self._schedule_apply()
                     logger.info(f"Applied sing-box configuration after updating upstream proxy {upstream_id}")
                 except Exception as apply_error:
                     logger.error(f"Failed to apply sing-box config: {apply_error}")
@@ -2982,7 +2984,11 @@ try:
     
     # 创建组件实例
     _config_manager = ConfigManager(config_path)
-    _database = Database(_config_manager._current_config.system.database if _config_manager._current_config else "/var/lib/proxy-relay/data.db")
+    _current_config = _config_manager._current_config
+    if _current_config:
+        _database = Database(_current_config.system.database, keep_raw_usage=_current_config.system.keep_raw_usage)
+    else:
+        _database = Database("/var/lib/proxy-relay/data.db")
     _proxy_manager = ProxyManager(_config_manager, database=_database)
     _health_monitor = HealthMonitor(_config_manager, _proxy_manager, _database)
     
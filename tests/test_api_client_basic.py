@@ -84,7 +84,7 @@ class TestAPIClientInitialization:
 class TestAPIRequest:
     """测试API请求功能"""
     
-    @patch('src.proxy_relay.api_client.requests.get')
+    @patch('src.proxy_relay.api_client.requests.Session.get')
     def test_make_request_get_success(self, mock_get, api_provider_91http):
         """测试GET请求成功"""
         # 模拟响应
@@ -108,7 +108,7 @@ class TestAPIRequest:
         assert "data" in result
         mock_get.assert_called_once()
     
-    @patch('src.proxy_relay.api_client.requests.post')
+    @patch('src.proxy_relay.api_client.requests.Session.post')
     def test_make_request_post_success(self, mock_post, api_provider_custom):
         """测试POST请求成功"""
         # 模拟响应
@@ -132,7 +132,7 @@ class TestAPIRequest:
         assert "data" in result
         mock_post.assert_called_once()
     
-    @patch('src.proxy_relay.api_client.requests.get')
+    @patch('src.proxy_relay.api_client.requests.Session.get')
     def test_make_request_timeout(self, mock_get, api_provider_91http):
         """测试请求超时"""
         mock_get.side_effect = requests.exceptions.Timeout()
@@ -144,7 +144,7 @@ class TestAPIRequest:
         
         assert "timeout" in str(exc_info.value).lower()
     
-    @patch('src.proxy_relay.api_client.requests.get')
+    @patch('src.proxy_relay.api_client.requests.Session.get')
     @patch('src.proxy_relay.api_client.time.sleep')
     def test_make_request_retry(self, mock_sleep, mock_get, api_provider_91http):
         """测试请求重试机制"""
@@ -190,6 +190,25 @@ class TestAPIResponseParsing:
         assert proxy.port == 12234
         assert proxy.protocol == "socks5"
     
+    def test_parse_response_shares_equal_upstreams(self, api_provider_91http):
+        """测试相同的代理响应解析为同一个共享实例"""
+        response = {
+            "code": 0,
+            "msg": "OK",
+            "data": {
+                "proxy_list": [
+                    {"ip": "8.8.8.8", "port": 12234}
+                ]
+            }
+        }
+        
+        client = APIClient(api_provider_91http)
+        first = client.parse_api_response(response, api_provider_91http.response_format)
+        second = client.parse_api_response(response, api_provider_91http.response_format)
+        
+        assert first is second
+        assert UpstreamProxy.intern(server="8.8.8.8", port=12235) is not first
+    
     def test_parse_91http_response_error_code(self, api_provider_91http):
         """测试解析91HTTP错误响应"""
         response = {
@@ -303,7 +322,7 @@ class TestExtractValueByPath:
 class TestGetNewProxy:
     """测试获取新代理功能"""
     
-    @patch('src.proxy_relay.api_client.requests.get')
+    @patch('src.proxy_relay.api_client.requests.Session.get')
     def test_get_new_proxy_success(self, mock_get, api_provider_91http):
         """测试成功获取新代理"""
         mock_response = Mock()
@@ -326,7 +345,7 @@ class TestGetNewProxy:
         assert proxy.server == "8.8.8.8"
         assert proxy.port == 12234
     
-    @patch('src.proxy_relay.api_client.requests.get')
+    @patch('src.proxy_relay.api_client.requests.Session.get')
     def test_get_new_proxy_failure(self, mock_get, api_provider_91http):
         """测试获取新代理失败"""
         mock_get.side_effect = requests.exceptions.Timeout()
@@ -340,7 +359,7 @@ class TestGetNewProxy:
 class TestConnectionTest:
     """测试连接测试功能"""
     
-    @patch('src.proxy_relay.api_client.requests.get')
+    @patch('src.proxy_relay.api_client.requests.Session.get')
     def test_connection_success(self, mock_get, api_provider_91http):
         """测试连接成功"""
         mock_response = Mock()
@@ -353,7 +372,7 @@ class TestConnectionTest:
         
         assert result is True
     
-    @patch('src.proxy_relay.api_client.requests.get')
+    @patch('src.proxy_relay.api_client.requests.Session.get')
     def test_connection_failure(self, mock_get, api_provider_91http):
         """测试连接失败"""
         mock_get.side_effect = requests.exceptions.ConnectionError()
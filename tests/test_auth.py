@@ -6,6 +6,7 @@ import pytest
 from fastapi import HTTPException
 from fastapi.security import HTTPBasicCredentials
 
+from src.proxy_relay import auth as auth_module
 from src.proxy_relay.auth import (
     hash_password,
     verify_password,
@@ -149,6 +150,42 @@ class TestAuthMiddleware:
         assert exc_info.value.status_code == 401
         assert "Incorrect username or password" in exc_info.value.detail
 
+    
+    def test_auth_reuses_verified_credentials(self, monkeypatch):
+        """测试相同凭据只执行一次 bcrypt 验证，密码哈希变化后重新验证"""
+        password = "test_password_123"
+        auth_config = WebAuthConfig(
+            enabled=True,
+            username="admin",
+            password_hash=hash_password(password)
+        )
+        middleware = AuthMiddleware(auth_config)
+        
+        calls = []
+        original_verify = auth_module.verify_password
+        
+        def counting_verify(plain_password, hashed_password):
+            calls.append(plain_password)
+            return original_verify(plain_password, hashed_password)
+        
+        monkeypatch.setattr(auth_module, "verify_password", counting_verify)
+        
+        credentials = HTTPBasicCredentials(username="admin", password=password)
+        assert middleware.verify_credentials(credentials) == "admin"
+        assert middleware.verify_credentials(credentials) == "admin"
+        assert len(calls) == 1
+        
+        # 错误的密码不会命中缓存
+        with pytest.raises(HTTPException):
+            middleware.verify_credentials(HTTPBasicCredentials(username="admin", password="wrong_password"))
+        assert len(calls) == 2
+        
+        # 修改密码后旧凭据失效
+        auth_config.password_hash = hash_password("new_password")
+        with pytest.raises(HTTPException):
+            middleware.verify_credentials(credentials)
+        assert len(calls) == 3
+
 
 class TestCreateAuthDependency:
     """创建认证依赖测试"""
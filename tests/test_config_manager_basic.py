@@ -7,7 +7,9 @@
 import os
 import tempfile
 import pytest
-from src.proxy_relay.config_manager import ConfigManager
+import yaml
+from unittest.mock import patch
+from src.proxy_relay.config_manager import ConfigManager, clear_config_cache
 from src.proxy_relay.models import (
     Config,
     SystemConfig,
@@ -131,6 +133,37 @@ def test_config_validation():
     assert len(errors) == 0
 
 
+def test_validate_config_unknown_provider_reference():
+    """测试 validate_config 报告引用不存在的 API 提供商"""
+    manager = ConfigManager()
+    
+    config = Config(
+        system=SystemConfig(web_auth=WebAuthConfig(enabled=False)),
+        monitoring=MonitoringConfig(),
+        api_providers=[
+            APIProviderConfig(
+                id="test",
+                name="Test",
+                enabled=True,
+                endpoint="https://test.com",
+                response_format=ResponseFormat(type="custom")
+            )
+        ],
+        upstream_proxies=[],
+        proxies=[
+            ProxyConfig(local_port=1080, name="Proxy 1", api_provider_id="test"),
+            ProxyConfig(local_port=1081, name="Proxy 2", api_provider_id="test")
+        ]
+    )
+    assert manager.validate_config(config) == []
+    
+    # 构造后修改引用，绕过 Config 自身的校验
+    config.proxies[1].api_provider_id = "missing"
+    assert manager.validate_config(config) == [
+        "proxies[1].api_provider_id 'missing' not found in api_providers"
+    ]
+
+
 def test_invalid_port_validation():
     """测试无效端口验证"""
     # 测试端口范围验证
@@ -143,6 +176,14 @@ def test_invalid_port_validation():
         )
 
 
+def test_invalid_check_mode():
+    """测试无效的健康检查方式"""
+    with pytest.raises(ValueError, match="Invalid check_mode"):
+        MonitoringConfig(check_mode="icmp")
+    with pytest.raises(ValueError, match="Invalid check_method"):
+        MonitoringConfig(check_method="POST")
+
+
 def test_get_proxy_config():
     """测试获取代理配置"""
     with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
@@ -197,7 +238,180 @@ def test_get_proxy_config():
         proxy = manager.get_proxy_config(9999)
         assert proxy is None
         
+        # 获取API提供商配置
+        assert manager.get_api_provider_config("test").name == "Test"
+        assert manager.get_api_provider_config("missing") is None
+        
+        # 保存配置后索引重建
+        loaded = manager._current_config
+        loaded.proxies.pop()
+        manager.save_config(loaded)
+        assert manager.get_proxy_config(1081) is None
+        assert manager.get_proxy_config(1080).name == "Proxy 1"
+        
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+
+def test_on_change_callback():
+    """测试配置变更回调"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+        temp_path = f.name
+    
+    try:
+        config = Config(
+            system=SystemConfig(
+                web_port=8080,
+                web_auth=WebAuthConfig(enabled=False),
+                log_level="INFO",
+                log_file="/var/log/test.log",
+                database="/var/lib/test.db"
+            ),
+            monitoring=MonitoringConfig(),
+            api_providers=[],
+            proxies=[],
+            upstream_proxies=[]
+        )
+        
+        manager = ConfigManager(temp_path)
+        received = []
+        
+        # 配置未加载时注册不会立即回调
+        manager.on_change(received.append)
+        assert received == []
+        
+        manager.save_config(config)
+        assert received == [config]
+        
+        loaded = manager.load_config()
+        assert received[-1] is loaded
+        
+        # 配置已加载时注册会立即回调一次
+        late = []
+        manager.on_change(late.append)
+        assert late == [loaded]
+        
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+
+def test_load_config_reuses_parsed_yaml():
+    """测试内容未变化时重复加载不再解析 YAML"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+        f.write("""
+system:
+  web_port: 8080
+  web_auth:
+    enabled: false
+monitoring:
+  check_interval: 30
+api_providers: []
+proxies:
+  - local_port: 1080
+    name: Proxy 1
+""")
+        temp_path = f.name
+    
+    try:
+        clear_config_cache()
+        manager = ConfigManager(temp_path)
+        
+        with patch('src.proxy_relay.config_manager.yaml.load', wraps=yaml.load) as mock_load:
+            first = manager.load_config()
+            second = manager.load_config()
+            
+            assert mock_load.call_count == 1
+        
+        # 每次加载得到独立的配置对象
+        assert first is not second
+        assert first.proxies[0].name == second.proxies[0].name
+        first.proxies[0].name = "Changed"
+        assert manager.load_config().proxies[0].name == "Proxy 1"
+        
+    finally:
+        clear_config_cache()
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+def test_reload_config_skips_unchanged_file():
+    """测试文件内容未变化时重新加载直接返回当前配置"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+        f.write("""
+system:
+  web_port: 8080
+  web_auth:
+    enabled: false
+monitoring:
+  check_interval: 30
+api_providers: []
+proxies:
+  - local_port: 1080
+    name: Proxy 1
+""")
+        temp_path = f.name
+    
+    try:
+        manager = ConfigManager(temp_path)
+        received = []
+        manager.on_change(received.append)
+        
+        loaded = manager.load_config()
+        assert manager.reload_config() is loaded
+        assert received == [loaded]
+        
+        # 内容变化后重新加载得到新的配置对象
+        with open(temp_path, 'a', encoding='utf-8') as f:
+            f.write("  - local_port: 1081\n    name: Proxy 2\n")
+        reloaded = manager.reload_config()
+        assert reloaded is not loaded
+        assert len(reloaded.proxies) == 2
+        assert received[-1] is reloaded
+        
+        # 保存后文件内容与当前配置一致，同样跳过
+        manager.save_config(reloaded)
+        assert manager.reload_config() is reloaded
+        
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def test_load_config_skips_read_when_file_metadata_unchanged():
+    """测试文件元数据未变化时不再读取文件内容"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
+        f.write("""
+system:
+  web_port: 8080
+  web_auth:
+    enabled: false
+monitoring:
+  check_interval: 30
+api_providers: []
+proxies:
+  - local_port: 1080
+    name: Proxy 1
+""")
+        temp_path = f.name
+    
+    try:
+        clear_config_cache()
+        ConfigManager(temp_path).load_config()
+        
+        with patch('builtins.open', side_effect=AssertionError("file re-read")):
+            config = ConfigManager(temp_path).load_config()
+        assert config.proxies[0].name == "Proxy 1"
+        
+        # 修改文件后重新读取
+        with open(temp_path, 'a', encoding='utf-8') as f:
+            f.write("  - local_port: 1081\n    name: Proxy 2\n")
+        assert len(ConfigManager(temp_path).load_config().proxies) == 2
+        
     finally:
+        clear_config_cache()
         if os.path.exists(temp_path):
             os.unlink(temp_path)
 
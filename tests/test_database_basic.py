@@ -7,7 +7,8 @@
 import pytest
 import tempfile
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
 from src.proxy_relay.database import Database
@@ -52,6 +53,41 @@ def test_database_initialization(temp_db):
             WHERE type='table' AND name='monitoring_state'
         """)
         assert cursor.fetchone() is not None
+        
+        # 检查结构版本已写入
+        cursor.execute("PRAGMA user_version")
+        assert cursor.fetchone()[0] == Database.SCHEMA_VERSION
+
+
+def test_database_reopen_skips_schema_init(temp_db):
+    """测试结构版本一致时重复打开数据库不再执行 DDL"""
+    temp_db.insert_health_check_log(1080, "proxy1.com", 10000, True, 100)
+    
+    reopened = Database(temp_db.db_path)
+    logs = reopened.get_health_check_logs(local_port=1080)
+    assert len(logs) == 1
+
+
+def test_migrate_legacy_local_timestamps(temp_db):
+    """测试 v2 数据库中本地时间 isoformat 写入的时间迁移为 UTC 格式，并与新记录正确排序"""
+    legacy = datetime(2024, 1, 2, 3, 4, 5, 123456)
+    expected = legacy.astimezone(timezone.utc).replace(tzinfo=None).isoformat(sep=' ')
+    
+    with temp_db._get_connection() as conn:
+        with conn:
+            conn.execute("""
+                INSERT INTO health_check_log (local_port, upstream_server, upstream_port, check_result, timestamp)
+                VALUES (1080, 'proxy1.com', 10000, 1, ?)
+            """, (legacy.isoformat(),))
+            conn.execute("PRAGMA user_version = 2")
+    temp_db.insert_health_check_logs([(1080, "proxy1.com", 10000, True, 100, None, 1700000000000)])
+    
+    reopened = Database(temp_db.db_path)
+    logs = reopened.get_health_check_logs(local_port=1080)
+    assert [log['timestamp'] for log in logs] == [expected, "2023-11-14 22:13:20"]
+    
+    with reopened._get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == Database.SCHEMA_VERSION
 
 
 def test_insert_switch_history(temp_db):
@@ -115,6 +151,96 @@ def test_insert_switch_history_without_old_upstream(temp_db):
     assert history[0].old_upstream is None
 
 
+def test_switch_history_timestamp_ns(temp_db):
+    """测试切换历史时间以纪元纳秒保存，并可转换为 UTC datetime"""
+    ts = datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc)
+    temp_db.insert_switch_history(
+        local_port=1080,
+        old_upstream=None,
+        new_upstream=UpstreamProxy(server="new.proxy.com", port=10001),
+        reason="manual",
+        success=True,
+        timestamp=ts
+    )
+    
+    entry = temp_db.get_switch_history(local_port=1080)[0]
+    assert entry.timestamp_ns == 1704164645123456000
+    assert entry.timestamp == ts
+
+
+
+def test_switch_history_naive_timestamp_is_local_time(temp_db):
+    """测试不带时区的时间戳参数与旧版本记录均按本地时间换算为纪元纳秒"""
+    naive = datetime(2024, 1, 2, 3, 4, 5, 123456)
+    expected_ns = int(naive.timestamp()) * 1_000_000_000 + 123456000
+    upstream = UpstreamProxy(server="new.proxy.com", port=10001)
+    temp_db.insert_switch_history(1080, None, upstream, "manual", True, timestamp=naive)
+    
+    # 模拟旧版本以 isoformat 写入本地时间的记录
+    with temp_db._get_connection() as conn:
+        with conn:
+            conn.execute("""
+                INSERT INTO proxy_switch_history (
+                    local_port, new_upstream_server, new_upstream_port,
+                    new_upstream_protocol, reason, success, timestamp
+                ) VALUES (1081, 'new.proxy.com', 10001, 'socks5', 'manual', 1, ?)
+            """, (naive.isoformat(),))
+            conn.execute("PRAGMA user_version = 2")
+    
+    reopened = Database(temp_db.db_path)
+    history = reopened.get_switch_history()
+    assert [entry.timestamp_ns for entry in history] == [expected_ns, expected_ns]
+
+
+def test_insert_switch_history_many(temp_db):
+    """测试在一个事务中批量插入切换历史"""
+    upstream_a = UpstreamProxy(server="a.proxy.com", port=10001)
+    upstream_b = UpstreamProxy(server="b.proxy.com", port=10002, username="user", password="pass")
+    temp_db.insert_switch_history_many([
+        (1080, None, upstream_a, "manual", True),
+        (1081, upstream_a, upstream_b, "health_check_failed", False),
+    ])
+    
+    history = sorted(temp_db.get_switch_history(), key=lambda e: e.local_port)
+    assert [(e.local_port, e.reason, e.success) for e in history] == [
+        (1080, "manual", True),
+        (1081, "health_check_failed", False),
+    ]
+    assert history[0].old_upstream is None
+    assert history[1].old_upstream.server == "a.proxy.com"
+    assert history[1].new_upstream.username == "user"
+    
+    # 任一行原因无效时不写入任何记录
+    with pytest.raises(ValueError):
+        temp_db.insert_switch_history_many([
+            (1082, None, upstream_a, "manual", True),
+            (1082, upstream_a, upstream_b, "invalid_reason", True),
+        ])
+    assert len(temp_db.get_switch_history()) == 2
+
+
+def test_get_switch_history_batch(temp_db):
+    """测试列式切换历史查询：上游代理去重，row() 还原行对象"""
+    upstream_a = UpstreamProxy(server="a.proxy.com", port=10001)
+    upstream_b = UpstreamProxy(server="b.proxy.com", port=10002)
+    temp_db.insert_switch_history(1080, None, upstream_a, "manual", True)
+    temp_db.insert_switch_history(1080, upstream_a, upstream_b, "health_check_failed", False)
+    temp_db.insert_switch_history(1081, upstream_b, upstream_a, "manual", True)
+    
+    batch = temp_db.get_switch_history_batch()
+    assert len(batch) == 3
+    assert len(batch.upstreams) == 2
+    assert sorted(u.server for u in batch.upstreams) == ["a.proxy.com", "b.proxy.com"]
+    
+    rows = [batch.row(i) for i in range(len(batch))]
+    expected = temp_db.get_switch_history()
+    assert [(r.id, r.local_port, r.reason, r.success, r.timestamp_ns) for r in rows] == \
+        [(e.id, e.local_port, e.reason, e.success, e.timestamp_ns) for e in expected]
+    assert [r.new_upstream.server for r in rows] == [e.new_upstream.server for e in expected]
+    assert [r.old_upstream.server if r.old_upstream else None for r in rows] == \
+        [e.old_upstream.server if e.old_upstream else None for e in expected]
+
+
 def test_insert_switch_history_invalid_reason(temp_db):
     """测试插入切换历史（无效原因）"""
     new_upstream = UpstreamProxy(server="proxy.com", port=10000)
@@ -146,6 +272,10 @@ def test_get_switch_history_with_limit(temp_db):
     # 查询前3条
     history = temp_db.get_switch_history(limit=3)
     assert len(history) == 3
+    
+    # 相同的上游代理共享同一个实例
+    assert history[0].new_upstream is history[1].new_upstream
+    assert history[0].new_upstream == new_upstream
 
 
 def test_insert_health_check_log(temp_db):
@@ -349,3 +479,140 @@ def test_query_health_check_logs_by_port(temp_db):
     
     logs_1081 = temp_db.get_health_check_logs(local_port=1081)
     assert len(logs_1081) == 1
+
+
+def test_get_port_traffic_summary(temp_db):
+    """测试获取端口流量汇总"""
+    temp_db.update_port_traffic(1080, bytes_sent=100, bytes_recv=200, connections=1)
+    temp_db.update_port_traffic(1080, bytes_sent=50, bytes_recv=25, connections=3)
+    temp_db.update_port_traffic(1081, bytes_sent=10, bytes_recv=20)
+    
+    summary = temp_db.get_port_traffic_summary()
+    assert set(summary) == {1080, 1081}
+    assert summary[1080].total_bytes_sent == 150
+    assert summary[1080].total_bytes_recv == 225
+    assert summary[1080].total_connections == 3
+    assert summary[1080].last_updated is not None
+    
+    # 按端口查询
+    summary_1081 = temp_db.get_port_traffic_summary(local_port=1081)
+    assert list(summary_1081) == [1081]
+    assert summary_1081[1081].total_bytes_sent == 10
+
+
+def test_iter_health_check_logs(temp_db):
+    """测试逐行迭代健康检查日志"""
+    for i in range(5):
+        temp_db.insert_health_check_log(1080, "proxy1.com", 10000, True, 100 + i)
+    
+    logs = temp_db.iter_health_check_logs(local_port=1080)
+    first = next(logs)
+    assert first['local_port'] == 1080
+    assert len(list(logs)) == 4
+    
+    # 提前关闭生成器不影响后续查询
+    partial = temp_db.iter_health_check_logs(limit=2)
+    next(partial)
+    partial.close()
+    assert len(temp_db.get_health_check_logs()) == 5
+
+
+def test_iter_health_check_logs_releases_lock_between_rows(temp_db):
+    """测试生成器挂起期间其他线程仍可写入，分页读取不重复不遗漏"""
+    import threading
+    
+    temp_db.ITER_PAGE_SIZE = 2
+    for i in range(5):
+        temp_db.insert_health_check_log(1080, "proxy1.com", 10000, True, 100 + i)
+    existing_ids = {row['id'] for row in temp_db.get_health_check_logs()}
+    
+    logs = temp_db.iter_health_check_logs(local_port=1080)
+    first = next(logs)
+    
+    writer = threading.Thread(
+        target=temp_db.insert_health_check_log,
+        args=(1080, "proxy1.com", 10000, False, None, "Timeout")
+    )
+    writer.start()
+    writer.join(timeout=2)
+    assert not writer.is_alive()
+    
+    ids = [first['id']] + [row['id'] for row in logs]
+    assert len(ids) == len(set(ids))
+    assert set(ids) >= existing_ids
+    assert len(temp_db.get_health_check_logs(local_port=1080)) == 6
+
+
+def test_insert_health_check_logs_batch(temp_db):
+    """测试批量插入健康检查日志"""
+    rows = [
+        (1080, "proxy1.com", 10000, True, 100, None, 1700000000000),
+        (1081, "proxy2.com", 10001, False, None, "Timeout", 1700000001500),
+    ]
+    temp_db.insert_health_check_logs(rows)
+    
+    logs = temp_db.get_health_check_logs(local_port=1081)
+    assert len(logs) == 1
+    assert logs[0]['check_result'] == 0
+    assert logs[0]['error_message'] == "Timeout"
+    assert logs[0]['timestamp'] == "2023-11-14 22:13:21"
+
+
+def test_upsert_monitoring_states_batch(temp_db):
+    """测试批量更新监控状态"""
+    now = time.time_ns()
+    temp_db.upsert_monitoring_states([
+        (1080, True, 0, now, now),
+        (1081, True, 2, now, None),
+    ])
+    temp_db.upsert_monitoring_states([(1081, False, 3, now, None)])
+    
+    state = temp_db.get_monitoring_state(1081)
+    assert state['enabled'] == 0
+    assert state['failure_count'] == 3
+    assert len(temp_db.get_all_monitoring_states()) == 2
+
+
+def test_record_upstream_usage(temp_db):
+    """测试记录出口代理使用（默认只更新汇总表）"""
+    temp_db.record_upstream_usage("us-1", 1080)
+    temp_db.record_upstream_usage("us-1", 1081)
+    temp_db.record_upstream_usage("us-2", 1080)
+    
+    assert temp_db.get_upstream_usage_count("us-1") == 2
+    assert temp_db.get_upstream_usage_count("us-2") == 1
+    assert temp_db.get_upstream_usage_count("missing") == 0
+    
+    with temp_db._get_connection() as conn:
+        raw_count = conn.execute("SELECT COUNT(*) FROM upstream_usage").fetchone()[0]
+    assert raw_count == 0
+
+
+def test_record_upstream_usage_keep_raw(temp_db):
+    """测试启用 keep_raw_usage 时保留原始记录"""
+    db = Database(temp_db.db_path, keep_raw_usage=True)
+    db.record_upstream_usage("us-1", 1080)
+    db.record_upstream_usage("us-1", 1081)
+    
+    assert db.get_upstream_usage_count("us-1") == 2
+    with db._get_connection() as conn:
+        raw_count = conn.execute("SELECT COUNT(*) FROM upstream_usage").fetchone()[0]
+    assert raw_count == 2
+
+
+def test_connection_reused_after_error(temp_db):
+    """测试操作失败后共享连接仍可继续使用"""
+    with pytest.raises(Exception):
+        with temp_db._get_connection() as conn:
+            conn.execute("SELECT * FROM no_such_table")
+    
+    temp_db.insert_health_check_log(1080, "proxy1.com", 10000, True, 100)
+    assert len(temp_db.get_health_check_logs()) == 1
+
+
+def test_close(temp_db):
+    """测试关闭数据库连接"""
+    temp_db.close()
+    
+    with pytest.raises(Exception):
+        temp_db.get_health_check_logs()
@@ -15,6 +15,8 @@ from src.proxy_relay.logging_config import (
     get_logger,
     set_log_level,
     shutdown_logging,
+    flush_logging,
+    get_log_handlers,
     DEFAULT_LOG_FORMAT,
     DEFAULT_MAX_BYTES,
     DEFAULT_BACKUP_COUNT
@@ -34,6 +36,7 @@ class TestLoggingConfig:
         )
         
         assert logger is not None
+        flush_logging()
         assert log_file.exists()
         
         # 清理
@@ -73,6 +76,7 @@ class TestLoggingConfig:
         )
         
         assert log_dir.exists()
+        flush_logging()
         assert log_file.exists()
         
         shutdown_logging()
@@ -90,8 +94,7 @@ class TestLoggingConfig:
         logger.info(test_message)
         
         # 刷新日志
-        for handler in logger.handlers:
-            handler.flush()
+        flush_logging()
         
         # 验证日志内容
         with open(log_file, 'r') as f:
@@ -117,8 +120,7 @@ class TestLoggingConfig:
         logger.error("Error message")  # 应该被记录
         
         # 刷新日志
-        for handler in logger.handlers:
-            handler.flush()
+        flush_logging()
         
         # 验证日志内容
         with open(log_file, 'r') as f:
@@ -150,8 +152,7 @@ class TestLoggingConfig:
         module_logger.info(test_message)
         
         # 刷新日志
-        for handler in logging.getLogger().handlers:
-            handler.flush()
+        flush_logging()
         
         # 验证日志内容
         with open(log_file, 'r') as f:
@@ -181,8 +182,7 @@ class TestLoggingConfig:
         logger.debug("Debug after change")
         
         # 刷新日志
-        for handler in logger.handlers:
-            handler.flush()
+        flush_logging()
         
         # 验证日志内容
         with open(log_file, 'r') as f:
@@ -218,8 +218,7 @@ class TestLoggingConfig:
         logger.info("Test message")
         
         # 刷新日志
-        for handler in logger.handlers:
-            handler.flush()
+        flush_logging()
         
         # 验证日志格式包含必要元素
         with open(log_file, 'r') as f:
@@ -247,8 +246,7 @@ class TestLoggingConfig:
         logger.info("Custom format test")
         
         # 刷新日志
-        for handler in logger.handlers:
-            handler.flush()
+        flush_logging()
         
         # 验证自定义格式
         with open(log_file, 'r') as f:
@@ -263,7 +261,7 @@ class TestLoggingConfig:
         max_bytes = 1024  # 1KB
         backup_count = 3
         
-        logger = setup_logging(
+        setup_logging(
             log_file=str(log_file),
             log_level="INFO",
             max_bytes=max_bytes,
@@ -272,7 +270,7 @@ class TestLoggingConfig:
         
         # 验证处理器配置
         file_handler = None
-        for handler in logger.handlers:
+        for handler in get_log_handlers():
             if isinstance(handler, logging.handlers.RotatingFileHandler):
                 file_handler = handler
                 break
@@ -292,11 +290,13 @@ class TestLoggingConfig:
             log_level="INFO"
         )
         
-        # 应该有两个处理器：文件和控制台
-        assert len(logger.handlers) == 2
+        # 根日志记录器只有一个 QueueHandler
+        assert len(logger.handlers) == 1
+        assert isinstance(logger.handlers[0], logging.handlers.QueueHandler)
         
-        # 验证处理器类型
-        handler_types = [type(h).__name__ for h in logger.handlers]
+        # 后台线程输出到两个处理器：文件和控制台
+        assert len(get_log_handlers()) == 2
+        handler_types = [type(h).__name__ for h in get_log_handlers()]
         assert "RotatingFileHandler" in handler_types
         assert "StreamHandler" in handler_types
         
@@ -326,6 +326,27 @@ class TestLoggingConfig:
         
         shutdown_logging()
     
+    def test_shutdown_logging_writes_pending_records(self, tmp_path):
+        """测试关闭日志系统时写完队列中的日志"""
+        log_file = tmp_path / "test.log"
+        
+        logger = setup_logging(
+            log_file=str(log_file),
+            log_level="INFO"
+        )
+        
+        for i in range(100):
+            logger.info(f"Pending message {i}")
+        
+        shutdown_logging()
+        
+        content = log_file.read_text(encoding='utf-8')
+        assert "Pending message 99" in content
+        assert get_log_handlers() == ()
+        
+        # 重复调用（例如进程退出时的 atexit）不会出错
+        shutdown_logging()
+    
     def test_logging_with_unicode(self, tmp_path):
         """测试日志系统支持Unicode字符"""
         log_file = tmp_path / "test.log"
@@ -340,8 +361,7 @@ class TestLoggingConfig:
         logger.info(chinese_message)
         
         # 刷新日志
-        for handler in logger.handlers:
-            handler.flush()
+        flush_logging()
         
         # 验证Unicode内容
         with open(log_file, 'r', encoding='utf-8') as f:
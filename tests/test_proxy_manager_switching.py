@@ -232,7 +232,7 @@ def test_get_new_proxy_from_api_success(proxy_manager_with_db):
         }
     }
     
-    with patch('src.proxy_relay.api_client.requests.get') as mock_get:
+    with patch('src.proxy_relay.api_client.requests.Session.get') as mock_get:
         mock_get.return_value.status_code = 200
         mock_get.return_value.json.return_value = mock_response
         
@@ -262,7 +262,7 @@ def test_get_new_proxy_from_api_no_client(temp_config_file, sample_config):
         }
     }
     
-    with patch('src.proxy_relay.api_client.requests.get') as mock_get:
+    with patch('src.proxy_relay.api_client.requests.Session.get') as mock_get:
         mock_get.return_value.status_code = 200
         mock_get.return_value.json.return_value = mock_response
         
@@ -0,0 +1,345 @@
+"""
+系统监控测试
+
+测试端口流量统计等系统监控功能（外部命令通过 mock 模拟）。
+"""
+
+import time
+import threading
+import pytest
+from unittest.mock import Mock, patch
+
+from src.proxy_relay.system_monitor import (
+    NetworkStats,
+    SystemMonitor,
+    _parse_iptables_counters,
+    _parse_ipset_counters,
+)
+
+
+IPTABLES_SAVE_OUTPUT = """# Generated by iptables-save v1.8.7 on Mon Jan  1 00:00:00 2024
+*raw
+:PREROUTING ACCEPT [1000:200000]
+:OUTPUT ACCEPT [900:150000]
+[10:1500] -A PREROUTING -p tcp -m tcp --dport 1080
+[20:2500] -A PREROUTING -p tcp -m tcp --dport 10800
+[30:3500] -A OUTPUT -p tcp -m tcp --sport 1080
+[40:4500] -A OUTPUT -p tcp -m tcp --sport 1081
+[50:5500] -A OUTPUT -p tcp -m tcp --dport 1081
+COMMIT
+# Completed on Mon Jan  1 00:00:00 2024
+"""
+
+IPSET_SAVE_OUTPUT = """create relay_ports_in bitmap:port range 0-65535 counters
+add relay_ports_in 1080 packets 10 bytes 1500
+add relay_ports_in 1081 packets 0 bytes 0
+create relay_ports_out bitmap:port range 0-65535 counters
+add relay_ports_out 1080 packets 30 bytes 3500
+create other hash:ip
+add other 10.0.0.1
+"""
+
+
+@pytest.fixture
+def system_monitor():
+    """创建系统监控实例"""
+    return SystemMonitor()
+
+
+def test_parse_iptables_counters():
+    """测试从 iptables-save -c 输出中提取端口流量计数"""
+    counters = _parse_iptables_counters(IPTABLES_SAVE_OUTPUT)
+    
+    assert counters[1080] == (3500, 1500)
+    assert counters[10800] == (0, 2500)
+    # OUTPUT 链中匹配目标端口的规则不计入
+    assert counters[1081] == (4500, 0)
+
+
+def test_collect_port_traffic_reads_all_ports_once(system_monitor):
+    """测试一次 iptables-save 调用采集所有端口的流量"""
+    result = Mock(returncode=0, stdout=IPTABLES_SAVE_OUTPUT, stderr="")
+    
+    with patch('src.proxy_relay.system_monitor.subprocess.run', return_value=result) as mock_run:
+        system_monitor.collect_port_traffic([1080, 1081, 1082])
+        assert mock_run.call_count == 1
+        
+        # 第二次采集计算增量
+        result.stdout = IPTABLES_SAVE_OUTPUT.replace("[10:1500]", "[15:2000]")
+        traffic = system_monitor.collect_port_traffic([1080, 1081, 1082])
+        assert mock_run.call_count == 2
+    
+    assert traffic[1080]['delta_recv'] == 500
+    assert traffic[1080]['delta_sent'] == 0
+    assert traffic[1082] == {'bytes_sent': 0, 'bytes_recv': 0, 'delta_sent': 0, 'delta_recv': 0}
+
+
+def test_collect_port_traffic_handles_idle_and_reset_counters(system_monitor):
+    """测试计数器从 0 开始增长和被清零时的增量"""
+    readings = iter([(0, 0), (100, 200), (150, 260), (40, 10)])
+    
+    with patch.object(system_monitor, '_read_iptables_counters', side_effect=lambda: {1080: next(readings)}):
+        deltas = [system_monitor.collect_port_traffic([1080])[1080] for _ in range(4)]
+    
+    # 首次采集只记录基准值；上次为 0 的端口不丢失流量
+    assert (deltas[0]['delta_sent'], deltas[0]['delta_recv']) == (0, 0)
+    assert (deltas[1]['delta_sent'], deltas[1]['delta_recv']) == (100, 200)
+    assert (deltas[2]['delta_sent'], deltas[2]['delta_recv']) == (50, 60)
+    # 计数器被清零后，当前值即为增量
+    assert (deltas[3]['delta_sent'], deltas[3]['delta_recv']) == (40, 10)
+    assert (deltas[3]['bytes_sent'], deltas[3]['bytes_recv']) == (190, 270)
+
+
+def test_collect_port_traffic_skips_missing_readings(system_monitor):
+    """测试某轮读取失败或端口缺失时不重置基准值，下一轮增量不重复计入累计值"""
+    readings = iter([{1080: (1000, 5000)}, None, {}, {1080: (1100, 5100)}])
+    
+    with patch.object(system_monitor, '_read_iptables_counters', side_effect=lambda: next(readings)), \
+            patch.object(system_monitor, '_read_port_counters', return_value=None):
+        deltas = [system_monitor.collect_port_traffic([1080])[1080] for _ in range(4)]
+    
+    assert [(d['delta_sent'], d['delta_recv']) for d in deltas] == [(0, 0), (0, 0), (0, 0), (100, 100)]
+    assert (deltas[3]['bytes_sent'], deltas[3]['bytes_recv']) == (100, 100)
+
+
+def test_collect_port_traffic_ipset_failure_has_no_data(system_monitor):
+    """测试使用 ipset 时 ipset save 失败不回退到 iptables 规则解析"""
+    system_monitor._ipset_initialized = True
+    readings = iter([{1080: (1000, 5000)}, None, {1080: (1100, 5100)}])
+    
+    with patch.object(system_monitor, '_read_ipset_counters', side_effect=lambda: next(readings)), \
+            patch.object(system_monitor, '_read_iptables_counters') as mock_iptables, \
+            patch.object(system_monitor, '_query_port_traffic') as mock_query:
+        deltas = [system_monitor.collect_port_traffic([1080])[1080] for _ in range(3)]
+    
+    mock_iptables.assert_not_called()
+    mock_query.assert_not_called()
+    assert (deltas[2]['delta_sent'], deltas[2]['delta_recv']) == (100, 100)
+
+
+def test_collect_port_traffic_falls_back_per_port(system_monitor):
+    """测试 iptables-save 不可用时并发地逐个端口查询"""
+    with patch('src.proxy_relay.system_monitor.subprocess.run',
+               return_value=Mock(returncode=1, stdout="", stderr="not found")), \
+            patch.object(system_monitor, '_read_port_counters',
+                         side_effect=lambda port: (port, port * 2)) as mock_port:
+        system_monitor.collect_port_traffic([1080, 1081])
+        traffic = system_monitor.collect_port_traffic([1080, 1081])
+    
+    assert mock_port.call_count == 4
+    # 各端口的查询结果按端口归位
+    assert system_monitor._port_traffic[1081].last_bytes_sent == 1081
+    assert system_monitor._port_traffic[1081].last_bytes_recv == 2162
+    assert traffic[1080]['delta_sent'] == 0
+
+
+def test_parse_ipset_counters():
+    """测试从 ipset save 输出中提取端口流量计数"""
+    counters = _parse_ipset_counters(IPSET_SAVE_OUTPUT)
+    
+    assert counters == {1080: (3500, 1500), 1081: (0, 0)}
+
+
+def test_init_port_traffic_rules_uses_ipset(system_monitor):
+    """测试 ipset 可用时只安装两条引用集合的 iptables 规则"""
+    with patch('src.proxy_relay.system_monitor.subprocess.run',
+               return_value=Mock(returncode=0, stdout="", stderr="")) as mock_run:
+        assert system_monitor.init_port_traffic_rules([1080, 1081, 1082]) is True
+    
+    commands = [call.args[0] for call in mock_run.call_args_list]
+    iptables_rules = [cmd for cmd in commands if cmd[1] == "iptables"]
+    # 两条规则均已存在（-C 成功），不再追加
+    assert len(iptables_rules) == 2
+    assert all("--match-set" in cmd for cmd in iptables_rules)
+    # 等待 xtables 锁而不是因并发调用失败
+    assert all(cmd[2:4] == ["-w", "2"] for cmd in iptables_rules)
+    # 集合和端口通过一次 ipset restore 创建
+    ipset_calls = [call for call in mock_run.call_args_list if call.args[0][1] == "ipset"]
+    assert len(ipset_calls) == 1
+    assert ipset_calls[0].args[0] == ["sudo", "ipset", "restore", "-exist"]
+    assert "add relay_ports_in 1082\n" in ipset_calls[0].kwargs['input']
+    
+    with patch('src.proxy_relay.system_monitor.subprocess.run',
+               return_value=Mock(returncode=0, stdout=IPSET_SAVE_OUTPUT, stderr="")) as mock_run:
+        system_monitor.collect_port_traffic([1080])
+    
+    assert mock_run.call_args.args[0] == ["sudo", "ipset", "save"]
+
+
+def test_init_port_traffic_rules_falls_back_without_ipset(system_monitor):
+    """测试 ipset 不可用时回退为每个端口一对 raw 表计数规则"""
+    def fake_run(cmd, **kwargs):
+        if cmd[1] == "ipset":
+            raise FileNotFoundError("ipset")
+        return Mock(returncode=0, stdout="", stderr="")
+    
+    with patch('src.proxy_relay.system_monitor.subprocess.run', side_effect=fake_run) as mock_run:
+        assert system_monitor.init_port_traffic_rules([1080, 1081]) is True
+    
+    restore_calls = [call for call in mock_run.call_args_list if call.args[0][1] == "iptables-restore"]
+    assert len(restore_calls) == 1
+    assert restore_calls[0].args[0] == ["sudo", "iptables-restore", "-w", "2", "--noflush"]
+    # 只计数的规则放在 raw 表中，不带 -j 目标
+    assert restore_calls[0].kwargs['input'] == (
+        "*raw\n"
+        "-I PREROUTING -p tcp --dport 1080\n"
+        "-I OUTPUT -p tcp --sport 1080\n"
+        "-I PREROUTING -p tcp --dport 1081\n"
+        "-I OUTPUT -p tcp --sport 1081\n"
+        "COMMIT\n"
+    )
+    assert system_monitor._ipset_initialized is False
+
+
+def test_init_port_traffic_rules_falls_back_when_ipset_rule_fails(system_monitor):
+    """测试引用集合的 iptables 规则插入失败时回退为每个端口的计数规则"""
+    def fake_run(cmd, **kwargs):
+        if cmd[1] == "iptables" and ("-C" in cmd or "-I" in cmd):
+            return Mock(returncode=1, stdout="", stderr="Couldn't load match `set'")
+        return Mock(returncode=0, stdout="", stderr="")
+    
+    with patch('src.proxy_relay.system_monitor.subprocess.run', side_effect=fake_run) as mock_run:
+        assert system_monitor.init_port_traffic_rules([1080]) is True
+    
+    commands = [call.args[0] for call in mock_run.call_args_list]
+    # 第一条规则插入失败后不再尝试第二条
+    assert sum(1 for cmd in commands if cmd[1] == "iptables" and "-I" in cmd) == 1
+    assert any(cmd[1] == "iptables-restore" for cmd in commands)
+    assert system_monitor._ipset_initialized is False
+
+
+PROC_NET_TCP = """  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:0438 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1001 1 0000000000000000 100 0 0 10 0
+   1: 0100007F:0438 0100007F:C350 01 00000000:00000000 00:00000000 00000000     0        0 1002 1 0000000000000000 20 4 30 10 -1
+   2: 0100007F:C350 0100007F:0438 01 00000000:00000000 00:00000000 00000000     0        0 1003 1 0000000000000000 20 4 30 10 -1
+   3: 0A000001:0439 0A000002:01BB 06 00000000:00000000 00:00000000 00000000     0        0 0 3 0000000000000000
+"""
+
+PROC_NET_TCP6 = """  sl  local_address                         remote_address                        st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000000000000000000001000000:0439 00000000000000000000000001000000:D431 01 00000000:00000000 00:00000000 00000000     0        0 2001 1 0000000000000000 20 4 30 10 -1
+"""
+
+
+def test_get_port_connections_reads_proc_net_tcp(system_monitor, tmp_path, monkeypatch):
+    """测试从 /proc/net/tcp(6) 统计各端口的 ESTABLISHED 连接数"""
+    tcp = tmp_path / "tcp"
+    tcp.write_text(PROC_NET_TCP)
+    tcp6 = tmp_path / "tcp6"
+    tcp6.write_text(PROC_NET_TCP6)
+    monkeypatch.setattr('src.proxy_relay.system_monitor._PROC_NET_TCP', (str(tcp), str(tcp6)))
+    
+    with patch('src.proxy_relay.system_monitor.subprocess.run') as mock_run:
+        connections = system_monitor.get_port_connections([1080, 1081, 1082])
+        total = system_monitor.get_connection_count()
+    
+    mock_run.assert_not_called()
+    # 监听和 TIME_WAIT 状态的连接不计入；本地回环连接的两端都计入 1080
+    assert connections == {1080: 2, 1081: 1, 1082: 0}
+    assert total == 3
+    
+    # 未启用 IPv6 时只读取 tcp
+    monkeypatch.setattr('src.proxy_relay.system_monitor._PROC_NET_TCP', (str(tcp), str(tmp_path / "missing")))
+    assert system_monitor.get_connection_count(1080) == 2
+
+
+def test_get_system_metrics_reads_network_stats_once(system_monitor):
+    """测试一次系统指标采集只读取一次网卡统计"""
+    stats = NetworkStats(bytes_sent=2048, bytes_recv=4096)
+    
+    with patch.object(system_monitor, 'get_network_stats', return_value=stats) as mock_stats, \
+            patch.object(system_monitor, 'get_connection_count', return_value=3):
+        metrics = system_monitor.get_system_metrics()
+        assert mock_stats.call_count == 1
+        
+        # 缓存过期后重新读取
+        system_monitor._stats_cache = (time.monotonic() - 1, stats)
+        system_monitor.get_system_metrics()
+        assert mock_stats.call_count == 2
+    
+    assert metrics['network']['bytes_sent'] == 2048
+    assert metrics['connections']['total'] == 3
+
+
+PROC_NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:  123456     100    0    0    0     0          0         0   123456     100    0    0    0     0       0          0
+  eth0: 1000 10    0    0    0     0          0         0 2000 20    0    0    0     0       0          0
+br-1a2b:12345678901   30    0    0    0     0          0         0      500       5    0    0    0     0       0          0
+"""
+
+
+def test_get_network_stats_parses_proc_net_dev(system_monitor, tmp_path, monkeypatch):
+    """测试解析 /proc/net/dev，跳过 lo 接口"""
+    dev = tmp_path / "dev"
+    dev.write_text(PROC_NET_DEV)
+    monkeypatch.setattr('src.proxy_relay.system_monitor._PROC_NET_DEV', str(dev))
+    
+    stats = system_monitor.get_network_stats()
+    
+    # 接口名含 "-"、字节数紧跟冒号的行也能正确解析
+    assert stats.bytes_recv == 1000 + 12345678901
+    assert stats.packets_recv == 40
+    assert stats.bytes_sent == 2500
+    assert stats.packets_sent == 25
+
+
+def test_request_traffic_collection_wakes_collector(system_monitor):
+    """测试请求立即采集时不必等待采集间隔"""
+    collected = []
+    
+    def fake_collect(ports):
+        collected.append(time.monotonic())
+        return {}
+    
+    with patch.object(system_monitor, 'collect_port_traffic', side_effect=fake_collect):
+        system_monitor.start_traffic_collector([1080], interval=60)
+        deadline = time.monotonic() + 2
+        while not collected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        system_monitor.request_traffic_collection()
+        while len(collected) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        started = time.monotonic()
+        system_monitor.stop_traffic_collector()
+    
+    assert len(collected) == 2
+    assert time.monotonic() - started < 1
+    assert not system_monitor._traffic_collector_thread.is_alive()
+
+
+def test_stop_traffic_collector_not_lost_by_wakeup_clear(system_monitor):
+    """测试停止请求恰好在清除唤醒标记之前到达时，采集线程不会等待整个采集间隔"""
+    stop_event = system_monitor._stop_event
+    
+    class RacingEvent(threading.Event):
+        def clear(self):
+            # 模拟 stop_traffic_collector() 在循环检查之后、clear() 之前执行
+            stop_event.set()
+            self.set()
+            super().clear()
+    
+    system_monitor._wakeup_event = RacingEvent()
+    with patch.object(system_monitor, 'collect_port_traffic', return_value={}):
+        system_monitor._stop_event.clear()
+        system_monitor._traffic_collector_thread = threading.Thread(
+            target=system_monitor._traffic_collector_loop,
+            args=([1080], 60),
+            daemon=True
+        )
+        system_monitor._traffic_collector_thread.start()
+        system_monitor._traffic_collector_thread.join(timeout=1)
+    
+    assert not system_monitor._traffic_collector_thread.is_alive()
+
+
+def test_format_bytes_units():
+    """测试字节数格式化的单位边界"""
+    assert SystemMonitor._format_bytes(1023.4) == "1023 B"
+    assert SystemMonitor._format_bytes(1024) == "1.0 KB"
+    assert SystemMonitor._format_bytes(1024 * 1024 - 1) == "1024.0 KB"
+    assert SystemMonitor._format_bytes(1.5 * 1024 * 1024) == "1.50 MB"
+    assert SystemMonitor._format_bytes(3 * 1024 ** 3) == "3.00 GB"
+    # 超过 GB 的仍以 GB 显示
+    assert SystemMonitor._format_bytes(2 * 1024 ** 4) == "2048.00 GB"
@@ -43,6 +43,20 @@ class TestUpstreamProxyPool:
         assert upstream_pool.proxy.port == 1080
         assert upstream_pool.tags == ["测试", "美国"]
     
+    def test_upstream_proxy_hash_and_equality(self):
+        """测试上游代理不可修改，且可按配置内容比较和作为字典键"""
+        proxy = UpstreamProxy(server="proxy.example.com", port=1080, alpn=["h2"])
+        same = UpstreamProxy(server="proxy.example.com", port=1080, alpn=["h2"])
+        other = UpstreamProxy(server="proxy.example.com", port=1081, alpn=["h2"])
+        
+        assert proxy == same
+        assert hash(proxy) == hash(same)
+        assert proxy != other
+        assert {proxy: "cached"}[same] == "cached"
+        
+        with pytest.raises(AttributeError):
+            proxy.port = 1081
+    
     def test_create_vless_upstream_proxy_pool(self):
         """测试创建 VLESS 出口代理池"""
         proxy = UpstreamProxy(
@@ -285,7 +299,7 @@ class TestUpstreamProxyPool:
         )
         
         # 应该抛出验证错误
-        with pytest.raises(ValueError, match="duplicate id found in upstream_proxies"):
+        with pytest.raises(ValueError, match="duplicate id found in upstream_proxies: upstream-001"):
             Config(
                 system=SystemConfig(
                     web_port=8080,
@@ -55,6 +55,42 @@ class TestVLESSParser:
         
         assert proxy.flow == "xtls-rprx-vision"
     
+    def test_parse_vless_url_encoded_params_and_ipv6(self):
+        """测试解析 IPv6 地址、带路径分隔符和 URL 编码参数的 VLESS URL"""
+        url = ("vless://550e8400-e29b-41d4-a716-446655440000@[2001:DB8::1]:8443/"
+               "?type=ws&path=%2Fws%3Fed%3D2048&path=/other&host=&security=tls#My%20Node")
+        proxy = VLESSParser.parse_vless_url(url)
+        
+        assert proxy.server == "2001:db8::1"
+        assert proxy.port == 8443
+        # 同名参数取第一个，空值视为未设置
+        assert proxy.ws_path == "/ws?ed=2048"
+        assert proxy.ws_host is None
+        assert proxy.tls is True
+    
+    def test_parse_vless_url_ignores_unrelated_params(self):
+        """测试只读取与 security/type 对应的参数"""
+        url = ("vless://550e8400-e29b-41d4-a716-446655440000@example.com:443"
+               "?security=tls&pbk=key&sid=01&fp=chrome&type=grpc&serviceName=svc&path=/ws")
+        proxy = VLESSParser.parse_vless_url(url)
+        
+        assert proxy.reality is False
+        assert proxy.reality_public_key is None
+        assert proxy.reality_fingerprint is None
+        assert proxy.grpc_service_name == "svc"
+        assert proxy.ws_path is None
+        
+        proxy = VLESSParser.parse_vless_url(url.replace("security=tls", "security=reality&sni=a.com"))
+        assert proxy.reality is True
+        assert proxy.reality_public_key == "key"
+        assert proxy.reality_short_id == "01"
+        assert proxy.reality_server_name == "a.com"
+    
+    def test_parse_vless_url_invalid_port(self):
+        """测试解析端口超出范围的 URL"""
+        with pytest.raises(VLESSParseError):
+            VLESSParser.parse_vless_url("vless://550e8400-e29b-41d4-a716-446655440000@example.com:99999")
+    
     def test_parse_vless_url_invalid_format(self):
         """测试解析无效格式的 URL"""
         with pytest.raises(VLESSParseError):
@@ -5,15 +5,19 @@ Web API 基础测试
 """
 
 import pytest
+import asyncio
 import tempfile
+import threading
+import time
 import os
+from unittest.mock import Mock
 from fastapi.testclient import TestClient
 
 from src.proxy_relay.config_manager import ConfigManager
 from src.proxy_relay.proxy_manager import ProxyManager
 from src.proxy_relay.health_monitor import HealthMonitor
 from src.proxy_relay.database import Database
-from src.proxy_relay.web_api import create_app
+from src.proxy_relay.web_api import WebAPI, create_app, _build_upstream_proxy, _serialize_proxy, UpstreamProxyModel
 from src.proxy_relay.models import (
     Config,
     SystemConfig,
@@ -23,6 +27,7 @@ from src.proxy_relay.models import (
     UpstreamProxy,
     WebAuthConfig,
     ResponseFormat,
+    MonitoringStatus,
 )
 
 
@@ -153,6 +158,159 @@ def test_get_proxy_not_found(client):
     assert response.status_code == 404
 
 
+def test_create_proxy_invalid_protocol(client):
+    """测试创建代理时在请求校验阶段拒绝无效协议"""
+    response = client.post("/api/proxies", json={
+        "local_port": 10801,
+        "name": "Bad Proxy",
+        "upstream": {
+            "server": "proxy.example.com",
+            "port": 10000,
+            "protocol": "ftp"
+        }
+    })
+    assert response.status_code == 422
+
+
+def test_create_and_update_proxy(app_components):
+    """测试创建代理返回 201 且不回显密码，更新后返回最新配置"""
+    config_manager, proxy_manager, health_monitor, database = app_components
+    proxy_manager.apply_singbox_config = Mock(return_value=True)
+    client = TestClient(create_app(config_manager, proxy_manager, health_monitor, database))
+    
+    response = client.post("/api/proxies", json={
+        "local_port": 10802,
+        "name": "New Proxy",
+        "upstream": {
+            "server": "proxy.example.com",
+            "port": 10000,
+            "username": "user",
+            "password": "pass",
+            "protocol": "socks5"
+        }
+    })
+    assert response.status_code == 201
+    data = response.json()
+    assert data["local_port"] == 10802
+    assert data["upstream"]["password"] == "***"
+    
+    response = client.put("/api/proxies/10802", json={"name": "Renamed"})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Renamed"
+    assert proxy_manager.apply_singbox_config.call_count == 2
+
+
+def test_build_upstream_proxy_copies_all_fields():
+    """测试由请求模型构建上游代理时保留 Reality/传输层字段并补全默认值"""
+    model = UpstreamProxyModel(
+        server="vless.example.com",
+        port=443,
+        protocol="vless",
+        uuid="550e8400-e29b-41d4-a716-446655440000",
+        encryption=None,
+        network="grpc",
+        tls=True,
+        sni="www.example.com",
+        reality=True,
+        reality_public_key="pubkey",
+        reality_short_id="01ab",
+        reality_fingerprint="chrome",
+        grpc_service_name="svc"
+    )
+    
+    upstream = _build_upstream_proxy(model)
+    
+    assert isinstance(upstream, UpstreamProxy)
+    assert upstream.encryption == "none"
+    assert upstream.reality is True
+    assert upstream.reality_public_key == "pubkey"
+    assert upstream.reality_short_id == "01ab"
+    assert upstream.reality_fingerprint == "chrome"
+    assert upstream.grpc_service_name == "svc"
+
+
+def test_serialize_proxy():
+    """测试代理配置序列化及密码遮蔽"""
+    proxy = ProxyConfig(
+        local_port=10801,
+        name="Serialized",
+        upstream=UpstreamProxy(server="proxy.example.com", port=10000, username="u", password="p"),
+        local_username="local",
+        local_password="secret"
+    )
+    status = MonitoringStatus(local_port=10801, enabled=True, failure_count=2)
+    
+    data = _serialize_proxy(proxy, status)
+    assert data["upstream"] == {
+        "server": "proxy.example.com",
+        "port": 10000,
+        "username": "u",
+        "password": "p",
+        "protocol": "socks5"
+    }
+    assert data["monitoring_status"]["failure_count"] == 2
+    assert data["monitoring_status"]["last_check_time"] is None
+    assert data["local_password"] == "secret"
+    
+    masked = _serialize_proxy(proxy, mask_passwords=True)
+    assert masked["upstream"]["password"] == "***"
+    assert masked["local_password"] == "***"
+    assert masked["monitoring_status"] is None
+    
+    proxy.upstream = None
+    assert _serialize_proxy(proxy)["upstream"] is None
+
+
+def test_schedule_apply_coalesces_concurrent_writes(app_components):
+    """测试并发写操作只应用一次 sing-box 配置，失败时所有请求都收到异常"""
+    config_manager, proxy_manager, health_monitor, database = app_components
+    apply_threads = []
+    proxy_manager.apply_singbox_config = Mock(
+        side_effect=lambda: apply_threads.append(threading.current_thread()) or True
+    )
+    web_api = WebAPI(config_manager, proxy_manager, health_monitor, database)
+    
+    async def burst():
+        return await asyncio.gather(
+            *(web_api._schedule_apply() for _ in range(20)),
+            return_exceptions=True
+        )
+    
+    assert asyncio.run(burst()) == [None] * 20
+    assert proxy_manager.apply_singbox_config.call_count == 1
+    # 配置在工作线程中应用，不阻塞事件循环
+    assert apply_threads[0] is not threading.main_thread()
+    
+    proxy_manager.apply_singbox_config.side_effect = RuntimeError("reload failed")
+    results = asyncio.run(burst())
+    assert proxy_manager.apply_singbox_config.call_count == 2
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert web_api._pending_apply is None
+
+
+def test_schedule_apply_survives_cancelled_leader(app_components):
+    """测试取消创建批次的请求时，本批次仍然应用，其他请求正常返回"""
+    config_manager, proxy_manager, health_monitor, database = app_components
+    proxy_manager.apply_singbox_config = Mock(side_effect=lambda: time.sleep(0.05) or True)
+    web_api = WebAPI(config_manager, proxy_manager, health_monitor, database)
+    
+    async def cancel_leader(delay):
+        leader = asyncio.create_task(web_api._schedule_apply())
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(web_api._schedule_apply()) for _ in range(3)]
+        await asyncio.sleep(delay)
+        leader.cancel()
+        results = await asyncio.gather(*followers, return_exceptions=True)
+        return leader, results
+    
+    # 分别在等待合并期间和应用配置期间取消
+    for delay, calls in ((0.01, 1), (web_api.APPLY_DEBOUNCE + 0.02, 2)):
+        leader, results = asyncio.run(cancel_leader(delay))
+        assert leader.cancelled()
+        assert results == [None] * 3
+        assert proxy_manager.apply_singbox_config.call_count == calls
+
+
 def test_get_system_status(client):
     """测试获取系统状态"""
     response = client.get("/api/system/status")
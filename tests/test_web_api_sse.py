@@ -7,9 +7,9 @@ Web API SSE (Server-Sent Events) 测试
 import pytest
 import asyncio
 import json
+import time
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch, MagicMock
-from datetime import datetime
 
 from src.proxy_relay.web_api import create_app
 from src.proxy_relay.config_manager import ConfigManager
@@ -122,8 +122,8 @@ def mock_health_monitor():
             local_port=1080,
             enabled=True,
             failure_count=0,
-            last_check_time=datetime.now(),
-            last_success_time=datetime.now(),
+            last_check_time_ns=time.time_ns(),
+            last_success_time_ns=time.time_ns(),
             current_upstream=UpstreamProxy(
                 server="proxy1.example.com",
                 port=10000,
@@ -134,8 +134,8 @@ def mock_health_monitor():
             local_port=1081,
             enabled=False,
             failure_count=0,
-            last_check_time=None,
-            last_success_time=None,
+            last_check_time_ns=None,
+            last_success_time_ns=None,
             current_upstream=UpstreamProxy(
                 server="proxy2.example.com",
                 port=10001,